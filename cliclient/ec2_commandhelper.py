@@ -12,12 +12,14 @@ import pprint
 import prettytable
 import textwrap
 import orcalib.aws_service as aws_service
+import orcalib.normalize as normalize
 import orcalib.utils as orcautils
-from collections import defaultdict
+from orcalib.secgroup_graph import SecurityGroupGraph
 
 
 class EC2CommandHandler(object):
-    def __init__(self):
+    def __init__(self, cache=None):
+        self.cache = cache
         print("EC2command handler")
 
     def display_ec2_summary_table(self, vm_summary):
@@ -34,38 +36,24 @@ class EC2CommandHandler(object):
         :param format:  The output format to display.
 
         '''
-        service_client = aws_service.AwsService('ec2')
-        vmlist = service_client.service.list_vms()
+        # Imported here, the other commands do not need numpy.
+        from orcalib.inventory_table import InventoryTable
 
-        # Defaults in case they are not set
-        instance_type = 'None'
-        vpc_id = 'None'
-        zone = 'None'
+        service_client = aws_service.AwsService('ec2', cache=self.cache)
+        vmlist = service_client.service.list_vms()
+        inventory = InventoryTable(normalize.instance_records(vmlist),
+                                   ['InstanceType', 'VpcId',
+                                    'Placement.AvailabilityZone'])
 
-        type_count = defaultdict(int)
-        vpc_count = defaultdict(int)
-        zone_count = defaultdict(int)
+        type_count = inventory.group_count('InstanceType')
+        vpc_count = inventory.group_count('VpcId')
+        zone_count = inventory.group_count('Placement.AvailabilityZone')
 
         # # Setup table
         header = ["Resource", "Count"]
 
         table = prettytable.PrettyTable(header)
 
-        for vm in vmlist:
-            for i in range(len(vm['Instances'])):
-
-                # if 'InstanceType' in vm['Instances'][i]:
-                instance_type = vm['Instances'][i]['InstanceType']
-                type_count[instance_type] += 1
-
-                if 'VpcId' in vm['Instances'][i]:
-                    vpc_id = vm['Instances'][i]['VpcId']
-                    vpc_count[vpc_id] += 1
-
-                if 'Placement' in vm['Instances'][i]:
-                    zone = vm['Instances'][i]['Placement']['AvailabilityZone']
-                    zone_count[zone] += 1
-
         for itype in type_count:
             row = [itype, type_count[itype]]
             table.add_row(row)
@@ -147,7 +135,7 @@ class EC2CommandHandler(object):
         '''
         Display the List of EC2 buckets
         '''
-        service_client = aws_service.AwsService('ec2')
+        service_client = aws_service.AwsService('ec2', cache=self.cache)
         vmlist = service_client.service.list_vms()
 
         if outputformat == "json":
@@ -192,7 +180,7 @@ class EC2CommandHandler(object):
         '''
         Display Tags for all EC2 Resources
         '''
-        ec2_client = aws_service.AwsService('ec2')
+        ec2_client = aws_service.AwsService('ec2', cache=self.cache)
         tagsobj = ec2_client.service.list_tags()
 
         if filter is not None:
@@ -274,55 +262,22 @@ class EC2CommandHandler(object):
         '''
         Display security groups
         '''
-        ec2_client = aws_service.AwsService('ec2')
-        elb_client = aws_service.AwsService('elb')
+        ec2_client = aws_service.AwsService('ec2', cache=self.cache)
+        elb_client = aws_service.AwsService('elb', cache=self.cache)
         vmlist = ec2_client.service.list_vms()
         elbs = elb_client.service.list_elbs()
         nw_interfaces = ec2_client.service.list_network_interfaces()
         secgroups = ec2_client.service.list_security_groups(dict_type=True)
 
+        graph = SecurityGroupGraph(secgroups, vms=vmlist, elbs=elbs,
+                                   nw_interfaces=nw_interfaces)
+
         if filter is not None:
             secgroups = orcautils.filter_dict(secgroups,
                                               filter,
                                               aggr_and=aggr_and)
 
-        for vm in vmlist:
-            for instance in vm['Instances']:
-                instance_id = instance['InstanceId']
-                vm_secgroups = instance['SecurityGroups']
-                for vm_secgroup in vm_secgroups.keys():
-                    #group_id = vm_secgroup['GroupId']
-                    group_id = vm_secgroup
-                    if group_id not in secgroups.keys():
-                        continue
-                    if secgroups[group_id].get('vm_list', None) is None:
-                        secgroups[group_id]['vm_list'] = []
-
-                    secgroups[group_id]['vm_list'].append(instance_id)
-
-        for elb in elbs:
-            elb_name = elb['LoadBalancerName']
-            elb_secgroups = elb['SecurityGroups']
-            for elb_secgroup in elb_secgroups:
-                if elb_secgroup not in secgroups.keys():
-                    continue
-                if secgroups[elb_secgroup].get('elb_list', None) is None:
-                    secgroups[elb_secgroup]['elb_list'] = []
-
-                secgroups[elb_secgroup]['elb_list'].append(elb_name)
-
-        for nwintf in nw_interfaces:
-            nwintf_id = nwintf['NetworkInterfaceId']
-            nwintf_secgroups = nwintf['Groups']
-            for nwintf_secgroup in nwintf_secgroups:
-                group_id = nwintf_secgroup['GroupId']
-                if group_id not in secgroups.keys():
-                    continue
-
-                if secgroups[group_id].get('nwintf_list', None) is None:
-                    secgroups[group_id]['nwintf_list'] = []
-
-                secgroups[group_id]['nwintf_list'].append(nwintf_id)
+        secgroups = graph.get_group_view(secgroups.keys())
 
         if outputformat == "json":
             pprinter = pprint.PrettyPrinter()
@@ -365,7 +320,7 @@ class EC2CommandHandler(object):
         '''
         Display network interfaces
         '''
-        ec2_client = aws_service.AwsService('ec2')
+        ec2_client = aws_service.AwsService('ec2', cache=self.cache)
         nw_interfaces = ec2_client.service.list_network_interfaces()
 
         if outputformat == "json":
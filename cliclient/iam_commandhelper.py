@@ -16,7 +16,8 @@ import orcalib.aws_config as aws_config
 
 
 class IAMCommandHandler(object):
-    def __init__(self):
+    def __init__(self, cache=None):
+        self.cache = cache
         print("IAM command handler")
 
     def display_iam_userlist_table(self, userlist):
@@ -70,15 +71,22 @@ class IAMCommandHandler(object):
         '''
         Display the list of users.
         '''
-        service_client = aws_service.AwsService('iam')
+        service_client = aws_service.AwsService('iam', cache=self.cache)
         userlist = service_client.service.list_users()
-        service_client.service.populate_groups_in_users(userlist)
+        # The users come back as their group memberships arrive.
+        users = service_client.service.iter_groups_in_users(userlist)
 
         if outputformat == "json":
+            # Print the whole list once every user has its groups, in the
+            # list_users order.
+            for _ in users:
+                pass
             pprinter = pprint.PrettyPrinter()
             pprinter.pprint(userlist)
         else:
-            self.display_iam_userlist_table(userlist)
+            # A row has a column per profile, the table is printed once
+            # all the users are in.
+            self.display_iam_userlist_table(users)
 
     def fillstr(self,
                 string,
@@ -135,20 +143,25 @@ class IAMCommandHandler(object):
 
         print(table)
 
-    def display_iam_user_permissions(self, user_name, outputformat='json'):
+    def display_iam_user_permissions(self, user_name, outputformat='json',
+                                     offline=False):
         '''
         Display Permissions for user
+
+        :type offline: Boolean
+        :param offline: Answer from the cached account authorization
+            details instead of the per user calls.
         '''
         awsconfig = aws_config.AwsConfig()
         profiles = awsconfig.get_profiles()
 
-        service_client = aws_service.AwsService('iam')
+        service_client = aws_service.AwsService('iam', cache=self.cache)
 
+        # Only the profiles the user exists in are looked up.
         profile_perms = {}
-        for profile in profiles:
-            permissions = service_client.service.get_user_permissions(
-                UserName=user_name, profile_name=profile)
-
+        for profile, permissions in \
+                service_client.service.iter_user_permissions(
+                    user_name, profile_names=profiles, offline=offline):
             profile_perms[profile] = permissions
             if outputformat == "json":
                 print("\n(%s: %s) " % (profile, user_name))
@@ -159,6 +172,12 @@ class IAMCommandHandler(object):
         if outputformat == "table":
             self.display_iam_user_permissions_table(user_name,
                                                     profile_perms)
+            if offline:
+                return
+            # The policy documents are shared by all the profiles' lookups.
+            policy_cache = service_client.service.policy_cache
+            print("Policy documents: %d fetched, %d from cache" % \
+                (policy_cache.misses, policy_cache.hits))
 
     def display_iam_user_policies_table(self,
                                         user_name,
@@ -191,7 +210,8 @@ class IAMCommandHandler(object):
 
     def display_iam_user_policies(self,
                                   user_name,
-                                  outputformat='json'):
+                                  outputformat='json',
+                                  offline=False):
         '''
         Display policies attached to the user.
         '''
@@ -199,14 +219,12 @@ class IAMCommandHandler(object):
         awsconfig = aws_config.AwsConfig()
         profiles = awsconfig.get_profiles()
 
-        service_client = aws_service.AwsService('iam')
+        service_client = aws_service.AwsService('iam', cache=self.cache)
 
-        policyinfo = {}
-        for profile in profiles:
-            policyinfo[profile] = []
-            policies = service_client.service.get_user_attached_policies(
-                UserName=user_name,
-                profile_name=profile)
+        policyinfo = dict((profile, None) for profile in profiles)
+        for profile, policies in \
+                service_client.service.iter_user_attached_policies(
+                    user_name, profile_names=profiles, offline=offline):
             policyinfo[profile] = policies
 
         if outputformat == "json":
@@ -217,4 +235,28 @@ class IAMCommandHandler(object):
             self.display_iam_user_policies_table(user_name,
                                                  policyinfo)
 
+    def display_iam_who_can(self,
+                            action,
+                            resource=None,
+                            outputformat='json'):
+        '''
+        Display the users and roles allowed to perform an action (on a
+        resource), in every profile.
+        '''
+        service_client = aws_service.AwsService('iam', cache=self.cache)
+        indexes = service_client.service.build_statement_indexes()
+
+        whocan = {}
+        for profile, index in indexes.items():
+            whocan[profile] = index.who_can(action, resource=resource)
 
+        if outputformat == "table":
+            table = prettytable.PrettyTable(["Profile", "Type", "Name"])
+            table.align["Name"] = "l"
+            for profile, principals in whocan.items():
+                for principal_type, name in principals:
+                    table.add_row([profile, principal_type, name])
+            print(table)
+        else:
+            pprinter = pprint.PrettyPrinter()
+            pprinter.pprint(whocan)
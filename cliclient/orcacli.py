@@ -12,6 +12,7 @@ import argparse
 import pprint
 import prettytable
 import orcalib.aws_config as aws_config
+from orcalib.inventory_cache import InventoryCache
 from cliclient.ec2_commandhelper import EC2CommandHandler
 from cliclient.s3_commandhelper import S3CommandHandler
 from cliclient.iam_commandhelper import IAMCommandHandler
@@ -68,7 +69,8 @@ class OrcaCli(object):
         Perform EC2 operations
         '''
         print("ec2 operations")
-        ec2cmdhandler = EC2CommandHandler()
+        ec2cmdhandler = EC2CommandHandler(
+            cache=InventoryCache(refresh=namespace.refresh))
 
         if namespace.summary is True:
             ec2cmdhandler.display_ec2_summary(outputformat=namespace.output)
@@ -80,7 +82,8 @@ class OrcaCli(object):
         Perform S3 operations
         '''
         print("s3 operations")
-        s3cmdhandler = S3CommandHandler()
+        s3cmdhandler = S3CommandHandler(
+            cache=InventoryCache(refresh=namespace.refresh))
 
         if namespace.summary is True:
             s3cmdhandler.display_s3_summary(outputformat=namespace.output)
@@ -92,13 +95,20 @@ class OrcaCli(object):
         Perform iam operations
         '''
         print("iam operations")
-        iam_cmdhandler = IAMCommandHandler()
+        iam_cmdhandler = IAMCommandHandler(
+            cache=InventoryCache(refresh=namespace.refresh))
 
         if namespace.list_users:
             iam_cmdhandler.display_iam_userlist(outputformat=namespace.output)
         elif namespace.list_user_permissions:
             iam_cmdhandler.display_iam_user_permissions(
                 namespace.list_user_permissions,
+                outputformat=namespace.output,
+                offline=namespace.offline)
+        elif namespace.who_can:
+            iam_cmdhandler.display_iam_who_can(
+                namespace.who_can,
+                resource=namespace.resource,
                 outputformat=namespace.output)
 
     def __parse_arguments(self):
@@ -134,6 +144,10 @@ class OrcaCli(object):
         # EC2 group
         ec2parser.add_argument("--output",
                               help="Output format {json, table}")
+        ec2parser.add_argument("--refresh",
+                               action="store_true",
+                               help="Ignore the cached inventory "
+                                    "(~/.aws/orca_cache.db)")
 
         ec2group = ec2parser.add_mutually_exclusive_group()
         ec2group.add_argument("--list-vms",
@@ -147,6 +161,10 @@ class OrcaCli(object):
         # S3 group.
         s3parser.add_argument("--output",
                               help="Output format {json, table}")
+        s3parser.add_argument("--refresh",
+                              action="store_true",
+                              help="Ignore the cached inventory "
+                                   "(~/.aws/orca_cache.db)")
 
         s3group = s3parser.add_mutually_exclusive_group()
         s3group.add_argument("--summary",
@@ -161,6 +179,17 @@ class OrcaCli(object):
         # iam group.
         iamparser.add_argument("--output",
                                help="Output format {json, table}")
+        iamparser.add_argument("--refresh",
+                               action="store_true",
+                               help="Ignore the cached inventory "
+                                    "(~/.aws/orca_cache.db)")
+        iamparser.add_argument("--offline",
+                               action="store_true",
+                               help="Answer --list-user-permissions from "
+                                    "the account authorization details "
+                                    "(cached) instead of per user calls")
+        iamparser.add_argument("--resource",
+                               help="Resource ARN for --who-can")
         iamgroup = iamparser.add_mutually_exclusive_group()
 
         iamgroup.add_argument("--list-users",
@@ -171,6 +200,11 @@ class OrcaCli(object):
                               dest="list_user_permissions",
                               help="List permission for specific user")
 
+        iamgroup.add_argument("--who-can",
+                              dest="who_can",
+                              help="List users and roles allowed an action "
+                                   "(eg: s3:DeleteObject)")
+
         namespace = parser.parse_args()
 
 
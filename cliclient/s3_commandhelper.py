@@ -13,11 +13,13 @@ import pprint
 import prettytable
 import textwrap
 import orcalib.aws_service as aws_service
+import orcalib.s3_service as s3_service
 import orcalib.utils as orcautils
 
 
 class S3CommandHandler(object):
-    def __init__(self):
+    def __init__(self, cache=None):
+        self.cache = cache
         print("S3command handler")
 
     def display_s3_summary_table(self, bucket_summary):
@@ -65,7 +67,7 @@ class S3CommandHandler(object):
         :param format:  The output format to display.
 
         '''
-        service_client = aws_service.AwsService('s3')
+        service_client = aws_service.AwsService('s3', cache=self.cache)
         bucketlist = service_client.service.list_buckets()
         if filter is not None:
             bucketlist = orcautils.filter_list(bucketlist,
@@ -175,13 +177,18 @@ class S3CommandHandler(object):
         '''
         Display the List of S3 buckets
         '''
-        service_client = aws_service.AwsService('s3')
+        service_client = aws_service.AwsService('s3', cache=self.cache)
         bucketlist = service_client.service.list_buckets_fast()
         newbucketlist = service_client.service.populate_bucket_fast("location",
                                                                     bucketlist)
+        # The table only shows the object statistics, don't hold on to
+        # the objects of every bucket for it. The json output lists at
+        # most DEFAULT_MAX_OBJECTS objects per bucket.
         newbucketlist = service_client.service.populate_bucket_fast(
             "objects",
-            newbucketlist)
+            newbucketlist,
+            keep_objects=(outputformat == "json"),
+            max_objects=s3_service.DEFAULT_MAX_OBJECTS)
         if filter is not None:
             newbucketlist = orcautils.filter_list(newbucketlist,
                                                   filter,
@@ -219,7 +226,7 @@ class S3CommandHandler(object):
         '''
         Display the list of S3 buckets and the validation results.
         '''
-        s3client = aws_service.AwsService('s3')
+        s3client = aws_service.AwsService('s3', cache=self.cache)
         bucketlist = s3client.service.list_buckets()
         #s3client.service.populate_bucket_tagging(bucketlist)
         #s3client.service.populate_bucket_validation(bucketlist)
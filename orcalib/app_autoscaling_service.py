@@ -1,6 +1,7 @@
-import boto3
-from aws_config import AwsConfig
-from aws_config import OrcaConfig
+from orcalib.aws_config import OrcaConfig
+from orcalib.aws_clients import build_clients
+from orcalib.inventory_cache import cached
+import orcalib.fanout as fanout
 
 
 class AwsServiceAppAutoscaling(object):
@@ -21,56 +22,37 @@ class AwsServiceAppAutoscaling(object):
 
         orca_config = OrcaConfig()
         self.regions = orca_config.get_regions()
-        self.clients = {}
-
-        if profile_names is not None:
-            for profile_name in profile_names:
-                session = boto3.Session(profile_name=profile_name)
-                self.clients[profile_name] = session.client(service)
-        elif access_key_id is not None and secret_access_key is not None:
-            self.clients['default'] = boto3.client(
-                service,
-                aws_access_key_id=access_key_id,
-                aws_secret_access_key=secret_access_key)
-        else:
-            if iam_role_discover:
-                session = boto3.Session()
-                self.clients['default'] = {}
-                for region in self.regions:
-                    self.clients['default'][region] = \
-                        session.client(service, region_name=region)
-            else:
-                awsconfig = AwsConfig()
-                profiles = awsconfig.get_profiles()
-
-                for profile in profiles:
-                    session = boto3.Session(profile_name=profile)
-                    self.clients[profile] = {}
-                    for region in self.regions:
-                        self.clients[profile][region] = \
-                            session.client(service, region_name=region)
-
+        self.max_concurrency = orca_config.get_max_concurrency()
+        self.cache = None
+        self.clients = build_clients(service,
+                                     regions=self.regions,
+                                     profile_names=profile_names,
+                                     access_key_id=access_key_id,
+                                     secret_access_key=secret_access_key,
+                                     iam_role_discover=iam_role_discover)
+
+    @cached('scaling_policies')
     def list_scaling_policies(self, service, profile_names=None, regions=None):
         """List Application scaling policies.
 
         :param service: AWS Service Namespace (ec2, etc.)
 
         """
-        scaling_policies = list()
-        for profile in self.clients.keys():
-            if profile_names is not None and profile not in profile_names:
-                continue
-            for region in self.regions:
-                if regions is not None and region not in regions:
-                    continue
-
-                client = self.clients[profile][region]
-                policies = client.describe_scaling_policies(
-                    ServiceNamespace=service)
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            self.clients[profile][region].describe_scaling_policies(
+                ServiceNamespace=service),
+            units, max_workers=self.max_concurrency)
 
-                for policy in policies['ScalingPolicies']:
-                    policy['region'] = region
-                    policy['profile_name'] = profile
-                    scaling_policies.append(policy)
+        scaling_policies = list()
+        for profile, region, policies in fanout.collect(
+                results, "List Scaling Policies"):
+            for policy in policies['ScalingPolicies']:
+                policy['region'] = region
+                policy['profile_name'] = profile
+                scaling_policies.append(policy)
 
         return scaling_policies
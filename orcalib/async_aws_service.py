@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+asyncio interface to the orcalib services.
+
+AsyncAwsService wraps AwsService and exposes the same API as coroutines:
+
+    ec2 = AsyncAwsService('ec2')
+    vmlist = await ec2.list_vms(profile_names=['prod'], timeout=30)
+
+The list_* calls that take profile_names/regions are split into one
+call per (profile, region) unit, and the units run on a bounded thread
+pool so many of them can be in flight on one event loop. Results are
+merged back in the same order the blocking API returns them. Cancelling the awaiting
+task (or hitting the timeout) cancels the units that have not started
+yet; boto3 calls already on the wire run to completion and are dropped.
+
+The iter_* APIs are async generators, each step runs off the event loop:
+
+    async for reservation in ec2.iter_vms(profile_names=['prod']):
+        ...
+'''
+
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+from orcalib.aws_service import AwsService
+import orcalib.fanout as fanout
+
+
+# APIs whose result over several profiles/regions is the concatenation
+# (list) or union (dict keyed by resource or profile) of their per unit
+# results. Only these are split into one call per unit, the others (e.g.
+# list_buckets, which merges a bucket seen in several profiles) run as
+# a single call, they already fan out internally.
+_SPLIT_METHODS = set(['list_vms',
+                      'list_reserved_vms',
+                      'list_network_interfaces',
+                      'list_images',
+                      'list_volumes',
+                      'list_snapshots',
+                      'list_security_groups',
+                      'list_tags',
+                      'list_elbs',
+                      'list_alarms',
+                      'list_launch_configurations',
+                      'list_scaling_policies',
+                      'list_users',
+                      'get_account_authorization_details',
+                      'build_account_models',
+                      'build_statement_indexes'])
+
+
+class AsyncAwsService(object):
+    '''
+    The class provides an asyncio interface on top of AwsService.
+    '''
+    def __init__(self,
+                 service,
+                 profile_names=None,
+                 access_key_id=None,
+                 secret_access_key=None,
+                 iam_role_discover=False,
+                 max_concurrency=None):
+        '''
+        Create an async service client to one or more environments.
+
+        The arguments are the same as AwsService.
+
+        :type max_concurrency: int
+        :param max_concurrency: Max number of boto3 calls in flight for
+            this service. Defaults to the service max_concurrency or
+            fanout.DEFAULT_MAX_CONCURRENCY.
+        '''
+        self.aws_service = AwsService(service,
+                                      profile_names=profile_names,
+                                      access_key_id=access_key_id,
+                                      secret_access_key=secret_access_key,
+                                      iam_role_discover=iam_role_discover)
+        self.service = getattr(self.aws_service, 'service', None)
+        if self.service is None:
+            raise ValueError("Servicename [%s] not valid" % service)
+
+        if max_concurrency is None:
+            max_concurrency = getattr(self.service, 'max_concurrency', None)
+        if max_concurrency is None:
+            max_concurrency = fanout.DEFAULT_MAX_CONCURRENCY
+        self.max_concurrency = max_concurrency
+        self._executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def close(self):
+        '''
+        Shutdown the worker threads. Calls already in flight finish.
+        '''
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_concurrency)
+        return self._executor
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the instance, route
+        # them to the wrapped service.
+        if name.startswith('_') or name in ('aws_service', 'service'):
+            raise AttributeError(name)
+
+        attr = getattr(self.service, name)
+        if not callable(attr):
+            return attr
+
+        if is_iterator_method(attr):
+            return functools.partial(self._iterate, attr)
+        return functools.partial(self._call, attr)
+
+    def _get_units(self, method, kwargs):
+        '''
+        Return the per unit kwargs to split a call into, or None if the
+        method cannot be split.
+        '''
+        if method.__name__ not in _SPLIT_METHODS:
+            return None
+
+        params = inspect.signature(method).parameters
+        if 'profile_names' not in params:
+            return None
+
+        regions = getattr(self.service, 'regions', None)
+        if 'regions' not in params:
+            regions = None
+
+        units = fanout.get_units(self.service.clients, regions,
+                                 profile_names=kwargs.get('profile_names'),
+                                 regions=kwargs.get('regions'))
+        unit_kwargs = []
+        for profile, region in units:
+            ukwargs = dict(kwargs)
+            ukwargs['profile_names'] = [profile]
+            if region is not None:
+                ukwargs['regions'] = [region]
+            unit_kwargs.append(ukwargs)
+
+        return unit_kwargs
+
+    async def _run(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(),
+            functools.partial(method, *args, **kwargs))
+
+    async def _call(self, method, *args, timeout=None, **kwargs):
+        '''
+        Run a service API off the event loop.
+
+        :type timeout: float
+        :param timeout: Seconds to wait for the whole call, across all
+            the units. asyncio.TimeoutError is raised when it expires.
+        '''
+        unit_kwargs = self._get_units(method, kwargs)
+        if unit_kwargs is None or len(unit_kwargs) <= 1:
+            coro = self._run(method, *args, **kwargs)
+        else:
+            coro = self._gather(method, args, unit_kwargs)
+
+        if timeout is None:
+            result = await coro
+        else:
+            result = await asyncio.wait_for(coro, timeout)
+
+        check_not_iterator(method, [result])
+        return result
+
+    async def _iterate(self, method, *args, **kwargs):
+        '''
+        Run an iterator API, yielding its items. Each step of the
+        iterator runs on the worker threads, not the event loop.
+        '''
+        done = object()
+        iterator = await self._run(method, *args, **kwargs)
+        try:
+            while True:
+                item = await self._run(next, iterator, done)
+                if item is done:
+                    return
+                yield item
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except ValueError:
+                    # Still running on a worker thread (cancelled).
+                    pass
+
+    async def _gather(self, method, args, unit_kwargs):
+        tasks = [asyncio.ensure_future(self._run(method, *args, **ukwargs))
+                 for ukwargs in unit_kwargs]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        check_not_iterator(method, results)
+        return merge_results(results)
+
+
+def is_iterator_method(method):
+    '''
+    Tell if a service API returns an iterator: a generator function, or
+    one of the iter_* APIs.
+    '''
+    return inspect.isgeneratorfunction(method) or \
+        getattr(method, '__name__', '').startswith('iter_')
+
+
+def check_not_iterator(method, results):
+    '''
+    Raise TypeError if a call returned iterators: iterating them on the
+    event loop would make blocking boto3 calls.
+    '''
+    iterators = [result for result in results if inspect.isgenerator(result)]
+    if not iterators:
+        return
+    for iterator in iterators:
+        iterator.close()
+    raise TypeError("%s returns an iterator, iterate it with async for" %
+                    method.__name__)
+
+
+def merge_results(results):
+    '''
+    Merge the per unit results of a split call, in unit order. None if
+    every unit returned None.
+    '''
+    if not results:
+        return results
+
+    present = [result for result in results if result is not None]
+    if not present:
+        return None
+
+    if isinstance(present[0], dict):
+        merged = {}
+        for result in results:
+            if result:
+                merged.update(result)
+        return merged
+
+    if isinstance(present[0], list):
+        merged = []
+        for result in results:
+            if result:
+                merged.extend(result)
+        return merged
+
+    return results
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import boto3
-from orcalib.aws_config import AwsConfig
 from orcalib.aws_config import OrcaConfig
+from orcalib.aws_clients import build_clients
+from orcalib.inventory_cache import cached
+import orcalib.fanout as fanout
 
 class AwsServiceAutoScaling(object):
     '''
@@ -23,36 +24,15 @@ class AwsServiceAutoScaling(object):
 
         orca_config = OrcaConfig()
         self.regions = orca_config.get_regions()
-        self.clients = {}
+        self.max_concurrency = orca_config.get_max_concurrency()
+        self.cache = None
         self.auto_scaling_groups = {}
-
-        if profile_names is not None:
-            for profile_name in profile_names:
-                session = boto3.Session(profile_name=profile_name)
-                self.clients[profile_name] = session.client(service)
-        elif access_key_id is not None and secret_access_key is not None:
-            self.clients['default'] = boto3.client(
-                service,
-                aws_access_key_id=access_key_id,
-                aws_secret_access_key=secret_access_key)
-        else:
-            if iam_role_discover:
-                session = boto3.Session()
-                self.clients['default'] = {}
-                for region in self.regions:
-                    self.clients['default'][region] = \
-                        session.client(service, region_name=region)
-            else:
-                awsconfig = AwsConfig()
-                profiles = awsconfig.get_profiles()
-
-                for profile in profiles:
-                    session = boto3.Session(profile_name=profile)
-                    self.clients[profile] = {}
-                    for region in self.regions:
-                        self.clients[profile][region] = \
-                            session.client(service,
-                                           region_name=region)
+        self.clients = build_clients(service,
+                                     regions=self.regions,
+                                     profile_names=profile_names,
+                                     access_key_id=access_key_id,
+                                     secret_access_key=secret_access_key,
+                                     iam_role_discover=iam_role_discover)
 
     def list_autoscaling_groups(self, profile_names=None, regions=None):
         '''
@@ -62,7 +42,6 @@ class AwsServiceAutoScaling(object):
         :param profile_names: List of profiles.
 
         '''
-        group_list = []
         for profile in self.clients.keys():
             self.auto_scaling_groups[profile] = {}
             if profile_names is not None and \
@@ -70,21 +49,28 @@ class AwsServiceAutoScaling(object):
                 continue
             for region in self.regions:
                 self.auto_scaling_groups[profile][region] = []
-                if regions is not None and \
-                        region not in regions:
-                    continue
-
-                groups = self.clients[profile][region].\
-                    describe_auto_scaling_groups()
-                for group in groups['AutoScalingGroups']:
-                    self.auto_scaling_groups[profile][region].append(group[
-                        'AutoScalingGroupName'])
-                    group['region'] = region
-                    group['profile_name'] = profile
-                    group_list.append(group)
+
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            self.clients[profile][region].describe_auto_scaling_groups(),
+            units, max_workers=self.max_concurrency)
+
+        group_list = []
+        for profile, region, groups in fanout.collect(
+                results, "List Autoscaling Groups"):
+            for group in groups['AutoScalingGroups']:
+                self.auto_scaling_groups[profile][region].append(group[
+                    'AutoScalingGroupName'])
+                group['region'] = region
+                group['profile_name'] = profile
+                group_list.append(group)
 
         return group_list
 
+    @cached('launch_configurations')
     def list_launch_configurations(self, profile_names=None, regions=None):
         '''
         Return all the launch configurations.
@@ -93,25 +79,25 @@ class AwsServiceAutoScaling(object):
         :param profile_names: List of profiles.
 
         '''
-        group_list = []
-        for profile in self.clients.keys():
-            if profile_names is not None and \
-                    profile not in profile_names:
-                continue
-            for region in self.regions:
-                if regions is not None and \
-                        region not in regions:
-                    continue
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            self.clients[profile][region].describe_launch_configurations(),
+            units, max_workers=self.max_concurrency)
 
-                groups = self.clients[profile][region].\
-                    describe_launch_configurations()
-                for group in groups['LaunchConfigurations']:
-                    group['region'] = region
-                    group['profile_name'] = profile
-                    group_list.append(group)
+        group_list = []
+        for profile, region, groups in fanout.collect(
+                results, "List Launch Configurations"):
+            for group in groups['LaunchConfigurations']:
+                group['region'] = region
+                group['profile_name'] = profile
+                group_list.append(group)
 
         return group_list
 
+    @cached('autoscaling_load_balancers')
     def list_load_balancers(self, profile_names=None, regions=None):
         '''
         Return all the load balancers.
@@ -125,23 +111,29 @@ class AwsServiceAutoScaling(object):
             self.list_autoscaling_groups()
         if not self.auto_scaling_groups:
             print("Didnt find auto scaling groups names, cant list load bal.")
-        for profile in self.clients.keys():
-            if profile_names is not None and \
-                    profile not in profile_names:
-                continue
-            for region in self.regions:
-                if regions is not None and \
-                        region not in regions:
-                    continue
-                if self.auto_scaling_groups[profile] and \
-                        self.auto_scaling_groups[profile][region]:
-                    for name in self.auto_scaling_groups[profile][region]:
-                        groups = self.clients[profile][region].\
-                    describe_load_balancers(AutoScalingGroupName=name)
-                    for group in groups['LoadBalancers']:
-                        group['region'] = region
-                        group['profile_name'] = profile
-                        group_list.append(group)
+
+        def describe_load_balancers(profile, region):
+            load_balancers = []
+            if self.auto_scaling_groups[profile] and \
+                    self.auto_scaling_groups[profile][region]:
+                for name in self.auto_scaling_groups[profile][region]:
+                    groups = self.clients[profile][region].\
+                        describe_load_balancers(AutoScalingGroupName=name)
+                    load_balancers.extend(groups['LoadBalancers'])
+            return load_balancers
+
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(describe_load_balancers, units,
+                                    max_workers=self.max_concurrency)
+
+        for profile, region, groups in fanout.collect(
+                results, "List Load Balancers"):
+            for group in groups:
+                group['region'] = region
+                group['profile_name'] = profile
+                group_list.append(group)
 
         return group_list
 
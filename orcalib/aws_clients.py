@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Lazy boto3 client construction shared by the orcalib service classes.
+
+The service classes expose ``self.clients`` as a mapping of
+profile -> client (global services like s3/iam) or
+profile -> region -> client (regional services like ec2/elb). The
+mappings returned here know their keys up front, but only create the
+boto3 session/client when a key is first accessed.
+
+Sessions and clients are kept in a process wide registry keyed by
+(profile, service, region), so every service instance and command helper
+in the process shares credentials resolution and the loaded botocore
+service models.
+'''
+
+import threading
+from collections.abc import Mapping
+import boto3
+import botocore.loaders
+import botocore.session
+from orcalib.aws_config import AwsConfig
+
+
+class LazyClientMap(Mapping):
+    '''
+    A read-only mapping whose values are built on first access and
+    then reused.
+    '''
+    def __init__(self, keys, factory, cache=True, identity=None):
+        '''
+        :type keys: list
+        :param keys: The keys of the mapping (profiles or regions).
+
+        :type factory: callable
+        :param factory: Called with a key to build the value for it.
+
+        :type cache: Boolean
+        :param cache: Keep the built values. Set to False when the factory
+            is itself a cache (the client registry), so that invalidating
+            the registry is seen by existing mappings.
+
+        :type identity: callable
+        :param identity: Called once, on the first get_identity(), to
+            tell which credentials the keys stand for.
+        '''
+        self._keys = list(keys)
+        self._keyset = set(self._keys)
+        self._factory = factory
+        self._cache = cache
+        self._values = {}
+        self._lock = threading.Lock()
+        self._identity = identity
+        self._identity_value = None
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+
+        if key not in self._keyset:
+            raise KeyError(key)
+
+        if not self._cache:
+            return self._factory(key)
+
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = self._factory(key)
+
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keyset
+
+    def get_identity(self):
+        '''
+        Return the credentials the clients are built from, when the keys
+        alone do not tell: the access key id for static credentials or
+        the default credential chain ('default' profile). None when the
+        keys are the profile names.
+        '''
+        if self._identity is None:
+            return None
+        with self._lock:
+            if self._identity_value is None:
+                self._identity_value = self._identity()
+        return self._identity_value
+
+
+class ClientRegistry(object):
+    '''
+    Process wide registry of boto3 sessions and clients.
+
+    Sessions are keyed by profile and clients by (profile, service, region).
+    All the sessions share one botocore loader, so a service model is read
+    from disk once per process.
+    '''
+    def __init__(self):
+        self._sessions = {}
+        self._clients = {}
+        self._loader = botocore.loaders.Loader()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _session_key(profile, access_key_id):
+        if access_key_id is not None:
+            return ('access_key', access_key_id)
+        return profile
+
+    def get_session(self,
+                    profile=None,
+                    access_key_id=None,
+                    secret_access_key=None):
+        '''
+        Return the shared boto3 session for a profile.
+
+        :type profile: string
+        :param profile: The profile name. If None the default credential
+            chain is used (env, instance metadata, etc.)
+
+        :type access_key_id: string
+        :param access_key_id: Use static credentials instead of a profile.
+        '''
+        key = self._session_key(profile, access_key_id)
+        session = self._sessions.get(key, None)
+        if session is not None:
+            return session
+
+        with self._lock:
+            if key not in self._sessions:
+                botocore_session = botocore.session.get_session()
+                botocore_session.register_component('data_loader',
+                                                    self._loader)
+                if access_key_id is not None:
+                    session = boto3.Session(
+                        aws_access_key_id=access_key_id,
+                        aws_secret_access_key=secret_access_key,
+                        botocore_session=botocore_session)
+                else:
+                    session = boto3.Session(
+                        profile_name=profile,
+                        botocore_session=botocore_session)
+                # boto3 appends its data path to the loader for every new
+                # session, keep the shared search path list free of dups.
+                search_paths = self._loader.search_paths
+                search_paths[:] = list(dict.fromkeys(search_paths))
+                self._sessions[key] = session
+            return self._sessions[key]
+
+    def get_client(self,
+                   service,
+                   profile=None,
+                   region=None,
+                   access_key_id=None,
+                   secret_access_key=None):
+        '''
+        Return the shared client for (profile, service, region).
+
+        :type service: string
+        :param service: The name of the service ('s3', 'ec2', 'iam', etc.)
+
+        :type region: string
+        :param region: The region name. None for the session default.
+        '''
+        key = (self._session_key(profile, access_key_id), service, region)
+        client = self._clients.get(key, None)
+        if client is not None:
+            return client
+
+        # boto3 sessions are not thread safe, serialize client creation.
+        with self._lock:
+            if key not in self._clients:
+                session = self.get_session(
+                    profile=profile,
+                    access_key_id=access_key_id,
+                    secret_access_key=secret_access_key)
+                if region is None:
+                    self._clients[key] = session.client(service)
+                else:
+                    self._clients[key] = session.client(service,
+                                                        region_name=region)
+            return self._clients[key]
+
+    def reset(self):
+        '''
+        Drop all the sessions and clients, without waiting on the lock.
+        Only for a child process right after a fork: the inherited
+        clients share their connections with the parent, and a lock held
+        by another parent thread would never be released.
+        '''
+        self._lock = threading.RLock()
+        self._sessions = {}
+        self._clients = {}
+
+    def invalidate(self, profile=None, service=None, region=None):
+        '''
+        Drop the cached clients matching the given arguments. Arguments
+        left as None match anything. When only a profile is given (or
+        nothing at all) the sessions are dropped too, so credentials are
+        resolved again on the next call.
+        '''
+        with self._lock:
+            for key in list(self._clients.keys()):
+                if profile is not None and key[0] != profile:
+                    continue
+                if service is not None and key[1] != service:
+                    continue
+                if region is not None and key[2] != region:
+                    continue
+                del self._clients[key]
+
+            if service is None and region is None:
+                for key in list(self._sessions.keys()):
+                    if profile is None or key == profile:
+                        del self._sessions[key]
+
+
+_registry = ClientRegistry()
+
+
+def get_registry():
+    '''
+    Return the process wide client registry.
+    '''
+    return _registry
+
+
+def build_clients(service,
+                  regions=None,
+                  profile_names=None,
+                  access_key_id=None,
+                  secret_access_key=None,
+                  iam_role_discover=False,
+                  awsconfig=None):
+    '''
+    Return a lazy mapping of clients for the service.
+
+    :type service: string
+    :param service: The name of the service ('s3', 'ec2', 'iam', etc.)
+
+    :type regions: List of strings
+    :param regions: Regions to create clients for. If None the service
+        is treated as global and each profile maps directly to a client,
+        otherwise each profile maps to a region -> client mapping.
+
+    :type profile_names: List of strings
+    :param profile_names: Profiles to create clients for. If not set
+        all the profiles from the aws credentials file are used.
+
+    :type awsconfig: AwsConfig
+    :param awsconfig: An already parsed aws configuration to read the
+        profiles from.
+    '''
+    registry = get_registry()
+
+    if profile_names is not None:
+        profiles = profile_names
+    elif access_key_id is not None and secret_access_key is not None:
+        profiles = ['default']
+    elif iam_role_discover:
+        profiles = ['default']
+    else:
+        if awsconfig is None:
+            awsconfig = AwsConfig()
+        profiles = awsconfig.get_profiles()
+
+    def create_client(profile, region=None):
+        if profile_names is not None:
+            return registry.get_client(service, profile=profile,
+                                       region=region)
+        elif access_key_id is not None and secret_access_key is not None:
+            return registry.get_client(
+                service, region=region,
+                access_key_id=access_key_id,
+                secret_access_key=secret_access_key)
+        elif iam_role_discover:
+            return registry.get_client(service, region=region)
+        return registry.get_client(service, profile=profile, region=region)
+
+    def get_chain_identity():
+        # Resolved from the environment or the instance metadata.
+        credentials = registry.get_session().get_credentials()
+        if credentials is None:
+            return None
+        return credentials.access_key
+
+    # The 'default' profile does not tell whose credentials are used.
+    identity = None
+    if profile_names is None:
+        if access_key_id is not None and secret_access_key is not None:
+            identity = lambda: access_key_id
+        elif iam_role_discover:
+            identity = get_chain_identity
+
+    if regions is None:
+        return LazyClientMap(profiles, create_client, cache=False,
+                             identity=identity)
+
+    def region_clients(profile):
+        return LazyClientMap(
+            regions,
+            lambda region: create_client(profile, region),
+            cache=False)
+
+    return LazyClientMap(profiles, region_clients, identity=identity)
@@ -53,6 +53,26 @@ class OrcaConfig(object):
         except KeyError:
             return None
 
+    def get_max_concurrency(self):
+        '''
+        Return the max number of concurrent AWS calls from the orcaenv
+        config file
+        '''
+        try:
+            return (self.parsedyaml['max_concurrency'])
+        except KeyError:
+            return None
+
+    def get_cache_ttl(self):
+        '''
+        Return the inventory cache TTLs (resource type -> seconds) from
+        the orcaenv config file
+        '''
+        try:
+            return (self.parsedyaml['cache_ttl'])
+        except KeyError:
+            return None
+
     def get_s3_bucket_naming_policy(self):
         '''
         Return the s3_bucket_naming_policy from the orcaenv cfg file
@@ -24,7 +24,8 @@ class AwsService(object):
                  profile_names=None,
                  access_key_id=None,
                  secret_access_key=None,
-                 iam_role_discover=False):
+                 iam_role_discover=False,
+                 cache=None):
         '''
         Create a service client to one or more environments by name.
 
@@ -50,6 +51,10 @@ class AwsService(object):
         without any parameters, which will cause Boto to automatically find
         credentials in the instance metadata.
 
+        :type cache: InventoryCache
+        :param cache: Serve the list_* calls from this on disk cache (see
+            orcalib.inventory_cache) while the results are fresh.
+
         Note: If none of the optional parameters are provided then
             the default credentials in ~/.aws/config default section will
             be used with the default profile.
@@ -92,4 +97,6 @@ class AwsService(object):
             print("ERROR: Servicename [%s] not valid")
             return
 
+        self.service.cache = cache
+
 
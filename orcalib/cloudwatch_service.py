@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import boto3
-from orcalib.aws_config import AwsConfig
 from orcalib.aws_config import OrcaConfig
+from orcalib.aws_clients import build_clients
+from orcalib.inventory_cache import cached
+import orcalib.fanout as fanout
 
 class AwsServiceCloudWatch(object):
     '''
@@ -22,36 +23,16 @@ class AwsServiceCloudWatch(object):
 
         orca_config = OrcaConfig()
         self.regions = orca_config.get_regions()
-        self.clients = {}
-
-        if profile_names is not None:
-            for profile_name in profile_names:
-                session = boto3.Session(profile_name=profile_name)
-                self.clients[profile_name] = session.client(service)
-        elif access_key_id is not None and secret_access_key is not None:
-            self.clients['default'] = boto3.client(
-                service,
-                aws_access_key_id=access_key_id,
-                aws_secret_access_key=secret_access_key)
-        else:
-            if iam_role_discover:
-                session = boto3.Session()
-                self.clients['default'] = {}
-                for region in self.regions:
-                    self.clients['default'][region] = \
-                        session.client(service, region_name=region)
-            else:
-                awsconfig = AwsConfig()
-                profiles = awsconfig.get_profiles()
-
-                for profile in profiles:
-                    session = boto3.Session(profile_name=profile)
-                    self.clients[profile] = {}
-                    for region in self.regions:
-                        self.clients[profile][region] = \
-                            session.client(service,
-                                           region_name=region)
-
+        self.max_concurrency = orca_config.get_max_concurrency()
+        self.cache = None
+        self.clients = build_clients(service,
+                                     regions=self.regions,
+                                     profile_names=profile_names,
+                                     access_key_id=access_key_id,
+                                     secret_access_key=secret_access_key,
+                                     iam_role_discover=iam_role_discover)
+
+    @cached('alarms')
     def list_alarms(self, profile_names=None, regions=None):
         '''
         Return all the alarms.
@@ -60,20 +41,20 @@ class AwsServiceCloudWatch(object):
         :param profile_names: List of profiles.
 
         '''
-        alarm_list = []
-        for profile in self.clients.keys():
-            if profile_names is not None and \
-                    profile not in profile_names:
-                continue
-            for region in self.regions:
-                if regions is not None and \
-                        region not in regions:
-                    continue
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            self.clients[profile][region].describe_alarms(),
+            units, max_workers=self.max_concurrency)
 
-                alarms = self.clients[profile][region].describe_alarms()
-                for alarm in alarms['MetricAlarms']:
-                    alarm['region'] = region
-                    alarm['profile_name'] = profile
-                    alarm_list.append(alarm)
+        alarm_list = []
+        for profile, region, alarms in fanout.collect(results,
+                                                      "List Alarms"):
+            for alarm in alarms['MetricAlarms']:
+                alarm['region'] = region
+                alarm['profile_name'] = profile
+                alarm_list.append(alarm)
 
         return alarm_list
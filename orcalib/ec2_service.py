@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import boto3
 import botocore
 from orcalib.aws_config import AwsConfig
 from orcalib.aws_config import OrcaConfig
+from orcalib.aws_clients import build_clients
+from orcalib.inventory_cache import cached
+import orcalib.fanout as fanout
+import orcalib.normalize as normalize
 
 
 class AwsServiceEC2(object):
@@ -24,35 +27,140 @@ class AwsServiceEC2(object):
 
         orca_config = OrcaConfig()
         self.regions = orca_config.get_regions()
-        self.clients = {}
-
-        if profile_names is not None:
-            for profile_name in profile_names:
-                session = boto3.Session(profile_name=profile_name)
-                self.clients[profile_name] = session.client(service)
-        elif access_key_id is not None and secret_access_key is not None:
-            self.clients['default'] = boto3.client(
-                service,
-                aws_access_key_id=access_key_id,
-                aws_secret_access_key=secret_access_key)
+        self.max_concurrency = orca_config.get_max_concurrency()
+        self.cache = None
+        self.awsconfig = AwsConfig()
+        self.clients = build_clients(service,
+                                     regions=self.regions,
+                                     profile_names=profile_names,
+                                     access_key_id=access_key_id,
+                                     secret_access_key=secret_access_key,
+                                     iam_role_discover=iam_role_discover,
+                                     awsconfig=self.awsconfig)
+
+    def _paginate(self, profile, region, operation, result_key, **kwargs):
+        '''
+        Yield the items of a describe call for one profile/region, one
+        page at a time. Falls back to a single call for operations that
+        cannot be paginated.
+        '''
+        client = self.clients[profile][region]
+        if client.can_paginate(operation):
+            paginator = client.get_paginator(operation)
+            for page in paginator.paginate(**kwargs):
+                for item in page.get(result_key, []):
+                    yield item
         else:
-            if iam_role_discover:
-                session = boto3.Session()
-                self.clients['default'] = {}
-                for region in self.regions:
-                    self.clients['default'][region] = \
-                        session.client(service, region_name=region)
-            else:
-                self.awsconfig = AwsConfig()
-                profiles = self.awsconfig.get_profiles()
-
-                for profile in profiles:
-                    session = boto3.Session(profile_name=profile)
-                    self.clients[profile] = {}
-                    for region in self.regions:
-                        self.clients[profile][region] = \
-                            session.client(service, region_name=region)
+            data = getattr(client, operation)(**kwargs)
+            for item in data.get(result_key, []):
+                yield item
+
+    def _iter_resources(self, operation, result_key,
+                        profile_names=None, regions=None,
+                        get_kwargs=None, transform=None):
+        '''
+        Yield the resources of a describe call across profiles and
+        regions, as each page arrives.
+
+        :type get_kwargs: callable
+        :param get_kwargs: Called with the profile name to return the
+            extra arguments of the describe call.
+
+        :type transform: callable
+        :param transform: Called on each resource before it is yielded.
+        '''
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        for profile, region in units:
+            kwargs = {}
+            try:
+                if get_kwargs is not None:
+                    kwargs = get_kwargs(profile)
+                for item in self._paginate(profile, region, operation,
+                                           result_key, **kwargs):
+                    if transform is not None:
+                        transform(item)
+                    item['region'] = region
+                    item['profile_name'] = profile
+                    yield item
+            except (botocore.exceptions.ClientError,
+                    botocore.exceptions.BotoCoreError) as botoerr:
+                print("%s Failed: Account: %s, Region: %s [%s]" % \
+                    (operation, profile, region, botoerr))
+
+    def _get_owner_filter(self, profile):
+        return {'OwnerIds': [self.awsconfig.get_aws_owner_id(profile)]}
+
+    def _get_owners(self, profile):
+        return {'Owners': [self.awsconfig.get_aws_owner_id(profile)]}
+
+    def iter_vms(self, profile_names=None, regions=None):
+        '''
+        Yield the vms (reservations) one page at a time, with the
+        instances flattened the same way as list_vms.
+        '''
+        return self._iter_resources('describe_instances', 'Reservations',
+                                    profile_names=profile_names,
+                                    regions=regions,
+                                    transform=normalize.normalize_reservation)
+
+    def iter_reserved_vms(self, profile_names=None, regions=None):
+        '''
+        Yield the reserved vms.
+        '''
+        return self._iter_resources('describe_reserved_instances',
+                                    'ReservedInstances',
+                                    profile_names=profile_names,
+                                    regions=regions)
+
+    def iter_network_interfaces(self, profile_names=None, regions=None):
+        '''
+        Yield the network interfaces one page at a time.
+        '''
+        return self._iter_resources('describe_network_interfaces',
+                                    'NetworkInterfaces',
+                                    profile_names=profile_names,
+                                    regions=regions)
+
+    def iter_images(self, profile_names=None, regions=None):
+        '''
+        Yield the images owned by each profile one page at a time.
+        '''
+        return self._iter_resources('describe_images', 'Images',
+                                    profile_names=profile_names,
+                                    regions=regions,
+                                    get_kwargs=self._get_owners)
+
+    def iter_volumes(self, profile_names=None, regions=None):
+        '''
+        Yield the volumes one page at a time.
+        '''
+        return self._iter_resources('describe_volumes', 'Volumes',
+                                    profile_names=profile_names,
+                                    regions=regions)
+
+    def iter_snapshots(self, profile_names=None, regions=None):
+        '''
+        Yield the snapshots owned by each profile one page at a time.
+        '''
+        return self._iter_resources('describe_snapshots', 'Snapshots',
+                                    profile_names=profile_names,
+                                    regions=regions,
+                                    get_kwargs=self._get_owner_filter)
 
+    def iter_security_groups(self, profile_names=None, regions=None):
+        '''
+        Yield the security groups one page at a time, formatted the same
+        way as list_security_groups.
+        '''
+        return self._iter_resources('describe_security_groups',
+                                    'SecurityGroups',
+                                    profile_names=profile_names,
+                                    regions=regions,
+                                    transform=normalize.normalize_security_group)
+
+    @cached('vms')
     def list_vms(self, profile_names=None, regions=None):
         '''
         Return all the vms.
@@ -62,61 +170,26 @@ class AwsServiceEC2(object):
             of buckets from all profiles/environments.
 
         '''
-        vm_list = []
-        for profile in self.clients.keys():
-            if profile_names is not None and \
-                    profile not in profile_names:
-                continue
-            for region in self.regions:
-                if regions is not None and \
-                        region not in regions:
-                    continue
-
-                try:
-                    vms = self.clients[profile][region].describe_instances()
-                except botocore.exceptions.ClientError as botoerr:
-                    print("List VMS Failed: Account: %s, Region: %s [%s]" % \
-                        (profile, region, botoerr))
-                    continue
-
-                for vm in vms['Reservations']:
-                    vm['region'] = region
-                    vm['profile_name'] = profile
-                    vm_list.append(vm)
-
-                for vm in vm_list:
-                    for instance in vm['Instances']:
-                        # Flatten Tags.
-                        if instance.get('Tags', None) is not None:
-                            if type(instance['Tags']) == list:
-                                tags = instance['Tags']
-                                instance['Tags'] = {}
-                                for tag in tags:
-                                    instance['Tags'][tag['Key']] = tag['Value']
-
-                        # Flatten Security Groups
-                        if instance.get('SecurityGroups', None) is not None:
-                            if type(instance['SecurityGroups']) == list:
-                                secgroups = instance['SecurityGroups']
-                                instance['SecurityGroups'] = {}
-                                for secgroup in secgroups:
-                                    instance['SecurityGroups'][secgroup['GroupId']] = \
-                                        secgroup['GroupName']
-
-                        # Flatten NetworkInterfaces
-                        if instance.get('NetworkInterfaces', None) is not None:
-                            if type(instance['NetworkInterfaces']) == list:
-                                nw_intfs = instance['NetworkInterfaces']
-                                instance['NetworkInterfaces'] = {}
-                                instobj = instance['NetworkInterfaces']
-                                for nw_intf in nw_intfs:
-                                    instobj[nw_intf['NetworkInterfaceId']] = \
-                                                    nw_intf
-
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            list(self._paginate(profile, region, 'describe_instances',
+                                'Reservations')),
+            units, max_workers=self.max_concurrency)
 
+        vm_list = []
+        for profile, region, vms in fanout.collect(results, "List VMS"):
+            for vm in vms:
+                normalize.normalize_reservation(vm)
+                vm['region'] = region
+                vm['profile_name'] = profile
+                vm_list.append(vm)
 
         return vm_list
 
+    @cached('reserved_vms')
     def list_reserved_vms(self, profile_names=None, regions=None):
         '''
         Return reserved vms.
@@ -126,50 +199,54 @@ class AwsServiceEC2(object):
             of reserved vms from all profiles/environments.
 
         '''
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            list(self._paginate(profile, region,
+                                'describe_reserved_instances',
+                                'ReservedInstances')),
+            units, max_workers=self.max_concurrency)
+
         vm_list = []
-        for profile in self.clients.keys():
-            if profile_names is not None and \
-                    profile not in profile_names:
-                continue
-            for region in self.regions:
-                if regions is not None and \
-                        region not in regions:
-                    continue
-
-                vms = self.clients[profile][region].\
-                    describe_reserved_instances()
-                for vm in vms['ReservedInstances']:
-                    vm['region'] = region
-                    vm['profile_name'] = profile
-                    vm_list.append(vm)
+        for profile, region, vms in fanout.collect(results,
+                                                   "List Reserved VMS"):
+            for vm in vms:
+                vm['region'] = region
+                vm['profile_name'] = profile
+                vm_list.append(vm)
 
         return vm_list
 
+    @cached('network_interfaces')
     def list_network_interfaces(self, profile_names=None, regions=None):
         '''
         :param profile_names: List of Strings
         :param regions: List of profiles
         :return:
         '''
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            list(self._paginate(profile, region,
+                                'describe_network_interfaces',
+                                'NetworkInterfaces')),
+            units, max_workers=self.max_concurrency)
 
         nw_list = []
-        for profile in self.clients.keys():
-            if profile_names is not None and \
-                    profile not in profile_names:
-                continue
-            for region in self.regions:
-                if regions is not None and \
-                        region not in regions:
-                    continue
-                nws = self.clients[profile][region].\
-                    describe_network_interfaces()
-                for nw in nws['NetworkInterfaces']:
-                    nw['region'] = region
-                    nw['profile_name'] = profile
-                    nw_list.append(nw)
+        for profile, region, nws in fanout.collect(
+                results, "List Network Interfaces"):
+            for nw in nws:
+                nw['region'] = region
+                nw['profile_name'] = profile
+                nw_list.append(nw)
 
         return nw_list
 
+    @cached('images')
     def list_images(self, profile_names=None, regions=None):
 
         '''
@@ -178,65 +255,72 @@ class AwsServiceEC2(object):
         :param regions: List of profiles
         :return:
         '''
+        def describe_images(profile, region):
+            return list(self._paginate(profile, region, 'describe_images',
+                                       'Images',
+                                       **self._get_owners(profile)))
+
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(describe_images, units,
+                                    max_workers=self.max_concurrency)
 
         image_list = []
-        for profile in self.clients.keys():
-            if profile_names is not None and \
-                    profile not in profile_names:
-                continue
-            ownerid = self.awsconfig.get_aws_owner_id(profile)
-            for region in self.regions:
-                if regions is not None and \
-                        region not in regions:
-                    continue
-                images = self.clients[profile][region].\
-                    describe_images(Owners=[ownerid])
-                for image in images['Images']:
-                    image['region'] = region
-                    image['profile_name'] = profile
-                    image_list.append(image)
+        for profile, region, images in fanout.collect(results,
+                                                      "List Images"):
+            for image in images:
+                image['region'] = region
+                image['profile_name'] = profile
+                image_list.append(image)
 
         return image_list
 
+    @cached('volumes')
     def list_volumes(self, profile_names=None, regions=None):
-        vol_list = []
-        for profile in self.clients.keys():
-            if profile_names is not None and profile not in profile_names:
-                continue
-            for region in self.regions:
-                if regions is not None and region not in regions:
-                    continue
-
-                vols = self.clients[profile][region].describe_volumes()
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            list(self._paginate(profile, region, 'describe_volumes',
+                                'Volumes')),
+            units, max_workers=self.max_concurrency)
 
-                for vol in vols['Volumes']:
-                    vol['region'] = region
-                    vol['profile_name'] = profile
-                    vol_list.append(vol)
+        vol_list = []
+        for profile, region, vols in fanout.collect(results,
+                                                    "List Volumes"):
+            for vol in vols:
+                vol['region'] = region
+                vol['profile_name'] = profile
+                vol_list.append(vol)
 
         return vol_list
 
+    @cached('snapshots')
     def list_snapshots(self, profile_names=None, regions=None):
-        snapshots = list()
-        for profile in self.clients.keys():
-            if profile_names is not None and profile not in profile_names:
-                continue
+        def describe_snapshots(profile, region):
+            return list(self._paginate(profile, region, 'describe_snapshots',
+                                       'Snapshots',
+                                       **self._get_owner_filter(profile)))
 
-            ownerid = self.awsconfig.get_aws_owner_id(profile)
-            for region in self.regions:
-                if regions is not None and region not in regions:
-                    continue
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(describe_snapshots, units,
+                                    max_workers=self.max_concurrency)
 
-                snaps = self.clients[profile][region].describe_snapshots(
-                    OwnerIds=[ownerid])
-
-                for s in snaps['Snapshots']:
-                    s['region'] = region
-                    s['profile_name'] = profile
-                    snapshots.append(s)
+        snapshots = list()
+        for profile, region, snaps in fanout.collect(results,
+                                                     "List Snapshots"):
+            for s in snaps:
+                s['region'] = region
+                s['profile_name'] = profile
+                snapshots.append(s)
 
         return snapshots
 
+    @cached('security_groups')
     def list_security_groups(self,
                              profile_names=None,
                              regions=None,
@@ -247,92 +331,56 @@ class AwsServiceEC2(object):
         else:
             security_groups = list()
 
-        for profile in self.clients.keys():
-            if profile_names is not None and profile not in profile_names:
-                continue
-            for region in self.regions:
-                if regions is not None and region not in regions:
-                    continue
-
-                client = self.clients[profile][region]
-                groups = client.describe_security_groups()
-                for group in groups['SecurityGroups']:
-                    group_id = group['GroupId']
-                    # Format IpPermissions.
-                    group_ip_permissions = group['IpPermissions']
-                    group['IpPermissions'] = {}
-                    for permission in group_ip_permissions:
-                        try:
-                            from_port = permission['FromPort']
-                        except KeyError:
-                            from_port = "-1"
-                        ip_ranges = permission['IpRanges']
-                        permission['IpRanges'] = {}
-                        for range in ip_ranges:
-                            cidr = range['CidrIp']
-                            permission['IpRanges'][cidr] = 1
-
-                        group['IpPermissions'][from_port] = permission
-
-                    # Format IpPermissionsEgress
-                    egress_ip_permissions = group['IpPermissionsEgress']
-                    group['IpPermissionsEgress'] = {}
-                    for permission in egress_ip_permissions:
-                        try:
-                            from_port = permission['FromPort']
-                        except KeyError:
-                            from_port = "-1"
-                        ip_ranges = permission['IpRanges']
-                        permission['IpRanges'] = {}
-                        for range in ip_ranges:
-                            cidr = range['CidrIp']
-                            permission['IpRanges'][cidr] = 1
-                        group['IpPermissionsEgress'][from_port] = permission
-
-                    # Format Tags.
-                    try:
-                        tags = group['Tags']
-                    except KeyError:
-                        tags = []
-                    group['Tags'] = {}
-                    for tag in tags:
-                        tag_key = tag['Key']
-                        group['Tags'][tag_key] = tag['Value']
-
-                    if dict_type:
-                        security_groups[group_id] = group
-                        security_groups[group_id]['region'] = region
-                        security_groups[group_id]['profile_name'] = \
-                            profile
-                    else:
-                        group['region'] = region
-                        group['profile_name'] = profile
-                        security_groups.append(group)
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            list(self._paginate(profile, region,
+                                'describe_security_groups',
+                                'SecurityGroups')),
+            units, max_workers=self.max_concurrency)
+
+        for profile, region, groups in fanout.collect(
+                results, "List Security Groups"):
+            for group in groups:
+                group_id = group['GroupId']
+                normalize.normalize_security_group(group)
+
+                if dict_type:
+                    security_groups[group_id] = group
+                    security_groups[group_id]['region'] = region
+                    security_groups[group_id]['profile_name'] = \
+                        profile
+                else:
+                    group['region'] = region
+                    group['profile_name'] = profile
+                    security_groups.append(group)
 
         return security_groups
 
+    @cached('tags')
     def list_tags(self, profile_names=None, regions=None):
+        units = fanout.get_units(self.clients, self.regions,
+                                 profile_names=profile_names,
+                                 regions=regions)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            list(self._paginate(profile, region, 'describe_tags', 'Tags')),
+            units, max_workers=self.max_concurrency)
 
         tagsobj = {}
-        for profile in self.clients.keys():
-            if profile_names is not None and profile not in profile_names:
-                continue
-            for region in self.regions:
-                if regions is not None and region not in regions:
-                    continue
-
-                tags_ = self.clients[profile][region].describe_tags()
-
-                for tag in tags_['Tags']:
-                    if tagsobj.get(tag['ResourceId'], None) is None:
-                        tagsobj[tag['ResourceId']] = {}
-
-                    obj = tagsobj[tag['ResourceId']]
-
-                    obj['region'] = region
-                    obj['profile_name'] = profile
-                    obj['ResourceType'] = tag['ResourceType']
-                    tagname = "tag_" + tag['Key']
-                    obj[tagname] = tag['Value']
+        for profile, region, tags_ in fanout.collect(results, "List Tags"):
+            for tag in tags_:
+                if tagsobj.get(tag['ResourceId'], None) is None:
+                    tagsobj[tag['ResourceId']] = {}
+
+                obj = tagsobj[tag['ResourceId']]
+
+                obj['region'] = region
+                obj['profile_name'] = profile
+                obj['ResourceType'] = tag['ResourceType']
+                tagname = "tag_" + tag['Key']
+                obj[tagname] = tag['Value']
 
         return tagsobj
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Concurrent profile x region fan-out.
+
+The list_* APIs of the service classes make one or more boto3 calls for
+every (profile, region) pair they cover. The helpers here run those per
+unit calls on a bounded thread pool, and hand the results back in the
+same deterministic order a serial loop over clients x regions would have
+produced, with the errors reported per unit.
+
+For per item work that runs over and over in a process (e.g. enriching
+each S3 bucket), iter_completed() uses a long lived worker pool and
+streams the results back as they finish.
+'''
+
+import collections
+import concurrent.futures
+import os
+import random
+import threading
+import time
+
+
+DEFAULT_MAX_CONCURRENCY = 16
+
+# Size of the process wide worker pool. The work is boto3 calls, which
+# mostly wait on the network, so use a few threads per cpu.
+WORKER_POOL_SIZE = min(32, (os.cpu_count() or 1) * 4)
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+# Per thread count of the failed units collect() reported.
+_failures = threading.local()
+
+
+UnitResult = collections.namedtuple('UnitResult',
+                                    ['profile', 'region', 'result', 'error'])
+
+
+def get_units(clients, all_regions=None, profile_names=None, regions=None):
+    '''
+    Return the list of (profile, region) units to fan out over.
+
+    :type clients: dict
+    :param clients: The profile -> client(s) mapping of a service.
+
+    :type all_regions: List of strings
+    :param all_regions: The regions the service is configured for. None
+        for global services, in which case the region of each unit is None.
+
+    :type profile_names: List of strings
+    :param profile_names: Only include these profiles.
+
+    :type regions: List of strings
+    :param regions: Only include these regions.
+    '''
+    units = []
+    for profile in clients.keys():
+        if profile_names is not None and profile not in profile_names:
+            continue
+        if all_regions is None:
+            units.append((profile, None))
+            continue
+        for region in all_regions:
+            if regions is not None and region not in regions:
+                continue
+            units.append((profile, region))
+
+    return units
+
+
+def _run_unit(func, unit):
+    try:
+        return UnitResult(unit[0], unit[1], func(*unit), None)
+    except Exception as err:
+        return UnitResult(unit[0], unit[1], None, err)
+
+
+def run_fanout(func, units, max_workers=None):
+    '''
+    Call func(profile, region) for every unit concurrently.
+
+    :type func: callable
+    :param func: The per unit API, called with (profile, region).
+
+    :type units: List of (profile, region) tuples
+    :param units: The units to run, see get_units().
+
+    :type max_workers: int
+    :param max_workers: Upper bound on the calls in flight. Defaults
+        to DEFAULT_MAX_CONCURRENCY.
+
+    Returns:
+        A list of UnitResult in the same order as units. If the call
+        raised, the result is None and error holds the exception.
+    '''
+    if max_workers is None:
+        max_workers = DEFAULT_MAX_CONCURRENCY
+    max_workers = max(1, min(max_workers, len(units)))
+
+    if max_workers == 1:
+        return [_run_unit(func, unit) for unit in units]
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers) as executor:
+        futures = [executor.submit(_run_unit, func, unit) for unit in units]
+        return [future.result() for future in futures]
+
+
+def collect(results, operation):
+    '''
+    Return (profile, region, result) for the units that succeeded, in
+    order, and print the units that failed.
+
+    :type results: List of UnitResult
+    :param results: The output of run_fanout().
+
+    :type operation: String
+    :param operation: Name of the operation, used in the error message.
+    '''
+    succeeded = []
+    for unit in results:
+        if unit.error is not None:
+            print("%s Failed: Account: %s, Region: %s [%s]" % \
+                (operation, unit.profile, unit.region, unit.error))
+            _failures.count = get_failure_count() + 1
+            continue
+        succeeded.append((unit.profile, unit.region, unit.result))
+
+    return succeeded
+
+
+def get_failure_count():
+    '''
+    Return the number of failed units collect() has reported in the
+    calling thread. Compare the counts before and after a call to tell
+    if its result is missing some units.
+    '''
+    return getattr(_failures, 'count', 0)
+
+
+def get_worker_pool():
+    '''
+    Return the process wide worker pool. It is created on first use and
+    kept for the life of the process.
+    '''
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=WORKER_POOL_SIZE)
+        return _worker_pool
+
+
+def _reset_worker_pool():
+    # The pool threads do not survive a fork, the child builds its own.
+    global _worker_pool, _worker_pool_lock
+    _worker_pool = None
+    _worker_pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_worker_pool)
+
+
+def call_with_retry(func, item, retries=0, backoff=0.5, max_backoff=10):
+    '''
+    Call func(item), retrying when it raises.
+
+    :type retries: int
+    :param retries: Number of retries after the first attempt.
+
+    :type backoff: float
+    :param backoff: Base delay in seconds, doubled on every retry (with
+        jitter) up to max_backoff.
+    '''
+    attempt = 0
+    while True:
+        try:
+            return func(item)
+        except Exception:
+            if attempt >= retries:
+                raise
+            delay = min(max_backoff, backoff * (2 ** attempt))
+            time.sleep(delay / 2 + random.uniform(0, delay / 2))
+            attempt += 1
+
+
+def iter_completed(func, items, max_in_flight=None, retries=0, backoff=0.5,
+                   key=None, max_per_key=None):
+    '''
+    Run func(item) for every item on the shared worker pool and yield
+    (item, result, error) as each one completes.
+
+    :type max_in_flight: int
+    :param max_in_flight: Max number of items submitted to the pool at
+        a time. Defaults to WORKER_POOL_SIZE.
+
+    :type retries: int
+    :param retries: Retries per item, see call_with_retry().
+
+    :type key: callable
+    :param key: Called with an item to return its group, e.g. the
+        profile, for max_per_key.
+
+    :type max_per_key: int
+    :param max_per_key: Max number of items of the same group in flight
+        at a time, e.g. to stay under the API rate limits of an account.
+        The items over the limit wait their turn, the others go ahead.
+    '''
+    if max_in_flight is None:
+        max_in_flight = WORKER_POOL_SIZE
+    max_in_flight = max(1, max_in_flight)
+    if key is None or max_per_key is None:
+        key = None
+    else:
+        max_per_key = max(1, max_per_key)
+
+    pool = get_worker_pool()
+    items = iter(items)
+    pending = {}
+    # Per group: the number of items in flight, and the ones waiting.
+    running = collections.Counter()
+    waiting = collections.OrderedDict()
+
+    def submit(item, item_key):
+        future = pool.submit(call_with_retry, func, item,
+                             retries=retries, backoff=backoff)
+        pending[future] = (item, item_key)
+        running[item_key] += 1
+
+    def submit_next():
+        for item_key, queue in waiting.items():
+            if running[item_key] < max_per_key:
+                item = queue.popleft()
+                if not queue:
+                    del waiting[item_key]
+                submit(item, item_key)
+                return True
+
+        for item in items:
+            if key is None:
+                submit(item, None)
+                return True
+            item_key = key(item)
+            if running[item_key] < max_per_key:
+                submit(item, item_key)
+                return True
+            waiting.setdefault(item_key, collections.deque()).append(item)
+        return False
+
+    try:
+        while len(pending) < max_in_flight and submit_next():
+            pass
+
+        while pending:
+            done, _ = concurrent.futures.wait(
+                list(pending.keys()),
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item, item_key = pending.pop(future)
+                running[item_key] -= 1
+                error = future.exception()
+                if error is not None:
+                    yield (item, None, error)
+                else:
+                    yield (item, future.result(), None)
+                while len(pending) < max_in_flight and submit_next():
+                    pass
+    finally:
+        # The consumer stopped early, drop what has not started yet.
+        for future in pending:
+            future.cancel()
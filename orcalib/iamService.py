@@ -4,9 +4,9 @@
 import os
 import datetime
 import jinja2
-import boto3
 import botocore
 from orcalib.aws_config import AwsConfig
+from orcalib.aws_clients import get_registry
 import orcalib.orcaLogger as orcaLogger
 
 def get_absolute_path_for_file(file_name, splitdir=None):
@@ -55,9 +55,10 @@ class IamService(object):
             regionName = env["region_name"]
             clientInfo = env
             try:
-                session = boto3.Session(profile_name=env["profile_name"],
-                                        region_name=env["region_name"])
-                client = session.client("iam")
+                client = get_registry().get_client(
+                    "iam",
+                    profile=env["profile_name"],
+                    region=env["region_name"])
                 clientInfo["botoClient"] = client
                 self.clients.append(clientInfo)
             except botocore.exceptions.ProfileNotFound as err:
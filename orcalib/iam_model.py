@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Offline IAM permission model of an account.
+
+Answering the permissions of one user live takes get_user,
+list_groups_for_user, list_attached_group_policies,
+list_attached_user_policies and the policy version calls. For a whole
+account that is thousands of calls. get_account_authorization_details
+returns the users, groups, roles and managed policies of the account
+(with their documents) in a few pages. IamAccountModel indexes one such
+snapshot and answers the same queries as AwsServiceIAM locally.
+'''
+
+import json
+import urllib.parse
+
+
+AUTHORIZATION_DETAIL_KEYS = ['UserDetailList', 'GroupDetailList',
+                             'RoleDetailList', 'Policies']
+
+
+def get_account_authorization_details(client):
+    '''
+    Return the get_account_authorization_details result of the account,
+    with the lists of all pages merged.
+    '''
+    details = dict((key, []) for key in AUTHORIZATION_DETAIL_KEYS)
+    paginator = client.get_paginator('get_account_authorization_details')
+    for page in paginator.paginate():
+        for key in AUTHORIZATION_DETAIL_KEYS:
+            details[key].extend(page.get(key, []))
+
+    return details
+
+
+def decode_document(document):
+    '''
+    Return a policy document as a dict. The API returns it URL encoded,
+    botocore normally decodes it already.
+    '''
+    if isinstance(document, str):
+        return json.loads(urllib.parse.unquote(document))
+    return document
+
+
+def get_statements(document):
+    '''
+    Return the statements of a policy document as a list.
+    '''
+    statements = decode_document(document).get('Statement', [])
+    # A single statement is not always wrapped in a list.
+    if isinstance(statements, dict):
+        statements = [statements]
+    return statements
+
+
+class IamAccountModel(object):
+    '''
+    Users, groups, roles and managed policies of one account, from a
+    get_account_authorization_details snapshot.
+    '''
+    def __init__(self, details, profile_name=None):
+        '''
+        :type details: dict
+        :param details: The merged get_account_authorization_details
+            result, see get_account_authorization_details().
+
+        :type profile_name: String
+        :param profile_name: Profile of the account, set on the users.
+        '''
+        self.profile_name = profile_name
+        self.users = dict((user['UserName'], user)
+                          for user in details.get('UserDetailList', []))
+        self.groups = dict((group['GroupName'], group)
+                           for group in details.get('GroupDetailList', []))
+        self.roles = dict((role['RoleName'], role)
+                          for role in details.get('RoleDetailList', []))
+        self.policies = dict((policy['Arn'], policy)
+                             for policy in details.get('Policies', []))
+
+        # Default version document of each managed policy.
+        self.documents = {}
+        for arn, policy in self.policies.items():
+            for version in policy.get('PolicyVersionList', []):
+                if version['IsDefaultVersion'] is True:
+                    self.documents[arn] = decode_document(
+                        version['Document'])
+
+    def list_users(self):
+        '''
+        Return all the users with their Groups, in the format of
+        AwsServiceIAM.list_users() followed by populate_groups_in_users().
+        '''
+        userlist = []
+        for user in self.users.values():
+            userinfo = dict((key, user[key]) for key in
+                            ['UserName', 'UserId', 'Arn', 'Path',
+                             'CreateDate'] if key in user)
+            userinfo['profile_name'] = self.profile_name
+            userinfo['Groups'] = self.get_user_groups(user['UserName'])
+            userlist.append(userinfo)
+
+        return userlist
+
+    def get_user_groups(self, UserName):
+        '''
+        Return the groups of the user, as list_groups_for_user does.
+        '''
+        groups = []
+        for group_name in self.users[UserName].get('GroupList', []):
+            group = self.groups.get(group_name, None)
+            if group is None:
+                groups.append({'GroupName': group_name})
+                continue
+            groups.append(dict((key, group[key]) for key in
+                               ['GroupName', 'GroupId', 'Arn', 'Path',
+                                'CreateDate'] if key in group))
+
+        return groups
+
+    def get_user_attached_policies(self, UserName=None,
+                                   include_document=False):
+        '''
+        Return all policies attached to user or a group to which
+        the user belongs, as AwsServiceIAM.get_user_attached_policies().
+        '''
+        user = self.users.get(UserName, None)
+        if user is None:
+            print("[%s: %s] User not found" % (self.profile_name, UserName))
+            return None
+
+        policies = []
+        # Get policies attached to groups
+        for group_name in user.get('GroupList', []):
+            group = self.groups.get(group_name, {})
+            for policy in group.get('AttachedManagedPolicies', []):
+                policy = dict(policy)
+                policy['type'] = 'group'
+                policies.append(policy)
+
+        # Get policies attached to user
+        for policy in user.get('AttachedManagedPolicies', []):
+            policy = dict(policy)
+            policy['type'] = 'user'
+            policies.append(policy)
+
+        if include_document:
+            for policy in policies:
+                managed = self.policies.get(policy['PolicyArn'], {})
+                policy['DefaultVersionId'] = managed.get('DefaultVersionId',
+                                                         None)
+                policy['Document'] = self.documents.get(policy['PolicyArn'],
+                                                        None)
+
+        return policies
+
+    def get_user_permissions(self, UserName=None, include_inline=False):
+        '''
+        Return the statements of the managed policies attached to the
+        user or its groups, as AwsServiceIAM.get_user_permissions().
+
+        :type include_inline: Boolean
+        :param include_inline: Also return the statements of the inline
+            policies of the user and its groups.
+        '''
+        policies = self.get_user_attached_policies(UserName=UserName,
+                                                   include_document=True)
+        if policies is None:
+            return None
+
+        statements = []
+        for policy in policies:
+            if policy['Document'] is None:
+                # Not in the snapshot, e.g. filtered out.
+                continue
+            statements.extend(get_statements(policy['Document']))
+
+        if include_inline:
+            user = self.users[UserName]
+            inline = list(user.get('UserPolicyList', []))
+            for group_name in user.get('GroupList', []):
+                group = self.groups.get(group_name, {})
+                inline.extend(group.get('GroupPolicyList', []))
+            for policy in inline:
+                statements.extend(get_statements(policy['PolicyDocument']))
+
+        return statements
+
+    def get_role_permissions(self, RoleName=None, include_inline=False):
+        '''
+        Return the statements of the managed policies attached to the
+        role, and of its inline policies if include_inline is set.
+        '''
+        role = self.roles.get(RoleName, None)
+        if role is None:
+            print("[%s: %s] Role not found" % (self.profile_name, RoleName))
+            return None
+
+        statements = []
+        for policy in role.get('AttachedManagedPolicies', []):
+            document = self.documents.get(policy['PolicyArn'], None)
+            if document is not None:
+                statements.extend(get_statements(document))
+
+        if include_inline:
+            for policy in role.get('RolePolicyList', []):
+                statements.extend(get_statements(policy['PolicyDocument']))
+
+        return statements
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+"Who can do X" queries over the IAM policies of an account.
+
+Answering which users and roles can perform s3:DeleteObject on an ARN
+used to mean expanding every user with get_user_permissions and
+searching the statements. StatementIndex compiles the statements of an
+IamAccountModel once. Each policy document is compiled a single time,
+however many principals it is attached to. The statements are indexed
+by the service prefix of their actions ('s3' for s3:DeleteObject).
+A query only tests the statements of its service, plus the few whose
+actions cannot be narrowed to one service (e.g. '*', NotAction).
+
+Only the identity policies are evaluated: managed and inline policies
+of users (including those of their groups) and roles. An explicit Deny
+wins over an Allow. Conditions, policy variables, permission
+boundaries, SCPs and resource policies are not evaluated. A statement
+with a Condition is taken to apply.
+'''
+
+import re
+import orcalib.iam_model as iam_model
+
+
+WILDCARD = '*'
+
+
+def compile_pattern(pattern, ignore_case=False):
+    '''
+    Return a function(value) that tells if the value matches an IAM
+    pattern, where '*' matches any characters and '?' a single one.
+
+    :type ignore_case: Boolean
+    :param ignore_case: Actions are case insensitive, resources are not.
+    '''
+    if pattern == WILDCARD:
+        return lambda value: True
+
+    if '*' not in pattern and '?' not in pattern:
+        if ignore_case:
+            pattern = pattern.lower()
+            return lambda value: value.lower() == pattern
+        return lambda value: value == pattern
+
+    regex = ''.join('.*' if char == '*' else '.' if char == '?'
+                    else re.escape(char) for char in pattern)
+    flags = re.DOTALL
+    if ignore_case:
+        flags |= re.IGNORECASE
+    match = re.compile(regex + r'\Z', flags).match
+    return lambda value: match(value) is not None
+
+
+def compile_patterns(patterns, ignore_case=False):
+    '''
+    Return a function(value) that tells if the value matches any of the
+    patterns.
+    '''
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    matchers = [compile_pattern(pattern, ignore_case=ignore_case)
+                for pattern in patterns]
+    if len(matchers) == 1:
+        return matchers[0]
+    return lambda value: any(matcher(value) for matcher in matchers)
+
+
+def get_action_prefix(action):
+    '''
+    Return the service prefix of an action or action pattern, lower
+    cased, or WILDCARD if the pattern can match more than one service.
+    '''
+    prefix = action.split(':', 1)[0].lower()
+    if ':' not in action or '*' in prefix or '?' in prefix:
+        return WILDCARD
+    return prefix
+
+
+def _as_list(value):
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+class CompiledStatement(object):
+    '''
+    A policy statement with its actions and resources compiled.
+    '''
+    def __init__(self, statement, source):
+        '''
+        :type statement: dict
+        :param statement: The statement, as in the policy document.
+
+        :type source: tuple
+        :param source: Identifies the policy the statement comes from, the
+            principals are looked up by it.
+        '''
+        self.statement = statement
+        self.source = source
+        self.effect = statement.get('Effect', 'Allow')
+
+        if 'NotAction' in statement:
+            self.not_action = True
+            self.actions = _as_list(statement['NotAction'])
+        else:
+            self.not_action = False
+            self.actions = _as_list(statement.get('Action', []))
+        self.match_action = compile_patterns(self.actions, ignore_case=True)
+
+        if 'NotResource' in statement:
+            self.not_resource = True
+            self.resources = _as_list(statement['NotResource'])
+        else:
+            self.not_resource = False
+            self.resources = _as_list(statement.get('Resource', WILDCARD))
+        self.match_resource = compile_patterns(self.resources)
+
+    def get_prefixes(self):
+        '''
+        Return the service prefixes the statement is indexed under.
+        '''
+        prefixes = set(get_action_prefix(action) for action in self.actions)
+        if self.not_action or WILDCARD in prefixes:
+            return set([WILDCARD])
+        return prefixes
+
+    def matches(self, action, resource=None):
+        '''
+        Tell if the statement applies to the action on the resource. If
+        resource is None, the query is for any resource: an Allow applies
+        if it covers some resource, a Deny only if it covers them all.
+        '''
+        if self.match_action(action) == self.not_action:
+            return False
+
+        if resource is None:
+            if self.effect == 'Allow':
+                return True
+            return not self.not_resource and WILDCARD in self.resources
+
+        return self.match_resource(resource) != self.not_resource
+
+
+class StatementIndex(object):
+    '''
+    The identity policy statements of an account, indexed by the service
+    prefix of their actions.
+    '''
+    def __init__(self, model):
+        '''
+        :type model: IamAccountModel
+        :param model: The account to index, see
+            AwsServiceIAM.build_account_models().
+        '''
+        self.profile_name = model.profile_name
+        self.index = {}
+        # source -> set of (principal type, name).
+        self.principals = {}
+        self._compiled = set()
+
+        for user_name, user in model.users.items():
+            principal = ('user', user_name)
+            attached = list(user.get('AttachedManagedPolicies', []))
+            for group_name in user.get('GroupList', []):
+                group = model.groups.get(group_name, {})
+                attached.extend(group.get('AttachedManagedPolicies', []))
+                for policy in group.get('GroupPolicyList', []):
+                    self._add_policy(('group', group_name,
+                                      policy['PolicyName']),
+                                     policy['PolicyDocument'], principal)
+            for policy in attached:
+                self._add_managed_policy(model, policy, principal)
+            for policy in user.get('UserPolicyList', []):
+                self._add_policy(('user', user_name, policy['PolicyName']),
+                                 policy['PolicyDocument'], principal)
+
+        for role_name, role in model.roles.items():
+            principal = ('role', role_name)
+            for policy in role.get('AttachedManagedPolicies', []):
+                self._add_managed_policy(model, policy, principal)
+            for policy in role.get('RolePolicyList', []):
+                self._add_policy(('role', role_name, policy['PolicyName']),
+                                 policy['PolicyDocument'], principal)
+
+    def _add_managed_policy(self, model, policy, principal):
+        document = model.documents.get(policy['PolicyArn'], None)
+        if document is not None:
+            self._add_policy(('policy', policy['PolicyArn']), document,
+                             principal)
+
+    def _add_policy(self, source, document, principal):
+        self.principals.setdefault(source, set()).add(principal)
+        if source in self._compiled:
+            return
+        self._compiled.add(source)
+
+        for statement in iam_model.get_statements(document):
+            compiled = CompiledStatement(statement, source)
+            for prefix in compiled.get_prefixes():
+                self.index.setdefault(prefix, []).append(compiled)
+
+    def find_statements(self, action, resource=None):
+        '''
+        Return the CompiledStatement that apply to the action on the
+        resource (any resource if None).
+        '''
+        candidates = self.index.get(get_action_prefix(action), []) + \
+            self.index.get(WILDCARD, [])
+        return [statement for statement in candidates
+                if statement.matches(action, resource)]
+
+    def who_can(self, action, resource=None):
+        '''
+        Return the sorted list of (principal type, name), e.g.
+        ('user', 'alice') or ('role', 'ci'), allowed to perform the
+        action on the resource (any resource if None).
+
+        :type action: String
+        :param action: The action, e.g. 's3:DeleteObject'.
+
+        :type resource: String
+        :param resource: The resource ARN, e.g.
+            'arn:aws:s3:::my-bucket/key'.
+        '''
+        allowed = set()
+        denied = set()
+        for statement in self.find_statements(action, resource=resource):
+            principals = self.principals[statement.source]
+            if statement.effect == 'Deny':
+                denied.update(principals)
+            else:
+                allowed.update(principals)
+
+        return sorted(allowed - denied)
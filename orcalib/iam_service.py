@@ -4,9 +4,18 @@
 import os
 import datetime
 import jinja2
-import boto3
 import botocore
-from orcalib.aws_config import AwsConfig
+from orcalib.aws_config import OrcaConfig
+from orcalib.aws_clients import build_clients
+from orcalib.inventory_cache import cached
+from orcalib.policy_cache import get_policy_cache
+import orcalib.iam_model as iam_model
+import orcalib.iam_query as iam_query
+import orcalib.fanout as fanout
+
+
+# Default number of concurrent per user calls to one account.
+DEFAULT_MAX_PER_ACCOUNT = 4
 
 
 def get_absolute_path_for_file(file_name, splitdir=None):
@@ -45,29 +54,17 @@ class AwsServiceIAM(object):
         Create a iam service client to one ore more environments by name.
         '''
         service = 'iam'
-        self.clients = {}
-
-        if profile_names is not None:
-            for profile_name in profile_names:
-                session = boto3.Session(profile_name=profile_name)
-                self.clients[profile_name] = session.client(service)
-        elif access_key_id is not None and secret_access_key is not None:
-            self.clients['default'] = boto3.client(
-                service,
-                aws_access_key_id=access_key_id,
-                aws_secret_access_key=secret_access_key)
-        else:
-            if iam_role_discover:
-                session = boto3.Session()
-                self.client['default'] = session.client(service)
-            else:
-                awsconfig = AwsConfig()
-                profiles = awsconfig.get_profiles()
-
-                for profile in profiles:
-                    session = boto3.Session(profile_name=profile)
-                    self.clients[profile] = session.client(service)
-
+        orca_config = OrcaConfig()
+        self.max_concurrency = orca_config.get_max_concurrency()
+        self.cache = None
+        self.policy_cache = get_policy_cache()
+        self.clients = build_clients(service,
+                                     profile_names=profile_names,
+                                     access_key_id=access_key_id,
+                                     secret_access_key=secret_access_key,
+                                     iam_role_discover=iam_role_discover)
+
+    @cached('users')
     def list_users(self, profile_names=None):
         '''
         Return all the users
@@ -77,40 +74,152 @@ class AwsServiceIAM(object):
             of buckets from all profiles/environments.
 
         '''
-        userlist = []
-        for profile in self.clients.keys():
-            if profile_names is not None and \
-                    profile not in profile_names:
-                continue
+        def list_profile_users(profile, region):
+            # list_users returns at most 100 users per call.
+            paginator = self.clients[profile].get_paginator('list_users')
+            users = []
+            for page in paginator.paginate():
+                users.extend(page['Users'])
+            return users
+
+        units = fanout.get_units(self.clients,
+                                 profile_names=profile_names)
+        results = fanout.run_fanout(list_profile_users, units,
+                                    max_workers=self.max_concurrency)
 
-            users = self.clients[profile].list_users()
-            for user in users['Users']:
+        userlist = []
+        for profile, _, users in fanout.collect(results, "List Users"):
+            for user in users:
                 user['profile_name'] = profile
                 userlist.append(user)
 
         return userlist
 
-    def populate_groups_in_users(self, userlist):
+    @cached('iam_details')
+    def get_account_authorization_details(self, profile_names=None):
+        '''
+        Return the get_account_authorization_details snapshot of each
+        account, as a dict of profile -> details.
+
+        :type profile_names: List of Strings
+        :param profile_names: List of profiles. If Not set then get the
+            details of all profiles/environments.
+        '''
+        units = fanout.get_units(self.clients,
+                                 profile_names=profile_names)
+        results = fanout.run_fanout(
+            lambda profile, region:
+            iam_model.get_account_authorization_details(
+                self.clients[profile]),
+            units, max_workers=self.max_concurrency)
+
+        account_details = {}
+        for profile, _, details in fanout.collect(
+                results, "Get Account Authorization Details"):
+            account_details[profile] = details
+
+        return account_details
+
+    def build_account_models(self, profile_names=None):
+        '''
+        Return an offline IamAccountModel of each account, as a dict of
+        profile -> model. Use it to answer the permissions of every user
+        of an account with a few paginated calls.
+        '''
+        account_details = self.get_account_authorization_details(
+            profile_names=profile_names)
+
+        models = {}
+        for profile, details in account_details.items():
+            models[profile] = iam_model.IamAccountModel(
+                details, profile_name=profile)
+
+        return models
+
+    def get_account_model(self, profile_name):
+        '''
+        Return the IamAccountModel of one account, None if its details
+        could not be read.
+        '''
+        models = self.build_account_models(profile_names=[profile_name])
+        return models.get(profile_name, None)
+
+    def build_statement_indexes(self, profile_names=None):
+        '''
+        Return a StatementIndex of each account, as a dict of
+        profile -> index, to answer "who can" queries, e.g.
+        index.who_can('s3:DeleteObject', 'arn:aws:s3:::bucket/key').
+        '''
+        models = self.build_account_models(profile_names=profile_names)
+
+        indexes = {}
+        for profile, model in models.items():
+            indexes[profile] = iam_query.StatementIndex(model)
+
+        return indexes
+
+    def populate_groups_in_users(self, userlist, max_per_account=None):
         '''
         Populate the user information with group membership
         '''
-        for user in userlist:
-            profile = user['profile_name']
-            groupdata = self.clients[profile].list_groups_for_user(
-                UserName=user['UserName'])
-            user['Groups'] = groupdata['Groups']
+        for _ in self.iter_groups_in_users(userlist,
+                                           max_per_account=max_per_account):
+            pass
+
+    def iter_groups_in_users(self, userlist, max_per_account=None):
+        '''
+        Populate the user information with group membership, concurrently,
+        and yield each user as soon as its Groups are set.
+
+        :type max_per_account: int
+        :param max_per_account: Max number of list_groups_for_user calls
+            in flight per profile, to stay under the IAM rate limits.
+            Defaults to DEFAULT_MAX_PER_ACCOUNT.
+        '''
+        if max_per_account is None:
+            max_per_account = DEFAULT_MAX_PER_ACCOUNT
+
+        for user, groups, error in fanout.iter_completed(
+                self.get_user_groups, userlist,
+                max_in_flight=self.max_concurrency, retries=2,
+                key=lambda user: user['profile_name'],
+                max_per_key=max_per_account):
+            if error is not None:
+                print("[%s: %s] Could not get groups for user [%s]" % \
+                    (user['profile_name'], user['UserName'], error))
+                groups = []
+            user['Groups'] = groups
+            yield user
 
     def get_user_attached_policies(self,
                                    UserName=None,
-                                   profile_name=None):
+                                   profile_name=None,
+                                   include_document=False,
+                                   offline=False):
         '''
         Return all policies attached to user or a group to which
         the user belongs.
+
+        :type include_document: Boolean
+        :param include_document: Add the DefaultVersionId and Document of
+            each policy, read through the shared policy document cache.
+
+        :type offline: Boolean
+        :param offline: Answer from the account model (see
+            build_account_models(), cached as 'iam_details') instead of
+            the per user calls.
         '''
         if UserName is None or profile_name is None:
             print("Error: Expected UserName and profile_name")
             return None
 
+        if offline:
+            model = self.get_account_model(profile_name)
+            if model is None:
+                return None
+            return model.get_user_attached_policies(
+                UserName=UserName, include_document=include_document)
+
         client = self.clients[profile_name]
 
         try:
@@ -143,48 +252,126 @@ class AwsServiceIAM(object):
             policy['type'] = 'user'
             policies.append(policy)
 
+        if include_document:
+            for policy in policies:
+                policy['DefaultVersionId'] = \
+                    self.policy_cache.get_default_version(
+                        client, policy['PolicyArn'])
+                policy['Document'] = self.policy_cache.get_document(
+                    client, policy['PolicyArn'],
+                    version_id=policy['DefaultVersionId'])
+
         return policies
 
     def get_user_permissions(self,
                              UserName=None,
-                             profile_name=None):
+                             profile_name=None,
+                             offline=False):
         '''
         Return all the permissions information for a given user
+
+        :type offline: Boolean
+        :param offline: Answer from the account model, see
+            get_user_attached_policies().
         '''
         if UserName is None or profile_name is None:
             print("Error: Expected UserName and profile_name")
             return None
 
-        client = self.clients[profile_name]
-
-        try:
-            client.get_user(UserName=UserName)
-        except botocore.exceptions.ClientError as clienterr:
-            print("[%s : %s ] User not found [%s]" % \
-                (profile_name, UserName, clienterr))
-            return None
+        if offline:
+            model = self.get_account_model(profile_name)
+            if model is None:
+                return None
+            return model.get_user_permissions(UserName=UserName)
 
+        # Checks that the user exists (get_user) first.
         policies = self.get_user_attached_policies(UserName=UserName,
-                                                   profile_name=profile_name)
+                                                   profile_name=profile_name,
+                                                   include_document=True)
+        if policies is None:
+            return None
 
         statements = []
         for policy in policies:
-            policy_version_info = client.list_policy_versions(
-                PolicyArn=policy['PolicyArn'])
-            # Now that we have version info, select only
-            # the policy that is default.
-            for version in policy_version_info['Versions']:
-                if version['IsDefaultVersion'] is True:
-                    policy_data = client.get_policy_version(
-                        PolicyArn=policy['PolicyArn'],
-                        VersionId=version['VersionId'])
-                    policy_statements = \
-                        policy_data['PolicyVersion']['Document']['Statement']
-                    for statement in policy_statements:
-                        statements.append(statement)
+            policy_statements = policy['Document']['Statement']
+            # A single statement is not always wrapped in a list.
+            if isinstance(policy_statements, dict):
+                policy_statements = [policy_statements]
+            for statement in policy_statements:
+                statements.append(statement)
 
         return statements
 
+    def get_user_index(self, profile_names=None):
+        '''
+        Return a dict of UserName -> list of the profiles the user exists
+        in, built from list_users() (and so from the inventory cache).
+        '''
+        user_index = {}
+        for user in self.list_users(profile_names=profile_names):
+            user_index.setdefault(user['UserName'], []).append(
+                user['profile_name'])
+
+        return user_index
+
+    def find_user_profiles(self, UserName, profile_names=None):
+        '''
+        Return the profiles the user exists in.
+        '''
+        user_index = self.get_user_index(profile_names=profile_names)
+        return user_index.get(UserName, [])
+
+    def _iter_user_lookup(self, lookup, UserName, profile_names=None,
+                          **kwargs):
+        profiles = self.find_user_profiles(UserName,
+                                           profile_names=profile_names)
+        if not profiles:
+            # The user may be newer than the cached user list, look in
+            # every profile (the lookups check that the user exists).
+            profiles = [profile for profile, _ in fanout.get_units(
+                self.clients, profile_names=profile_names)]
+
+        for profile, result, error in fanout.iter_completed(
+                lambda profile: lookup(UserName=UserName,
+                                       profile_name=profile, **kwargs),
+                profiles, max_in_flight=self.max_concurrency):
+            if error is not None:
+                print("[%s: %s] Lookup failed [%s]" % \
+                    (profile, UserName, error))
+                result = None
+            yield (profile, result)
+
+    def iter_user_permissions(self, UserName, profile_names=None,
+                              offline=False):
+        '''
+        Yield (profile, statements) for the profiles the user exists in,
+        looked up concurrently, as each one completes. If the user index
+        does not know the user, every profile is looked up, with None
+        for the ones the user does not exist in.
+
+        :type profile_names: List of Strings
+        :param profile_names: List of profiles. If Not set then look in
+            all profiles/environments.
+
+        :type offline: Boolean
+        :param offline: Answer from the account models, see
+            get_user_attached_policies().
+        '''
+        return self._iter_user_lookup(self.get_user_permissions, UserName,
+                                      profile_names=profile_names,
+                                      offline=offline)
+
+    def iter_user_attached_policies(self, UserName, profile_names=None,
+                                    offline=False):
+        '''
+        Yield (profile, policies) for the profiles the user exists in,
+        looked up concurrently, as each one completes.
+        '''
+        return self._iter_user_lookup(self.get_user_attached_policies,
+                                      UserName,
+                                      profile_names=profile_names,
+                                      offline=offline)
+
     def generate_new_iam_policy_document(self,
                                          resource_type,
                                          resources,
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+On disk cache of inventory results, shared across CLI runs.
+
+A sweep of every account and region takes a while, and the same command
+is often run again a minute later. The cache keeps the results of the
+service list_* calls (and of the per bucket populate calls) in a SQLite
+database under ~/.aws, with a TTL per resource type read from the
+cache_ttl section of orcaenv.yaml.
+
+The database is opened in WAL mode, with one connection per call, so
+several processes (and threads) can read and write it at the same time.
+'''
+
+import functools
+import json
+import os
+import pickle
+import sqlite3
+import time
+from orcalib.aws_config import OrcaConfig
+import orcalib.fanout as fanout
+
+
+DEFAULT_CACHE_PATH = "~/.aws/orca_cache.db"
+
+# Seconds a result stays valid when orcaenv.yaml sets no TTL for its
+# resource type (nor a 'default' one).
+DEFAULT_TTL = 300
+
+# Seconds to wait on a database locked by another process.
+LOCK_TIMEOUT = 30
+
+
+class InventoryCache(object):
+    '''
+    A key/value cache of inventory results with per resource type TTLs.
+    '''
+    def __init__(self, path=None, ttls=None, refresh=False):
+        '''
+        Open (and create if needed) the cache database.
+
+        :type path: String
+        :param path: Path of the database. Defaults to DEFAULT_CACHE_PATH.
+
+        :type ttls: dict
+        :param ttls: Resource type -> TTL in seconds. The 'default' entry
+            applies to the types not listed. Defaults to the cache_ttl
+            section of orcaenv.yaml.
+
+        :type refresh: Boolean
+        :param refresh: Ignore the cached entries, results are still
+            written to the cache.
+        '''
+        if path is None:
+            path = DEFAULT_CACHE_PATH
+        self.path = os.path.expanduser(path)
+        if ttls is None:
+            ttls = OrcaConfig().get_cache_ttl()
+        self.ttls = ttls or {}
+        self.refresh = refresh
+
+        created = not os.path.exists(self.path)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS inventory ("
+                         "key TEXT PRIMARY KEY, "
+                         "resource_type TEXT, "
+                         "expires REAL, "
+                         "value BLOB)")
+            conn.execute("CREATE INDEX IF NOT EXISTS inventory_expires "
+                         "ON inventory (expires)")
+            conn.execute("DELETE FROM inventory WHERE expires < ?",
+                         (time.time(),))
+        if created:
+            # The results describe the accounts, keep them private.
+            os.chmod(self.path, 0o600)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+
+    def get_ttl(self, resource_type):
+        '''
+        Return the TTL in seconds of a resource type.
+        '''
+        return self.ttls.get(resource_type,
+                             self.ttls.get('default', DEFAULT_TTL))
+
+    def get(self, resource_type, key):
+        '''
+        Return (True, value) for a valid cached entry, else (False, None).
+        '''
+        if self.refresh:
+            return (False, None)
+
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value FROM inventory "
+                "WHERE key = ? AND expires >= ?",
+                (self._get_key(resource_type, key), time.time())).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return (False, None)
+        return (True, pickle.loads(row[0]))
+
+    def set(self, resource_type, key, value):
+        '''
+        Save a value, valid for the TTL of its resource type.
+        '''
+        ttl = self.get_ttl(resource_type)
+        if not ttl:
+            return
+
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO inventory "
+                         "(key, resource_type, expires, value) "
+                         "VALUES (?, ?, ?, ?)",
+                         (self._get_key(resource_type, key), resource_type,
+                          time.time() + ttl, sqlite3.Binary(data)))
+
+    def get_or_set(self, resource_type, key, func):
+        '''
+        Return the cached value, or call func() and cache its result.
+        '''
+        found, value = self.get(resource_type, key)
+        if found:
+            return value
+
+        value = func()
+        self.set(resource_type, key, value)
+        return value
+
+    def invalidate(self, resource_type=None):
+        '''
+        Drop the entries of a resource type, or all of them.
+        '''
+        with self._connect() as conn:
+            if resource_type is None:
+                conn.execute("DELETE FROM inventory")
+            else:
+                conn.execute("DELETE FROM inventory WHERE resource_type = ?",
+                             (resource_type,))
+
+    @staticmethod
+    def _get_key(resource_type, key):
+        return "%s:%s" % (resource_type, key)
+
+
+def make_key(*parts):
+    '''
+    Return a string key for a list of json serializable parts.
+    '''
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+def cached(resource_type):
+    '''
+    Decorator for the list_* methods of the service classes. When the
+    service has a cache (self.cache), the result is looked up by the
+    service, method, profiles (and the credentials behind them, see
+    LazyClientMap.get_identity()) and call arguments. A result some of
+    whose units failed is not cached.
+
+    A queue keyword argument (used by the multiprocess callers) is not
+    part of the key, the result is put on it whether it was cached or not.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            queue = kwargs.pop('queue', None)
+            cache = getattr(self, 'cache', None)
+            if cache is None:
+                result = func(self, *args, **kwargs)
+            else:
+                get_identity = getattr(self.clients, 'get_identity', None)
+                identity = None
+                if get_identity is not None:
+                    identity = get_identity()
+                key = make_key(type(self).__name__, func.__name__,
+                               sorted(self.clients.keys()), identity,
+                               args, kwargs)
+                found, result = cache.get(resource_type, key)
+                if not found:
+                    failures = fanout.get_failure_count()
+                    result = func(self, *args, **kwargs)
+                    if fanout.get_failure_count() == failures:
+                        cache.set(resource_type, key, result)
+
+            if queue is not None:
+                queue.put(result)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Secondary indexes over an inventory snapshot.
+
+filter_list() scans every resource for every query. When many queries
+run against the same resource list (e.g. 'Tags.Environment' = 'prod',
+'State.Name' = 'running'), InventoryIndex keeps hash indexes on the
+requested key paths, so that equality filters resolve to sets of
+candidate positions. AND/OR combinations of filters become set
+intersections/unions, and the filters that cannot use an index (regex,
+gt/lt, keys not indexed) are only applied to the remaining candidates.
+
+The results are the same as filter_list() with the same filters. The
+index is built over a snapshot: if the resources change, build a new one.
+'''
+
+import orcalib.utils as orcautils
+
+
+class InventoryIndex(object):
+    '''
+    Hash indexes on key paths of a list of resources.
+    '''
+    def __init__(self, resources, keys=None):
+        '''
+        :type resources: List of dictionaries
+        :param resources: The resources to index, e.g. the output of a
+            list_* API.
+
+        :type keys: List of strings
+        :param keys: The filter keys to index, e.g. ['Tags.Environment'].
+        '''
+        self.resources = list(resources)
+        self.indexes = {}
+        for key in keys or []:
+            self.add_index(key)
+
+    def add_index(self, name):
+        '''
+        Build the index of a filter key. Like the 'eq' filter check, a
+        str or int value is indexed as is, and a list by its str and int
+        elements.
+        '''
+        get_value = orcautils.compile_key_path(name)
+        index = {}
+        for position, resource in enumerate(self.resources):
+            value = get_value(resource)
+            if type(value) == list:
+                for item in value:
+                    if type(item) == str or type(item) == int:
+                        index.setdefault(item, set()).add(position)
+            elif type(value) == str or type(value) == int:
+                index.setdefault(value, set()).add(position)
+
+        self.indexes[name] = index
+
+    def _lookup(self, filter):
+        '''
+        Return the positions matching the filter from the index, or None
+        if the filter cannot be answered by an index.
+        '''
+        index = self.indexes.get(filter['Name'], None)
+        if index is None:
+            return None
+        if filter.get('check', 'eq') != 'eq':
+            return None
+        filter_regex = filter.get('regex', False)
+        if filter_regex is True or filter_regex in ['True', 'true']:
+            return None
+
+        positions = set()
+        for value in filter['Values']:
+            # Dicts (matched against lists of dicts) are not indexed.
+            if type(value) == dict:
+                return None
+            try:
+                positions.update(index.get(value, ()))
+            except TypeError:
+                return None
+
+        return positions
+
+    def find(self, filters, aggr_and=False):
+        '''
+        Return the sorted positions of the resources matching the
+        filters, or None if the filters are not valid. See
+        orcalib.utils.filter_list() for the filter format.
+        '''
+        predicates = orcautils.compile_filters(filters)
+        if predicates is None:
+            return None
+        if not predicates:
+            return []
+
+        matched = None
+        scan = []
+        for filter, predicate in zip(filters, predicates):
+            positions = self._lookup(filter)
+            if positions is None:
+                scan.append(predicate)
+            elif matched is None:
+                matched = positions
+            elif aggr_and:
+                matched = matched & positions
+            else:
+                matched = matched | positions
+
+        if aggr_and:
+            if matched is None:
+                candidates = range(len(self.resources))
+            else:
+                candidates = sorted(matched)
+            return [position for position in candidates
+                    if orcautils.match_filters(scan,
+                                               self.resources[position],
+                                               aggr_and=True)]
+
+        matched = matched or set()
+        if scan:
+            for position, resource in enumerate(self.resources):
+                if position not in matched and \
+                        orcautils.match_filters(scan, resource):
+                    matched.add(position)
+
+        return sorted(matched)
+
+    def filter(self, filters, aggr_and=False):
+        '''
+        Return the resources matching the filters, in their original
+        order. Same as orcalib.utils.filter_list().
+        '''
+        positions = self.find(filters, aggr_and=aggr_and)
+        if positions is None:
+            return None
+
+        return [self.resources[position] for position in positions]
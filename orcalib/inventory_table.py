@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Columnar representation of an inventory.
+
+The list_* APIs return lists of nested dicts, and each filter_list() call
+or summary walks them one object at a time. InventoryTable extracts the
+requested key paths of the (normalized) records once into NumPy columns:
+
+    * str columns are dictionary encoded: an int32 code per row plus the
+      list of distinct strings,
+    * int columns are int64 arrays with a validity mask,
+    * anything else (lists, bools, dicts, mixed types) is kept in an
+      object array.
+
+Filters use the filter_list() syntax and semantics. On str columns a
+filter is evaluated once per distinct string, eq/gt/lt on int columns are
+vectorized, and object columns fall back to checking each value.
+'''
+
+import orcalib.utils as orcautils
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class _StrColumn(object):
+    def __init__(self, values):
+        self.categories = []
+        lookup = {}
+        self.codes = np.empty(len(values), dtype=np.int32)
+        for row, value in enumerate(values):
+            if value is None:
+                self.codes[row] = -1
+                continue
+            code = lookup.get(value, None)
+            if code is None:
+                code = len(self.categories)
+                lookup[value] = code
+                self.categories.append(value)
+            self.codes[row] = code
+
+    def mask(self, filter):
+        check_value = orcautils.compile_value_check(filter)
+        matches = np.array([check_value(category)
+                            for category in self.categories] + [False],
+                           dtype=bool)
+        # Code -1 (missing) picks the trailing False.
+        return matches[self.codes]
+
+    def factorize(self):
+        return self.codes, self.categories
+
+    def get(self, row):
+        code = self.codes[row]
+        if code < 0:
+            return None
+        return self.categories[code]
+
+
+class _IntColumn(object):
+    def __init__(self, values):
+        self.valid = np.array([value is not None for value in values],
+                              dtype=bool)
+        self.values = np.array([0 if value is None else value
+                                for value in values], dtype=np.int64)
+
+    def mask(self, filter):
+        values = filter['Values']
+        filter_check = filter.get('check', 'eq')
+        numeric = [value for value in values
+                   if isinstance(value, (int, float))]
+
+        if len(numeric) != len(values) and filter_check != 'eq':
+            # Comparing with non numbers, check value by value to keep
+            # the filter_list() behavior.
+            check_value = orcautils.compile_value_check(filter)
+            return np.array([valid and check_value(int(value))
+                             for value, valid in zip(self.values,
+                                                     self.valid)],
+                            dtype=bool)
+
+        if filter_check == 'eq':
+            matches = np.isin(self.values, numeric)
+        elif filter_check == 'gt':
+            if not numeric:
+                return np.zeros(len(self.values), dtype=bool)
+            matches = self.values > min(numeric)
+        elif filter_check == 'lt':
+            if not numeric:
+                return np.zeros(len(self.values), dtype=bool)
+            matches = self.values < max(numeric)
+        else:
+            return np.zeros(len(self.values), dtype=bool)
+
+        return matches & self.valid
+
+    def factorize(self):
+        uniques, inverse = np.unique(self.values, return_inverse=True)
+        codes = np.where(self.valid, inverse, -1)
+        return codes, uniques.tolist()
+
+    def get(self, row):
+        if not self.valid[row]:
+            return None
+        return int(self.values[row])
+
+
+class _ObjectColumn(object):
+    def __init__(self, values):
+        self.values = np.empty(len(values), dtype=object)
+        self.values[:] = values
+
+    def mask(self, filter):
+        check_value = orcautils.compile_value_check(filter)
+        return np.fromiter((value is not None and check_value(value)
+                            for value in self.values),
+                           dtype=bool, count=len(self.values))
+
+    def factorize(self):
+        labels = []
+        lookup = {}
+        codes = np.empty(len(self.values), dtype=np.int64)
+        for row, value in enumerate(self.values):
+            if value is None:
+                codes[row] = -1
+                continue
+            if type(value) == list:
+                value = tuple(value)
+            try:
+                code = lookup.get(value, None)
+            except TypeError:
+                raise ValueError("Cannot group by [%s] values" % \
+                    type(value).__name__)
+            if code is None:
+                code = len(labels)
+                lookup[value] = code
+                labels.append(value)
+            codes[row] = code
+        return codes, labels
+
+    def get(self, row):
+        return self.values[row]
+
+
+def _make_column(values):
+    types = set(type(value) for value in values if value is not None)
+    if types == set([str]):
+        return _StrColumn(values)
+    if types == set([int]):
+        try:
+            return _IntColumn(values)
+        except OverflowError:
+            pass
+    return _ObjectColumn(values)
+
+
+class InventoryTable(object):
+    '''
+    A read-only columnar table built from a list of records.
+    '''
+    def __init__(self, records, columns):
+        '''
+        :type records: List of dictionaries
+        :param records: The records, e.g. normalize.instance_records().
+
+        :type columns: List of strings
+        :param columns: The key paths to extract, in the filter key
+            syntax (e.g. 'Tags.Environment', 'Placement.AvailabilityZone').
+        '''
+        if np is None:
+            raise ImportError("numpy is required for InventoryTable "
+                              "(pip install orcalib[table])")
+
+        getters = [orcautils.compile_key_path(column) for column in columns]
+        values = [[] for _ in columns]
+        self.num_rows = 0
+        for record in records:
+            for idx, get_value in enumerate(getters):
+                values[idx].append(get_value(record))
+            self.num_rows += 1
+
+        self.columns = list(columns)
+        self._columns = {}
+        for column, column_values in zip(columns, values):
+            self._columns[column] = _make_column(column_values)
+
+    def __len__(self):
+        return self.num_rows
+
+    def _get_column(self, name):
+        column = self._columns.get(name, None)
+        if column is None:
+            raise KeyError("Column [%s] not in the table" % name)
+        return column
+
+    def mask(self, filters, aggr_and=False):
+        '''
+        Return a boolean array of the rows matching the filters, or None
+        if the filters are not valid. See orcalib.utils.filter_list() for
+        the filter format. Every filter key must be a column.
+        '''
+        if orcautils.compile_filters(filters) is None:
+            return None
+
+        result = None
+        for filter in filters:
+            matches = self._get_column(filter['Name']).mask(filter)
+            if result is None:
+                result = matches
+            elif aggr_and:
+                result = result & matches
+            else:
+                result = result | matches
+
+        if result is None:
+            result = np.zeros(self.num_rows, dtype=bool)
+        return result
+
+    def select(self, filters, aggr_and=False):
+        '''
+        Return the row numbers matching the filters.
+        '''
+        mask = self.mask(filters, aggr_and=aggr_and)
+        if mask is None:
+            return None
+        return np.nonzero(mask)[0]
+
+    def count(self, filters, aggr_and=False):
+        '''
+        Return the number of rows matching the filters.
+        '''
+        mask = self.mask(filters, aggr_and=aggr_and)
+        if mask is None:
+            return None
+        return int(np.count_nonzero(mask))
+
+    def get_values(self, column, rows=None):
+        '''
+        Return the values of a column, for all rows or the given rows.
+        '''
+        col = self._get_column(column)
+        if rows is None:
+            rows = range(self.num_rows)
+        return [col.get(row) for row in rows]
+
+    def group_count(self, columns, filters=None, aggr_and=False):
+        '''
+        Return the number of rows per distinct value of the columns.
+
+        :type columns: String or list of strings
+        :param columns: Column(s) to group by. Rows where one of them is
+            missing are not counted.
+
+        :type filters: List of filters
+        :param filters: Only count the rows matching the filters.
+
+        Returns:
+            A dict of value -> count (value is a tuple when grouping by
+            several columns), in the order the values first appear.
+        '''
+        if isinstance(columns, str):
+            columns = [columns]
+            single = True
+        else:
+            single = False
+
+        if filters is not None:
+            keep = self.mask(filters, aggr_and=aggr_and)
+            if keep is None:
+                return None
+        else:
+            keep = np.ones(self.num_rows, dtype=bool)
+
+        codes = []
+        labels = []
+        for column in columns:
+            column_codes, column_labels = \
+                self._get_column(column).factorize()
+            codes.append(column_codes)
+            labels.append(column_labels)
+
+        stacked = np.vstack(codes)
+        keep = keep & np.all(stacked >= 0, axis=0)
+        stacked = stacked[:, keep]
+        if stacked.shape[1] == 0:
+            return {}
+
+        uniques, first, counts = np.unique(stacked, axis=1,
+                                           return_index=True,
+                                           return_counts=True)
+        groups = {}
+        for idx in np.argsort(first, kind='stable'):
+            key = tuple(labels[col][uniques[col, idx]]
+                        for col in range(len(columns)))
+            if single:
+                key = key[0]
+            groups[key] = int(counts[idx])
+
+        return groups
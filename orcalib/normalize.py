@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Per resource type normalization of boto3 records.
+
+boto3 returns tags, security groups, network interfaces and ip
+permissions as lists of dicts. The functions here turn them into dicts
+keyed by name/id so they are easy to look up and to filter on (e.g. the
+'Tags.Environment' filter key). Each function normalizes one record in
+place, in a single pass, and is safe to call again on a record that is
+already normalized.
+'''
+
+
+def tags_to_dict(tags):
+    '''
+    Return a boto3 tag list ([{'Key': k, 'Value': v}, ..]) as a dict.
+    '''
+    tagsobj = {}
+    for tag in tags:
+        tagsobj[tag['Key']] = tag['Value']
+
+    return tagsobj
+
+
+def normalize_instance(instance):
+    '''
+    Flatten the Tags, SecurityGroups and NetworkInterfaces of an
+    instance into dicts.
+    '''
+    # Flatten Tags.
+    if type(instance.get('Tags', None)) == list:
+        instance['Tags'] = tags_to_dict(instance['Tags'])
+
+    # Flatten Security Groups
+    if type(instance.get('SecurityGroups', None)) == list:
+        secgroups = {}
+        for secgroup in instance['SecurityGroups']:
+            secgroups[secgroup['GroupId']] = secgroup['GroupName']
+        instance['SecurityGroups'] = secgroups
+
+    # Flatten NetworkInterfaces
+    if type(instance.get('NetworkInterfaces', None)) == list:
+        nw_intfs = {}
+        for nw_intf in instance['NetworkInterfaces']:
+            nw_intfs[nw_intf['NetworkInterfaceId']] = nw_intf
+        instance['NetworkInterfaces'] = nw_intfs
+
+    return instance
+
+
+def normalize_reservation(reservation):
+    '''
+    Normalize all the instances of a reservation (a list_vms record).
+    '''
+    for instance in reservation['Instances']:
+        normalize_instance(instance)
+
+    return reservation
+
+
+def instance_records(reservations):
+    '''
+    Return the instances of list_vms reservations as a flat list, each
+    with the profile_name and region of its reservation. The instances
+    are shallow copies, the reservations are not modified.
+    '''
+    records = []
+    for reservation in reservations:
+        for instance in reservation['Instances']:
+            record = dict(instance)
+            record['profile_name'] = reservation.get('profile_name', None)
+            record['region'] = reservation.get('region', None)
+            records.append(record)
+
+    return records
+
+
+def _ip_permissions_to_dict(permissions):
+    permissionsobj = {}
+    for permission in permissions:
+        from_port = permission.get('FromPort', "-1")
+        if type(permission['IpRanges']) == list:
+            ip_ranges = {}
+            for ip_range in permission['IpRanges']:
+                ip_ranges[ip_range['CidrIp']] = 1
+            permission['IpRanges'] = ip_ranges
+
+        permissionsobj[from_port] = permission
+
+    return permissionsobj
+
+
+def normalize_security_group(group):
+    '''
+    Turn the IpPermissions and IpPermissionsEgress lists of a security
+    group into dicts keyed by FromPort (with the IpRanges keyed by cidr),
+    and the Tags into a dict.
+    '''
+    if type(group['IpPermissions']) == list:
+        group['IpPermissions'] = \
+            _ip_permissions_to_dict(group['IpPermissions'])
+
+    if type(group['IpPermissionsEgress']) == list:
+        group['IpPermissionsEgress'] = \
+            _ip_permissions_to_dict(group['IpPermissionsEgress'])
+
+    if type(group.get('Tags', [])) == list:
+        group['Tags'] = tags_to_dict(group.get('Tags', []))
+
+    return group
+
+
+# Normalizer for each resource type, keyed by the name used by the
+# service APIs.
+NORMALIZERS = {
+    'reservation': normalize_reservation,
+    'instance': normalize_instance,
+    'security_group': normalize_security_group,
+}
+
+
+def normalize(resource_type, record):
+    '''
+    Normalize a record of the given resource type in place. Records of
+    types without a normalizer are returned as is.
+    '''
+    normalizer = NORMALIZERS.get(resource_type, None)
+    if normalizer is None:
+        return record
+
+    return normalizer(record)
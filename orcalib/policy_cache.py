@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Shared cache of IAM managed policy documents.
+
+The same managed policies are attached to many users and groups, so the
+permissions of each user used to fetch the same documents over and over.
+A policy version is immutable, so its document is cached by
+(account, PolicyArn, VersionId) and kept until evicted (least recently
+used first). Which version is the default can change, so that lookup is
+only kept for version_ttl seconds.
+
+The account is taken from the policy ARN. AWS managed policies
+(arn:aws:iam::aws:policy/...) are the same in every account and share
+one entry.
+'''
+
+import collections
+import threading
+import time
+from orcalib.singleflight import SingleFlight
+
+
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_VERSION_TTL = 300
+
+
+def get_policy_account(policy_arn):
+    '''
+    Return the account field of a policy ARN, 'aws' for the AWS managed
+    policies.
+    '''
+    parts = policy_arn.split(':')
+    if len(parts) < 6:
+        return None
+    return parts[4]
+
+
+class PolicyDocumentCache(object):
+    '''
+    A bounded LRU cache of policy documents.
+    '''
+    def __init__(self, max_size=DEFAULT_MAX_SIZE,
+                 version_ttl=DEFAULT_VERSION_TTL):
+        '''
+        :type max_size: int
+        :param max_size: Max number of documents and of default versions
+            kept.
+
+        :type version_ttl: int
+        :param version_ttl: Seconds a default version lookup is reused.
+        '''
+        self.max_size = max_size
+        self.version_ttl = version_ttl
+        self.hits = 0
+        self.misses = 0
+        self._documents = collections.OrderedDict()
+        self._versions = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def _get(self, entries, key):
+        with self._lock:
+            try:
+                value = entries[key]
+            except KeyError:
+                return False, None
+            entries.move_to_end(key)
+            return True, value
+
+    def _put(self, entries, key, value):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def get_default_version(self, client, policy_arn):
+        '''
+        Return the DefaultVersionId of the policy.
+
+        :type client: IAM client
+        :param client: The client of the account the policy is attached in.
+        '''
+        key = (get_policy_account(policy_arn), policy_arn)
+        found, entry = self._get(self._versions, key)
+        if found and time.time() - entry[1] < self.version_ttl:
+            return entry[0]
+
+        def fetch():
+            policy = client.get_policy(PolicyArn=policy_arn)
+            version_id = policy['Policy']['DefaultVersionId']
+            self._put(self._versions, key, (version_id, time.time()))
+            return version_id
+
+        return self._flight.do(('version',) + key, fetch)
+
+    def get_document(self, client, policy_arn, version_id=None):
+        '''
+        Return the policy document of a version of the policy, the
+        default version if version_id is not set.
+        '''
+        if version_id is None:
+            version_id = self.get_default_version(client, policy_arn)
+
+        key = (get_policy_account(policy_arn), policy_arn, version_id)
+        found, document = self._get(self._documents, key)
+        if found:
+            with self._lock:
+                self.hits += 1
+            return document
+
+        def fetch():
+            with self._lock:
+                self.misses += 1
+            policy_data = client.get_policy_version(PolicyArn=policy_arn,
+                                                    VersionId=version_id)
+            document = policy_data['PolicyVersion']['Document']
+            self._put(self._documents, key, document)
+            return document
+
+        return self._flight.do(key, fetch)
+
+    def clear(self):
+        '''
+        Drop all the cached documents and versions.
+        '''
+        with self._lock:
+            self._documents.clear()
+            self._versions.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._documents)
+
+
+_policy_cache = PolicyDocumentCache()
+
+
+def get_policy_cache():
+    '''
+    Return the process wide policy document cache.
+    '''
+    return _policy_cache
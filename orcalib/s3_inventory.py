@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+S3 Inventory report ingestion.
+
+Listing a bucket with tens of millions of objects is slow and costs one
+request per 1000 keys. S3 Inventory delivers the same information as a
+daily report: a manifest.json plus gzipped CSV (or Parquet) data files.
+The functions here compute the object_count, object_size and
+LastModified bucket statistics from such a report.
+
+A manifest location is either a local path or an s3://bucket/key url.
+The data files are streamed, never loaded whole, and are spread over a
+pool of worker processes since parsing is cpu bound.
+'''
+
+import csv
+import datetime
+import gzip
+import io
+import json
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+
+# Column names used by the CSV fileSchema and by the Parquet schema.
+CSV_COLUMNS = {
+    'size': 'Size',
+    'last_modified': 'LastModifiedDate',
+    'is_latest': 'IsLatest',
+    'is_delete_marker': 'IsDeleteMarker',
+}
+
+PARQUET_COLUMNS = {
+    'size': 'size',
+    'last_modified': 'last_modified_date',
+    'is_latest': 'is_latest',
+    'is_delete_marker': 'is_delete_marker',
+}
+
+
+def _split_s3_url(location):
+    path = location[len("s3://"):]
+    bucket, _, key = path.partition("/")
+    return bucket, key
+
+
+def _get_client(profile):
+    # Imported here so local reports can be read without boto3.
+    from orcalib.aws_clients import get_registry
+    return get_registry().get_client('s3', profile=profile)
+
+
+def read_manifest(location, profile=None):
+    '''
+    Read and return an inventory manifest.json.
+
+    :type location: String
+    :param location: Local path or s3://bucket/key of the manifest.
+
+    :type profile: String
+    :param profile: Profile to read the manifest from S3 with.
+    '''
+    if location.startswith("s3://"):
+        bucket, key = _split_s3_url(location)
+        data = _get_client(profile).get_object(Bucket=bucket, Key=key)
+        manifest = json.loads(data['Body'].read().decode('utf-8'))
+    else:
+        with open(location) as fp:
+            manifest = json.load(fp)
+
+    manifest['location'] = location
+    return manifest
+
+
+def get_data_file_locations(manifest, data_root=None):
+    '''
+    Return the locations of the data files of a manifest.
+
+    For a manifest read from S3 the files are read from the destination
+    bucket. For a local manifest the files are looked up under data_root
+    (the local copy of the destination bucket), next to the manifest, and
+    in the data/ directory of the inventory configuration.
+    '''
+    locations = []
+    location = manifest['location']
+    if location.startswith("s3://"):
+        # destinationBucket is an arn (arn:aws:s3:::bucketname)
+        bucket = manifest['destinationBucket'].split(":")[-1]
+        for datafile in manifest['files']:
+            locations.append("s3://%s/%s" % (bucket, datafile['key']))
+        return locations
+
+    manifest_dir = os.path.dirname(os.path.abspath(location))
+    for datafile in manifest['files']:
+        key = datafile['key']
+        candidates = []
+        if data_root is not None:
+            candidates.append(os.path.join(data_root, key))
+        candidates.append(os.path.join(manifest_dir, os.path.basename(key)))
+        candidates.append(os.path.join(manifest_dir, "..", "data",
+                                       os.path.basename(key)))
+        for candidate in candidates:
+            if os.path.exists(candidate):
+                locations.append(candidate)
+                break
+        else:
+            raise IOError("Inventory data file [%s] not found" % key)
+
+    return locations
+
+
+def _new_stats():
+    return {'object_count': 0, 'object_size': 0, 'LastModified': None}
+
+
+def merge_stats(stats, other):
+    '''
+    Merge the statistics of other into stats and return stats.
+    '''
+    stats['object_count'] += other['object_count']
+    stats['object_size'] += other['object_size']
+    if other['LastModified'] is not None and \
+            (stats['LastModified'] is None or
+             stats['LastModified'] < other['LastModified']):
+        stats['LastModified'] = other['LastModified']
+
+    return stats
+
+
+def _parse_timestamp(value):
+    # Inventory timestamps look like 2018-01-02T03:04:05.000Z
+    timestamp = datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ")
+    return timestamp.replace(tzinfo=datetime.timezone.utc)
+
+
+def _aggregate_csv(fileobj, schema):
+    '''
+    Aggregate the rows of a gzipped CSV data file.
+    '''
+    columns = [column.strip() for column in schema.split(",")]
+    size_idx = columns.index(CSV_COLUMNS['size'])
+    modified_idx = columns.index(CSV_COLUMNS['last_modified'])
+    latest_idx = None
+    marker_idx = None
+    if CSV_COLUMNS['is_latest'] in columns:
+        latest_idx = columns.index(CSV_COLUMNS['is_latest'])
+    if CSV_COLUMNS['is_delete_marker'] in columns:
+        marker_idx = columns.index(CSV_COLUMNS['is_delete_marker'])
+
+    count = 0
+    size = 0
+    # The timestamps all have the same format, so the newest one is also
+    # the largest string. Only parse the winner.
+    lastmodified = None
+    textfile = io.TextIOWrapper(gzip.GzipFile(fileobj=fileobj),
+                                encoding='utf-8', newline='')
+    for row in csv.reader(textfile):
+        # Only count the current version of objects, like a listing.
+        if latest_idx is not None and row[latest_idx] != "true":
+            continue
+        if marker_idx is not None and row[marker_idx] == "true":
+            continue
+
+        count += 1
+        if row[size_idx]:
+            size += int(row[size_idx])
+        if lastmodified is None or lastmodified < row[modified_idx]:
+            lastmodified = row[modified_idx]
+
+    stats = _new_stats()
+    stats['object_count'] = count
+    stats['object_size'] = size
+    if lastmodified:
+        stats['LastModified'] = _parse_timestamp(lastmodified)
+
+    return stats
+
+
+def _aggregate_parquet(path):
+    '''
+    Aggregate a Parquet data file, one record batch at a time.
+    '''
+    if parquet is None:
+        raise ImportError("pyarrow is required to read Parquet inventories")
+
+    parquet_file = parquet.ParquetFile(path)
+    names = parquet_file.schema_arrow.names
+    columns = [PARQUET_COLUMNS['size'], PARQUET_COLUMNS['last_modified']]
+    for column in ('is_latest', 'is_delete_marker'):
+        if PARQUET_COLUMNS[column] in names:
+            columns.append(PARQUET_COLUMNS[column])
+
+    stats = _new_stats()
+    for batch in parquet_file.iter_batches(columns=columns):
+        rows = batch.to_pydict()
+        for idx in range(batch.num_rows):
+            if PARQUET_COLUMNS['is_latest'] in rows and \
+                    rows[PARQUET_COLUMNS['is_latest']][idx] is False:
+                continue
+            if PARQUET_COLUMNS['is_delete_marker'] in rows and \
+                    rows[PARQUET_COLUMNS['is_delete_marker']][idx]:
+                continue
+
+            stats['object_count'] += 1
+            size = rows[PARQUET_COLUMNS['size']][idx]
+            if size:
+                stats['object_size'] += size
+            modified = rows[PARQUET_COLUMNS['last_modified']][idx]
+            if modified is None:
+                continue
+            if modified.tzinfo is None:
+                modified = modified.replace(tzinfo=datetime.timezone.utc)
+            if stats['LastModified'] is None or \
+                    stats['LastModified'] < modified:
+                stats['LastModified'] = modified
+
+    return stats
+
+
+def aggregate_data_file(task):
+    '''
+    Return the statistics of one inventory data file.
+
+    :type task: tuple
+    :param task: (location, file_format, file_schema, profile)
+    '''
+    location, file_format, schema, profile = task
+
+    if file_format == "Parquet":
+        if not location.startswith("s3://"):
+            return _aggregate_parquet(location)
+        # Parquet needs a seekable file, spool it to disk first.
+        bucket, key = _split_s3_url(location)
+        with tempfile.NamedTemporaryFile(suffix=".parquet") as tmpfile:
+            _get_client(profile).download_fileobj(bucket, key, tmpfile)
+            tmpfile.flush()
+            return _aggregate_parquet(tmpfile.name)
+
+    if file_format != "CSV":
+        raise ValueError("Inventory format [%s] not supported" % file_format)
+
+    if location.startswith("s3://"):
+        bucket, key = _split_s3_url(location)
+        body = _get_client(profile).get_object(Bucket=bucket, Key=key)['Body']
+        try:
+            return _aggregate_csv(body, schema)
+        finally:
+            body.close()
+
+    with open(location, 'rb') as fp:
+        return _aggregate_csv(fp, schema)
+
+
+def _init_worker():
+    # A forked worker inherits the parent's clients (used to read the
+    # manifests) and their open connections, build its own instead.
+    try:
+        from orcalib.aws_clients import get_registry
+    except ImportError:
+        return
+    get_registry().reset()
+
+
+def _aggregate_task(task):
+    # Pool worker, errors are returned so one bad file does not lose the
+    # results of the other buckets.
+    try:
+        return aggregate_data_file(task), None
+    except Exception as err:
+        return None, err
+
+
+def get_inventory_stats(manifests, profile=None, processes=None,
+                        data_root=None, errors=None):
+    '''
+    Return the object statistics of the buckets from their inventories.
+
+    :type manifests: dict
+    :param manifests: Bucket name -> manifest location.
+
+    :type profile: String
+    :param profile: Profile used to read the reports from S3.
+
+    :type processes: int
+    :param processes: Number of worker processes. Defaults to the cpu
+        count. With 1 the files are parsed in this process.
+
+    :type data_root: String
+    :param data_root: Local copy of the inventory destination bucket,
+        for local manifests.
+
+    :type errors: dict
+    :param errors: If set, a bucket whose report cannot be read is left
+        out of the result and its error saved here by bucket name.
+        Otherwise the first error is raised.
+
+    Returns:
+        A dict of bucket name -> {'object_count', 'object_size',
+        'LastModified'}. LastModified is None for an empty bucket.
+    '''
+    tasks = []
+    task_buckets = []
+    bucket_stats = {}
+    bucket_errors = {}
+    for bucket_name, location in manifests.items():
+        try:
+            manifest = read_manifest(location, profile=profile)
+            datafiles = get_data_file_locations(manifest,
+                                                data_root=data_root)
+        except Exception as err:
+            if errors is None:
+                raise
+            bucket_errors[bucket_name] = err
+            continue
+
+        bucket_stats[bucket_name] = _new_stats()
+        for datafile in datafiles:
+            tasks.append((datafile, manifest['fileFormat'],
+                          manifest.get('fileSchema', ""), profile))
+            task_buckets.append(bucket_name)
+
+    if processes is None:
+        processes = mp.cpu_count()
+    processes = max(1, min(processes, len(tasks)))
+
+    if processes == 1:
+        results = [_aggregate_task(task) for task in tasks]
+    else:
+        pool = mp.Pool(processes, initializer=_init_worker)
+        try:
+            results = pool.map(_aggregate_task, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    for bucket_name, (stats, err) in zip(task_buckets, results):
+        if err is not None:
+            if errors is None:
+                raise err
+            bucket_errors.setdefault(bucket_name, err)
+            continue
+        merge_stats(bucket_stats[bucket_name], stats)
+
+    for bucket_name, err in bucket_errors.items():
+        bucket_stats.pop(bucket_name, None)
+        errors[bucket_name] = err
+
+    return bucket_stats
+
+
+def copy_manifest_files(manifest, destination, profile=None):
+    '''
+    Download the manifest and data files of an S3 inventory under a
+    local directory, keeping the keys as relative paths. The result can
+    be read back with data_root=destination.
+    '''
+    bucket = manifest['destinationBucket'].split(":")[-1]
+    client = _get_client(profile)
+    for datafile in manifest['files']:
+        path = os.path.join(destination, datafile['key'])
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        body = client.get_object(Bucket=bucket, Key=datafile['key'])['Body']
+        with open(path, 'wb') as fp:
+            shutil.copyfileobj(body, fp)
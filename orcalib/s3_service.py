@@ -7,10 +7,13 @@ import datetime
 import jinja2
 import json
 import multiprocessing as mp
-import boto3
 import botocore
-from orcalib.aws_config import AwsConfig
 from orcalib.aws_config import OrcaConfig
+from orcalib.aws_clients import build_clients
+from orcalib.inventory_cache import cached, make_key
+import orcalib.fanout as fanout
+import orcalib.normalize as normalize
+import orcalib.s3_inventory as s3_inventory
 
 
 
@@ -36,6 +39,62 @@ def get_absolute_path_for_file(file_name, splitdir=None):
     return abs_file_path
 
 
+# Fields each populate operation sets on a bucket. These are what the
+# inventory cache keeps per bucket.
+BUCKET_FIELDS = {
+    'location': ['LocationConstraint'],
+    'policy': ['Policy'],
+    'objects': ['objects', 'objects_truncated', 'object_count',
+                'object_size', 'LastModified'],
+    'tagging': ['TagSet'],
+}
+
+# Max number of objects populate_bucket_objects keeps per bucket.
+DEFAULT_MAX_OBJECTS = 1000
+
+
+class BucketMerge(object):
+    '''
+    Merge buckets listed under several profiles, keyed by bucket name.
+
+    A bucket is a global entity, it shows up in multiple profiles if there
+    are different profiles for the same account/env with different
+    regions. The merged bucket keeps the first listing and accumulates the
+    profiles in its 'profile_name' list.
+    '''
+    def __init__(self):
+        self._buckets = {}
+
+    def add(self, bucket, profile):
+        '''
+        Add a bucket as returned by the list_buckets call of a profile.
+        '''
+        savedbucket = self._buckets.get(bucket['Name'], None)
+        if savedbucket is None:
+            bucket['profile_name'] = [profile]
+            self._buckets[bucket['Name']] = bucket
+        else:
+            savedbucket['profile_name'].append(profile)
+
+    def extend(self, bucketlist):
+        '''
+        Add buckets that already carry a 'profile_name' list, e.g. the
+        output of list_buckets for a subset of the profiles.
+        '''
+        for bucket in bucketlist:
+            savedbucket = self._buckets.get(bucket['Name'], None)
+            if savedbucket is None:
+                self._buckets[bucket['Name']] = bucket
+            else:
+                savedbucket['profile_name'].extend(bucket['profile_name'])
+
+    def buckets(self):
+        '''
+        Return the merged buckets, in the order they were first seen.
+        '''
+        return list(self._buckets.values())
+
+
 class AwsServiceS3(object):
     '''
     The class provides a simpler abstraction to the AWS boto3
@@ -50,35 +109,23 @@ class AwsServiceS3(object):
         Create a S3 service client to one ore more environments by name.
         '''
         service = 's3'
-        self.clients = {}
-
-        if profile_names is not None:
-            for profile_name in profile_names:
-                session = boto3.Session(profile_name=profile_name)
-                self.clients[profile_name] = session.client(service)
-        elif access_key_id is not None and secret_access_key is not None:
-            self.clients['default'] = boto3.client(
-                service,
-                aws_access_key_id=access_key_id,
-                aws_secret_access_key=secret_access_key)
-        else:
-            if iam_role_discover:
-                session = boto3.Session()
-                self.clients['default'] = session.client(service)
-            else:
-                awsconfig = AwsConfig()
-                profiles = awsconfig.get_profiles()
-
-                for profile in profiles:
-                    session = boto3.Session(profile_name=profile)
-                    self.clients[profile] = session.client(service)
+        orca_config = OrcaConfig()
+        self.max_concurrency = orca_config.get_max_concurrency()
+        self.cache = None
+        self.bucket_concurrency = fanout.WORKER_POOL_SIZE
+        self.bucket_retries = 2
+        self.clients = build_clients(service,
+                                     profile_names=profile_names,
+                                     access_key_id=access_key_id,
+                                     secret_access_key=secret_access_key,
+                                     iam_role_discover=iam_role_discover)
 
     def list_buckets_fast(self):
-        buckets = []
+        merge = BucketMerge()
         jobs = []
         for profile in self.clients.keys():
             queue = mp.Queue()
-            kwargs = {'profile_names': profile,
+            kwargs = {'profile_names': [profile],
                       'queue': queue}
 
             process = mp.Process(target=self.list_buckets,
@@ -86,22 +133,23 @@ class AwsServiceS3(object):
             process.start()
             jobs.append((process, queue))
 
-        count = 0
         for job in jobs:
             process = job[0]
             queue = job[1]
-            process.join()
+            # Drain the queue before joining, a child blocks on exit
+            # until its queued data has been consumed.
             profile_buckets = queue.get()
-            buckets.extend(profile_buckets)
-            count += 1
+            process.join()
+            merge.extend(profile_buckets)
 
         for job in jobs:
             process = job[0]
             if process.is_alive():
                 process.terminate()
 
-        return buckets
+        return merge.buckets()
 
+    @cached('buckets')
     def list_buckets(self, profile_names=None, queue=None):
         '''
         Return all the buckets.
@@ -111,84 +159,131 @@ class AwsServiceS3(object):
             of buckets from all profiles/environments.
 
         '''
-        bucketlist = []
-        for profile in self.clients.keys():
-            if profile_names is not None and \
-                    profile not in profile_names:
-                continue
-            try:
-                buckets = self.clients[profile].list_buckets()
-            except botocore.exceptions.ClientError as clienterr:
-                print("Client Error: [%s] [%s] " % (profile, clienterr))
-                continue
-
-
+        units = fanout.get_units(self.clients,
+                                 profile_names=profile_names)
+        results = fanout.run_fanout(
+            lambda profile, region: self.clients[profile].list_buckets(),
+            units, max_workers=self.max_concurrency)
+
+        merge = BucketMerge()
+        for profile, _, buckets in fanout.collect(results, "List Buckets"):
             for bucket in buckets['Buckets']:
-                bucket['profile_name'] = []
-                # Before we add the bucket to the list check if it
-                # already exist. Since bucket is a global entity it
-                # could show up in multiple profiles if there are
-                # different profiles for same account/env with different
-                # regions
-                bucket_present = False
-                for savedbucket in bucketlist:
-                    if bucket['Name'] == savedbucket['Name']:
-                        savedbucket['profile_name'].append(profile)
-                        bucket_present = True
-                        break
-                if bucket_present is False:
-                    bucket['profile_name'].append(profile)
-                    bucketlist.append(bucket)
-                #bucketlist.append(bucket)
+                merge.add(bucket, profile)
+
+        bucketlist = merge.buckets()
 
         if queue is not None:
             queue.put(bucketlist)
 
         return bucketlist
 
-    def populate_bucket_fast(self, oper, bucketlist):
+    def _get_populate_api(self, oper):
         '''
-        Multiprocess API to populate bucket info
+        Return the populate_bucket_* API for the operation.
         '''
-        batch_size = 10
-        jobs = []
+        if oper == "location":
+            api = self.populate_bucket_location
+        elif oper == "policy":
+            api = self.populate_bucket_policy
+        elif oper == "objects":
+            api = self.populate_bucket_objects
+        elif oper == "tagging":
+            api = self.populate_bucket_tagging
+        elif oper == "validation":
+            api = self.populate_bucket_validation
+        else:
+            api = None
 
-        for count in range(0, len(bucketlist), batch_size):
-            if oper == "location":
-                api = self.populate_bucket_location
-            elif oper == "policy":
-                api = self.populate_bucket_policy
-            elif oper == "objects":
-                api = self.populate_bucket_objects
-            elif oper == "tagging":
-                api = self.populate_bucket_tagging
-            elif oper == "validation":
-                api = self.populate_bucket_validation
-            else:
-                api = None
-                print("Invalid operation")
-                return
-            queue = mp.Queue()
-            kwargs = {'queue': queue}
-            process = mp.Process(target=api,
-                                 args=(bucketlist[count:count + batch_size],),
-                                 kwargs=kwargs)
-            process.start()
-            jobs.append((process, queue))
+        return api
 
-        newbucketlist = []
-        for job in jobs:
-            process = job[0]
-            queue = job[1]
-            templist = queue.get()
-            newbucketlist.extend(templist)
-            process.join()
+    def iter_populate_bucket(self, oper, bucketlist,
+                             max_workers=None, retries=None, **kwargs):
+        '''
+        Populate the bucket info on the shared worker pool, and yield
+        each bucket as soon as it is done (not in bucketlist order).
 
-        for job in jobs:
-            if job[0].is_alive():
-                job[0].terminate()
+        :type oper: String
+        :param oper: One of location, policy, objects, tagging, validation.
+
+        :type max_workers: int
+        :param max_workers: Max number of buckets in flight. Defaults to
+            self.bucket_concurrency.
 
-        return newbucketlist
+        :type retries: int
+        :param retries: Retries for a bucket whose populate call raised.
+            Defaults to self.bucket_retries.
+
+        Any other keyword arguments are passed on to the populate API,
+        e.g. keep_objects=False for the objects operation.
+        '''
+        api = self._get_populate_api(oper)
+        if api is None:
+            print("Invalid operation")
+            return
+
+        if oper == "validation":
+            # No AWS calls, validate the whole list in one go.
+            api(bucketlist, **kwargs)
+            for bucket in bucketlist:
+                yield bucket
+            return
+
+        if max_workers is None:
+            max_workers = self.bucket_concurrency
+        if retries is None:
+            retries = self.bucket_retries
+
+        for bucket, _, error in fanout.iter_completed(
+                lambda bucket: self._populate_one(oper, api, bucket, kwargs),
+                bucketlist,
+                max_in_flight=max_workers,
+                retries=retries):
+            if error is not None:
+                print("Failed: [populate bucket %s] [%s] [%s]" % \
+                    (oper, bucket['Name'], error))
+            yield bucket
+
+    def _populate_one(self, oper, api, bucket, kwargs):
+        '''
+        Populate a single bucket, through the inventory cache if the
+        service has one.
+        '''
+        fields = BUCKET_FIELDS.get(oper, None)
+        if self.cache is None or fields is None:
+            api([bucket], **kwargs)
+            return
+
+        resource_type = "bucket_%s" % oper
+        key = make_key(bucket['Name'], bucket['profile_name'][0], kwargs)
+        found, values = self.cache.get(resource_type, key)
+        if found:
+            bucket.update(values)
+            return
+
+        api([bucket], **kwargs)
+        values = {}
+        for field in fields:
+            if field in bucket:
+                values[field] = bucket[field]
+        self.cache.set(resource_type, key, values)
+
+    def populate_bucket_fast(self, oper, bucketlist,
+                             max_workers=None, retries=None, **kwargs):
+        '''
+        Concurrent API to populate bucket info. The buckets are updated
+        in place and returned in the same order.
+        '''
+        if self._get_populate_api(oper) is None:
+            print("Invalid operation")
+            return
+
+        for _ in self.iter_populate_bucket(oper, bucketlist,
+                                           max_workers=max_workers,
+                                           retries=retries,
+                                           **kwargs):
+            pass
+
+        return list(bucketlist)
 
     def populate_bucket_location(self, bucketlist, queue=None):
         '''
@@ -235,54 +330,74 @@ class AwsServiceS3(object):
         if queue:
             queue.put(bucketlist)
 
-    def populate_bucket_objects(self, bucketlist, queue=None):
+    def populate_bucket_objects(self, bucketlist, queue=None,
+                                keep_objects=False,
+                                max_objects=DEFAULT_MAX_OBJECTS):
         '''
-        Update the buckets information with list of objects.
+        Update the buckets information with the object count, total size
+        and last modified time, and optionally the list of objects.
+
+        The objects are listed page by page (list_objects_v2) and the
+        statistics are kept as running totals, so memory does not grow
+        with the bucket size unless the objects are retained.
 
         :type bucketlist: List of buckets (list of dictionaries)
         :param bucketlist: List of buckets
 
+        :type keep_objects: Boolean
+        :param keep_objects: Save the Key/Size/LastModified of the objects
+            in bucket['objects']. Off by default.
+
+        :type max_objects: int
+        :param max_objects: Max number of objects to save per bucket
+            (DEFAULT_MAX_OBJECTS), None for no limit. If more are found
+            bucket['objects_truncated'] is set to True.
         '''
         for bucket in bucketlist:
             profile = bucket['profile_name'][0]
+            client = self.clients[profile]
+
+            objects = []
+            truncated = False
+            objcount = 0
+            objsize = 0
+            lastmodified = None
             try:
-                objectdata = self.clients[profile].list_objects(
-                    Bucket=bucket['Name'])
-                bucket['objects'] = []
+                paginator = client.get_paginator('list_objects_v2')
+                for page in paginator.paginate(Bucket=bucket['Name']):
+                    for content in page.get('Contents', []):
+                        objcount += 1
+                        objsize = objsize + content['Size']
+                        if lastmodified is None or \
+                                lastmodified < content['LastModified']:
+                            lastmodified = content['LastModified']
+
+                        if not keep_objects:
+                            continue
+                        if max_objects is not None and \
+                                len(objects) >= max_objects:
+                            truncated = True
+                            continue
+                        objinfo = {}
+                        objinfo['Key'] = content['Key']
+                        objinfo['Size'] = content['Size']
+                        objinfo['LastModified'] = content['LastModified']
+                        objects.append(objinfo)
             except botocore.exceptions.ClientError as botoerr:
                 print("Failed: [get bucket objects ] [%s] [%s] " % \
                     (bucket['Name'], botoerr))
-                bucket['objects'] = None
-                bucket['object_count'] = 0
-                bucket['object_size'] = 0
-                bucket['LastModified'] = 0
-                continue
+                objcount = 0
 
-            try:
-                contents = objectdata['Contents']
-            except KeyError:
+            if objcount == 0:
                 bucket['objects'] = None
                 bucket['object_count'] = 0
                 bucket['object_size'] = 0
                 bucket['LastModified'] = 0
                 continue
 
-            objcount = 0
-            objsize = 0
-            lastmodified = -1
-            for content in contents:
-                objinfo = {}
-                objcount += 1
-                objsize = objsize + content['Size']
-                objinfo['Key'] = content['Key']
-                objinfo['Size'] = content['Size']
-                objinfo['LastModified'] = content['LastModified']
-                if lastmodified == -1:
-                    lastmodified = objinfo['LastModified']
-                else:
-                    if lastmodified < objinfo['LastModified']:
-                        lastmodified = objinfo['LastModified']
-                bucket['objects'].append(objinfo)
+            if keep_objects:
+                bucket['objects'] = objects
+                bucket['objects_truncated'] = truncated
             bucket['object_count'] = objcount
             bucket['object_size'] = objsize
             bucket['LastModified'] = lastmodified
@@ -290,6 +405,75 @@ class AwsServiceS3(object):
         if queue:
             queue.put(bucketlist)
 
+    def populate_bucket_inventory(self, bucketlist, manifests,
+                                  profile=None, processes=None,
+                                  data_root=None, queue=None):
+        '''
+        Update the buckets information with the object count, total size
+        and last modified time, read from their S3 Inventory reports
+        instead of listing the objects.
+
+        Buckets without a manifest, or whose report cannot be read, fall
+        back to populate_bucket_objects (without keeping the objects).
+
+        :type bucketlist: List of buckets (list of dictionaries)
+        :param bucketlist: List of buckets
+
+        :type manifests: dict
+        :param manifests: Bucket name -> manifest.json location, a local
+            path or s3://bucket/key.
+
+        :type profile: String
+        :param profile: Profile used to read the reports from S3.
+            Defaults to the first profile of the bucket.
+
+        :type processes: int
+        :param processes: Number of processes parsing the data files.
+
+        :type data_root: String
+        :param data_root: Local copy of the inventory destination bucket.
+        '''
+        # Buckets sharing a profile are read with one pool of processes.
+        fallback = []
+        profile_buckets = {}
+        for bucket in bucketlist:
+            if manifests.get(bucket['Name'], None) is None:
+                fallback.append(bucket)
+                continue
+            bucket_profile = profile
+            if bucket_profile is None:
+                bucket_profile = bucket['profile_name'][0]
+            profile_buckets.setdefault(bucket_profile, []).append(bucket)
+
+        for bucket_profile, buckets in profile_buckets.items():
+            errors = {}
+            stats = s3_inventory.get_inventory_stats(
+                dict((bucket['Name'], manifests[bucket['Name']])
+                     for bucket in buckets),
+                profile=bucket_profile, processes=processes,
+                data_root=data_root, errors=errors)
+
+            for bucket in buckets:
+                if bucket['Name'] in errors:
+                    print("Failed: [get bucket inventory ] [%s] [%s] " % \
+                        (bucket['Name'], errors[bucket['Name']]))
+                    fallback.append(bucket)
+                    continue
+
+                bucketstats = stats[bucket['Name']]
+                bucket['object_count'] = bucketstats['object_count']
+                bucket['object_size'] = bucketstats['object_size']
+                if bucketstats['object_count'] == 0:
+                    bucket['LastModified'] = 0
+                else:
+                    bucket['LastModified'] = bucketstats['LastModified']
+
+        if fallback:
+            self.populate_bucket_objects(fallback, keep_objects=False)
+
+        if queue:
+            queue.put(bucketlist)
+
     def populate_bucket_tagging(self, bucketlist, queue=None):
         '''
         Update the buckets information with tagging info.
@@ -308,9 +492,7 @@ class AwsServiceS3(object):
                 bucket['TagSet'] = None
                 continue
 
-            bucket['TagSet'] = {}
-            for tagitem in tagdata['TagSet']:
-                bucket['TagSet'][tagitem['Key']] = tagitem['Value']
+            bucket['TagSet'] = normalize.tags_to_dict(tagdata['TagSet'])
 
         if queue:
             queue.put(bucketlist)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Security group consumer graph.
+
+Links the security groups of a snapshot to the instances, ELBs and
+network interfaces that use them. The graph is built in one pass over
+each collection, into hash maps keyed by group id and instance id, so
+"unused groups", "consumers of sg-x" and "groups of instance i-y" are
+dict lookups. The inputs are not modified. The graph is built over a
+snapshot: if the resources change, build a new one.
+'''
+
+
+# Consumer kinds, named as the lists display_ec2_sec_groups used to add
+# to the group dicts.
+CONSUMER_KINDS = ['vm_list', 'elb_list', 'nwintf_list']
+
+
+def _get_group_ids(groups):
+    '''
+    Return the group ids of a SecurityGroups/Groups field: a list of ids
+    (ELB), a list of {'GroupId': ..} (ENI, raw instance) or a dict keyed
+    by group id (normalized instance).
+    '''
+    if isinstance(groups, dict):
+        return list(groups.keys())
+
+    group_ids = []
+    for group in groups or []:
+        if isinstance(group, dict):
+            group_ids.append(group['GroupId'])
+        else:
+            group_ids.append(group)
+    return group_ids
+
+
+class SecurityGroupGraph(object):
+    '''
+    Security groups and their consumers.
+    '''
+    def __init__(self, secgroups, vms=None, elbs=None, nw_interfaces=None):
+        '''
+        :type secgroups: dict or list
+        :param secgroups: The security groups, as returned by
+            list_security_groups() (dict_type or not).
+
+        :type vms: List
+        :param vms: The reservations, as returned by list_vms().
+
+        :type elbs: List
+        :param elbs: The load balancers, as returned by list_elbs().
+
+        :type nw_interfaces: List
+        :param nw_interfaces: As returned by list_network_interfaces().
+        '''
+        if isinstance(secgroups, dict):
+            self.groups = dict(secgroups)
+        else:
+            self.groups = dict((group['GroupId'], group)
+                               for group in secgroups)
+
+        # group id -> kind -> consumer ids, and instance id -> group ids.
+        self.consumers = {}
+        self.instance_groups = {}
+
+        for reservation in vms or []:
+            for instance in reservation['Instances']:
+                instance_id = instance['InstanceId']
+                group_ids = _get_group_ids(instance.get('SecurityGroups'))
+                self.instance_groups[instance_id] = group_ids
+                for group_id in group_ids:
+                    self._add_consumer(group_id, 'vm_list', instance_id)
+
+        for elb in elbs or []:
+            for group_id in _get_group_ids(elb.get('SecurityGroups')):
+                self._add_consumer(group_id, 'elb_list',
+                                   elb['LoadBalancerName'])
+
+        for nwintf in nw_interfaces or []:
+            for group_id in _get_group_ids(nwintf.get('Groups')):
+                self._add_consumer(group_id, 'nwintf_list',
+                                   nwintf['NetworkInterfaceId'])
+
+        self.unused = sorted(group_id for group_id in self.groups
+                             if group_id not in self.consumers)
+
+    def __eq__(self, other):
+        # Graphs of the same resources are equal, so a snapshot reloading
+        # an unchanged inventory keeps its version (and ETag).
+        if not isinstance(other, SecurityGroupGraph):
+            return NotImplemented
+        return self.groups == other.groups and \
+            self.consumers == other.consumers and \
+            self.instance_groups == other.instance_groups
+
+    def _add_consumer(self, group_id, kind, consumer_id):
+        consumers = self.consumers.get(group_id, None)
+        if consumers is None:
+            consumers = dict((name, []) for name in CONSUMER_KINDS)
+            self.consumers[group_id] = consumers
+        consumers[kind].append(consumer_id)
+
+    def get_unused_groups(self):
+        '''
+        Return the ids of the groups no instance, ELB or network
+        interface uses.
+        '''
+        return self.unused
+
+    def get_consumers(self, group_id):
+        '''
+        Return the consumers of a group, as a dict of vm_list, elb_list
+        and nwintf_list.
+        '''
+        consumers = self.consumers.get(group_id, None)
+        if consumers is None:
+            return dict((name, []) for name in CONSUMER_KINDS)
+        return consumers
+
+    def get_instance_groups(self, instance_id):
+        '''
+        Return the ids of the groups of an instance, None if the instance
+        is not known.
+        '''
+        return self.instance_groups.get(instance_id, None)
+
+    def get_group_view(self, group_ids=None):
+        '''
+        Return a dict of group id -> copy of the group with its non empty
+        consumer lists (vm_list, elb_list, nwintf_list) added.
+
+        :type group_ids: iterable
+        :param group_ids: Only include these groups, e.g. the ids left
+            after filter_dict().
+        '''
+        if group_ids is None:
+            group_ids = self.groups.keys()
+
+        view = {}
+        for group_id in group_ids:
+            group = dict(self.groups[group_id])
+            consumers = self.consumers.get(group_id, {})
+            for kind, consumer_ids in consumers.items():
+                if consumer_ids:
+                    group[kind] = list(consumer_ids)
+            view[group_id] = group
+
+        return view
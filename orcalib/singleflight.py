@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Duplicate call suppression.
+
+When several threads ask for the same thing at the same time (e.g.
+concurrent requests to the same orcaserver endpoint), SingleFlight runs
+the computation once. The other callers wait for it and get the same
+result, or the same exception.
+
+stream() does the same for iterators: the items are produced once, on a
+background thread, and every concurrent caller iterates over all of them
+as they arrive.
+'''
+
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Stream(object):
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.items = []
+        self.done = False
+        self.error = None
+
+
+class SingleFlight(object):
+    '''
+    Coalesce concurrent calls that share a key.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+
+    def do(self, key, func, *args, **kwargs):
+        '''
+        Return func(*args, **kwargs). If a call with the same key is
+        already in flight, wait for it and return its result instead.
+
+        :type key: hashable
+        :param key: Identifies the computation, e.g. (endpoint, profile).
+        '''
+        with self._lock:
+            call = self._calls.get(key, None)
+            if call is not None:
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as err:
+            call.error = err
+        finally:
+            # Later callers start a new computation.
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stream(self, key, func, *args, **kwargs):
+        '''
+        Return an iterator over the items of func(*args, **kwargs). If a
+        stream with the same key is already in flight, follow it instead:
+        the items it produced so far come first, then the next ones as
+        they arrive.
+
+        The items are produced on a background thread, so a caller that
+        stops iterating does not stop the stream for the others.
+        '''
+        with self._lock:
+            call = self._streams.get(key, None)
+            if call is None:
+                call = _Stream()
+                self._streams[key] = call
+                thread = threading.Thread(
+                    target=self._produce,
+                    args=(key, call, func, args, kwargs),
+                    name="singleflight-stream")
+                thread.daemon = True
+                thread.start()
+
+        return self._follow(call)
+
+    def _produce(self, key, call, func, args, kwargs):
+        try:
+            for item in func(*args, **kwargs):
+                with call.cond:
+                    call.items.append(item)
+                    call.cond.notify_all()
+        except Exception as err:
+            call.error = err
+        finally:
+            # Later callers start a new stream.
+            with self._lock:
+                del self._streams[key]
+            with call.cond:
+                call.done = True
+                call.cond.notify_all()
+
+    @staticmethod
+    def _follow(call):
+        position = 0
+        while True:
+            with call.cond:
+                while position >= len(call.items) and not call.done:
+                    call.cond.wait()
+                if position < len(call.items):
+                    item = call.items[position]
+                elif call.error is not None:
+                    raise call.error
+                else:
+                    return
+            position += 1
+            yield item
+
+    def in_flight(self, key):
+        '''
+        Return True if a call or a stream with the key is running.
+        '''
+        with self._lock:
+            return key in self._calls or key in self._streams
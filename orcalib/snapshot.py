@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+In-memory snapshots refreshed in the background.
+
+A RefreshingSnapshot holds the last result of a loader function (e.g. a
+sweep of every profile for the IAM groups) and reloads it on a background
+thread every interval seconds. Readers get the current value right away,
+along with its age, instead of waiting on the AWS calls.
+'''
+
+import collections
+import threading
+import time
+from orcalib.singleflight import SingleFlight
+
+
+# timestamp is when the value was last loaded, modified when it last
+# changed. The version only moves on when the value changes.
+SnapshotState = collections.namedtuple('SnapshotState',
+                                       ['value', 'timestamp', 'version',
+                                        'modified'])
+
+
+class RefreshingSnapshot(object):
+    '''
+    The value of loader(), kept warm by a background thread.
+    '''
+    def __init__(self, name, loader, interval=300):
+        '''
+        :type name: String
+        :param name: Name of the snapshot, used in messages.
+
+        :type loader: callable
+        :param loader: Called with no arguments to build the value.
+
+        :type interval: int
+        :param interval: Seconds between two refreshes.
+        '''
+        self.name = name
+        self.loader = loader
+        self.interval = interval
+        self.state = SnapshotState(None, None, 0, None)
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._flight = SingleFlight()
+
+    def start(self):
+        '''
+        Start the background refresh thread, if not running already. The
+        first load happens right away on that thread.
+        '''
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="snapshot-%s" % self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        '''
+        Stop the background refresh thread.
+        '''
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def refresh(self):
+        '''
+        Load the value now. If the loader raises, the previous value is
+        kept and the error saved in last_error. Concurrent refresh calls
+        (e.g. with the background thread) share a single load.
+        '''
+        self._flight.do(self.name, self._load)
+
+    def _load(self):
+        try:
+            value = self.loader()
+        except Exception as err:
+            print("Snapshot [%s] refresh failed [%s]" % (self.name, err))
+            self.last_error = err
+            # Do not leave readers waiting on a first load that failed.
+            self._loaded.set()
+            return
+
+        now = time.time()
+        with self._lock:
+            state = self.state
+            if state.version and value == state.value:
+                self.state = state._replace(timestamp=now)
+            else:
+                self.state = SnapshotState(value, now, state.version + 1,
+                                           now)
+            self.last_error = None
+        self._loaded.set()
+
+    def get(self, timeout=None):
+        '''
+        Return the current SnapshotState (value, timestamp, version,
+        modified), starting the refresh thread if needed. Before the first load
+        completes, wait for it (up to timeout seconds). The value and
+        times are None if nothing could be loaded.
+        '''
+        self.start()
+        self._loaded.wait(timeout)
+        return self.state
+
+    @property
+    def age(self):
+        '''
+        Seconds since the value was loaded, None if never loaded.
+        '''
+        return get_age(self.state)
+
+
+def get_age(state):
+    '''
+    Return the age in seconds of a SnapshotState, None if never loaded.
+    '''
+    if state.timestamp is None:
+        return None
+    return time.time() - state.timestamp
@@ -4,114 +4,146 @@
 import re
 
 
-def __get_resource_from_key(resource, filter):
-    '''
-    Return the resourceval from the filter key.
-    '''
-    key_type = 0
-    resource_val = None
-    name = filter['Name']
-    if re.match(r'.*\..*', name):
-        key_type = 1
-
-    splitname = name.split(".")
-
-    if key_type == 0:
-        resource_val = resource.get(name, None)
-    elif key_type == 1:
-        tempresource = resource
-        for key in splitname:
-            key = key.replace(":", ".")
-            try:
-                key = int(key)
-            except ValueError:
-                key = str(key)
-            tempresource = tempresource.get(key, None)
-            if tempresource is None:
-                return None
+def compile_key_path(name):
+    '''
+    Return a function that looks up a filter key in a resource.
 
-        resource_val = tempresource
+    A dotted key (e.g. 'Tags.Environment') walks the nested dicts. In the
+    parts of a dotted key ':' stands for a literal '.' and numeric parts
+    are int keys. The key is parsed once, here.
+    '''
+    if not re.match(r'.*\..*', name):
+        return lambda resource: resource.get(name, None)
+
+    keys = []
+    for key in name.split("."):
+        key = key.replace(":", ".")
+        try:
+            key = int(key)
+        except ValueError:
+            key = str(key)
+        keys.append(key)
+
+    def get_value(resource):
+        for key in keys:
+            resource = resource.get(key, None)
+            if resource is None:
+                return None
+        return resource
 
-    return resource_val
+    return get_value
 
 
-def __check_filter_match(resource_val, filter):
+def compile_value_check(filter):
     '''
-    API to validate the resources against filters.
-    It returns a list of indexes and the number of successful
-    matches
-
-    :type resource_val: type (str, int, dict, list)
-    :param resource_val: Value of a matched key in the resource
-
-    :type values: list
-    :param values: a list of values to match against.
+    Return a function that checks a resource value against the
+    Values/check/regex of a filter.
     '''
-
     values = filter['Values']
     filter_check = filter.get('check', 'eq')
     filter_regex = filter.get('regex', False)
 
-    # If the type is of 'str' or 'int'
-    if type(resource_val) == str:
-        if filter_regex is True or filter_regex in ['True', 'true']:
-            for val in values:
-                search_pattern = r"%s" % val
-                if re.match(search_pattern, resource_val) is not None:
-                    return True
-        else:
-            if resource_val in values:
-                return True
-    elif type(resource_val) == int:
+    try:
+        valueset = frozenset(values)
+    except TypeError:
+        # Unhashable values (e.g. dicts to match a list of dicts).
+        valueset = values
+
+    patterns = None
+    if filter_regex is True or filter_regex in ['True', 'true']:
+        patterns = [re.compile(r"%s" % val) for val in values]
+
+    def check_scalar(val):
         if filter_check == "eq":
-            if resource_val in values:
-                return True
+            return val in valueset
         elif filter_check == "gt":
-            for val in values:
-                if resource_val > val:
+            for value in values:
+                if val > value:
                     return True
         elif filter_check == "lt":
-            for val in values:
-                if resource_val < val:
+            for value in values:
+                if val < value:
                     return True
-    if type(resource_val) == list:
-        for resval in resource_val:
-            if type(resval) == str or \
-                    type(resval) == int:
-                if filter_check == "eq":
-                    if resval in values:
+        return False
+
+    def check_dict(resval):
+        # For matching a list of dicts, the filter must have a
+        # list of dicts as well.
+        for value in values:
+            for key, val in resval.items():
+                if key in value and value[key] == val:
+                    return True
+        return False
+
+    def check_value(resource_val):
+        # Exact type checks: a bool is not treated as an int.
+        if type(resource_val) == str:
+            if patterns is not None:
+                for pattern in patterns:
+                    if pattern.match(resource_val) is not None:
+                        return True
+                return False
+            return resource_val in valueset
+        elif type(resource_val) == int:
+            return check_scalar(resource_val)
+        elif type(resource_val) == list:
+            for resval in resource_val:
+                if type(resval) == str or type(resval) == int:
+                    if check_scalar(resval):
                         return True
-                elif filter_check == "gt":
-                    for val in values:
-                        if resval > val:
-                            return True
-                elif filter_check == "lt":
-                    for val in values:
-                        if resval < val:
-                            return True
-
-            elif type(resval) == dict:
-                print("Resource val is a dict: ", resval)
-                print("values are: ", values)
-                # For matching a list of dicts, the filter must have a
-                # list of dicts as well.
-                for value in values:
-                    for resitem in resval.items():
-                        for valitem in value.items():
-                            if resitem[0] == valitem[0] and \
-                                    resitem[1] == valitem[1]:
-                                print("Matched: %s %s %s %s" % \
-                                    (valitem[0], resitem[0],
-                                     valitem[1], resitem[1]))
-                                return True
-                            else:
-                                print("Did not match %s %s %s %s" % \
-                                    (valitem[0], resitem[0],
-                                     valitem[1], resitem[1]))
-
-                    #for key in value.keys():
-                    #    print "Key: ", key, value[key]
+                elif type(resval) == dict:
+                    if check_dict(resval):
+                        return True
+        return False
+
+    return check_value
+
+
+def compile_filter(filter):
+    '''
+    Return a predicate, predicate(resource) -> Boolean, for a filter.
+
+    The key path is parsed, the regexes compiled and the 'eq' values put
+    in a set once, so the predicate can be applied to many resources.
+    '''
+    get_value = compile_key_path(filter['Name'])
+    check_value = compile_value_check(filter)
+
+    def predicate(resource):
+        resource_val = get_value(resource)
+        if resource_val is None:
+            return False
+        return check_value(resource_val)
+
+    return predicate
 
+
+def compile_filters(filters):
+    '''
+    Return the list of predicates for a list of filters, or None if the
+    filters are not valid. See filter_list() for the filter format.
+    '''
+    if not __validate_input_filters(filters):
+        return None
+
+    return [compile_filter(filter) for filter in filters]
+
+
+def match_filters(predicates, resource, aggr_and=False):
+    '''
+    Return True if the resource matches all (aggr_and) or any of the
+    compiled filters. With no filters, that is True with aggr_and and
+    False without; the filter_* APIs match nothing for no filters.
+    '''
+    if aggr_and:
+        for predicate in predicates:
+            if not predicate(resource):
+                return False
+        return True
+
+    for predicate in predicates:
+        if predicate(resource):
+            return True
     return False
 
 
@@ -161,37 +193,31 @@ def filter_list(resource_list, filters, aggr_and=False):
         None: If any validation fails.
         filtered_list: A list of filtered resource upon success.
     '''
-    # Validate input.
-    if not __validate_input_filters(filters):
+    positions = filter_list_ids(resource_list, filters, aggr_and=aggr_and)
+    if positions is None:
         return None
 
-    filtered_idxes = {}
-    idx = 0
-
-    for resource in resource_list:
-        for filter in filters:
-            resource_val = __get_resource_from_key(resource, filter)
-
-            if resource_val is None:
-                    continue
+    return [resource_list[idx] for idx in positions]
 
-            if __check_filter_match(resource_val, filter):
-                if filtered_idxes.get(idx, None) is None:
-                    filtered_idxes[idx] = 1
-                else:
-                    filtered_idxes[idx] += 1
-        idx += 1
 
-    filtered_list = []
-    for idx in filtered_idxes.keys():
-        if aggr_and:
-            if filtered_idxes[idx] == len(filters):
-                filtered_list.append(resource_list[idx])
-        else:
-            filtered_list.append(resource_list[idx])
+def filter_list_ids(resource_list, filters, aggr_and=False):
+    '''
+    Same as filter_list(), but return the positions of the matching
+    resources in resource_list instead of the resources.
+    '''
+    predicates = compile_filters(filters)
+    if predicates is None:
+        return None
+    if not predicates:
+        # No filter matches nothing, with AND or OR aggregation.
+        return []
 
+    positions = []
+    for idx, resource in enumerate(resource_list):
+        if match_filters(predicates, resource, aggr_and=aggr_and):
+            positions.append(idx)
 
-    return filtered_list
+    return positions
 
 
 def filter_dict(resource_dict, filters, aggr_and=False):
@@ -215,33 +241,37 @@ def filter_dict(resource_dict, filters, aggr_and=False):
         you have more than one key/value pairs in the filters.
         Default behavior will be OR. Meaning if either of the key/value
         pair matches it is added to the filtered list.
-    '''
 
-    if not __validate_input_filters(filters):
+    The returned dictionary holds the same resource objects as
+    resource_dict. They are neither copied nor modified, so the same
+    (e.g. cached) inventory can be filtered again and again.
+    '''
+    resourceids = filter_dict_ids(resource_dict, filters, aggr_and=aggr_and)
+    if resourceids is None:
         return None
 
     filtered_resource = {}
+    for resourceid in resourceids:
+        filtered_resource[resourceid] = resource_dict[resourceid]
 
-    for resourceid in resource_dict.keys():
-        resource = resource_dict[resourceid]
-        for filter in filters:
-            resource_val = __get_resource_from_key(resource, filter)
-
-            if resource_val is None:
-                continue
-
-            if __check_filter_match(resource_val, filter):
-                if filtered_resource.get(resourceid, None) is None:
-                    filtered_resource[resourceid] = resource
-                    filtered_resource[resourceid]['filter_cnt'] = 1
-                else:
-                    filtered_resource[resourceid]['filter_cnt'] += 1
+    return filtered_resource
 
-    for resourceid in filtered_resource.keys():
-        if aggr_and:
-            if filtered_resource[resourceid]['filter_cnt'] != len(filters):
-                del filtered_resource[resourceid]
 
-    return filtered_resource
+def filter_dict_ids(resource_dict, filters, aggr_and=False):
+    '''
+    Same as filter_dict(), but return the list of the matching resource
+    ids (keys of resource_dict) instead of a dictionary.
+    '''
+    predicates = compile_filters(filters)
+    if predicates is None:
+        return None
+    if not predicates:
+        # No filter matches nothing, with AND or OR aggregation.
+        return []
 
+    resourceids = []
+    for resourceid, resource in resource_dict.items():
+        if match_filters(predicates, resource, aggr_and=aggr_and):
+            resourceids.append(resourceid)
 
+    return resourceids
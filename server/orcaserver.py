@@ -11,13 +11,36 @@ can invoke the rest apis to get the correct parameter values rather than
 hardcoded values.
 '''
 
+import base64
+import binascii
+import bisect
+import datetime
+import email.utils
+import gzip
+import json
+import os
+import re
+import zlib
 from flask import Flask
+from flask import Response
 from flask import jsonify
+from flask import request
+from flask import stream_with_context
 import orcalib.aws_config as aws_config
-import boto3
+import orcalib.aws_clients as aws_clients
+import orcalib.fanout as fanout
+import orcalib.snapshot as snapshot
+from orcalib.singleflight import SingleFlight
+from orcalib.ec2_service import AwsServiceEC2
+from orcalib.elb_service import AwsServiceELB
+from orcalib.secgroup_graph import SecurityGroupGraph
 import botocore
 
 app = Flask(__name__)
+registry = aws_clients.get_registry()
+
+# Concurrent identical requests share one backend computation.
+flight = SingleFlight()
 
 
 @app.route("/")
@@ -32,8 +55,7 @@ def index():
 
 
 
-@app.route("/rundeck/iam/groups/")
-def rundeck_list_groups():
+def load_iam_groups():
     '''
     Return the list of groups from all available profiles
     '''
@@ -42,25 +64,23 @@ def rundeck_list_groups():
     awsconfig = aws_config.AwsConfig()
     profiles = awsconfig.get_profiles()
     for profile in profiles:
-        session = boto3.Session(profile_name=profile)
-        iamclient = session.client('iam')
+        iamclient = registry.get_client('iam', profile=profile)
 
         try:
             groupinfo = iamclient.list_groups()
         except botocore.exceptions.ClientError:
-            groupinfo['Groups'] = []
+            groupinfo = {'Groups': []}
 
         for group in groupinfo['Groups']:
             grouptext = "(%s) %s" % (profile, group['GroupName'])
             resp_obj[grouptext] = group['GroupName']
 
-    return jsonify(resp_obj)
+    return resp_obj
 
 
-@app.route("/rundeck/iam/policies/")
-def rundeck_list_iam_policies():
+def load_iam_policies():
     '''
-    Return the list of profiles from all available profiles
+    Return the list of policies from all available profiles
     '''
     resp_obj = {}
 
@@ -68,63 +88,340 @@ def rundeck_list_iam_policies():
     profiles = awsconfig.get_profiles()
 
     for profile in profiles:
-        session = boto3.Session(profile_name=profile)
-        iamclient = session.client('iam')
+        iamclient = registry.get_client('iam', profile=profile)
 
         try:
             policyinfo = iamclient.list_policies()
         except botocore.exceptions.ClientError:
-            policyinfo['Policies'] = []
+            policyinfo = {'Policies': []}
 
         for policy in policyinfo['Policies']:
             policytext = "(%s) %s" % (profile, policy['PolicyName'])
             resp_obj[policytext] = policy['PolicyName']
 
-    return jsonify(resp_obj)
+    return resp_obj
 
 
-@app.route("/rundeck/resources/")
-def rundeck_list_resources():
-    '''
-    Return a list of S3 and EC2 Resources from all available profiles
+def load_resource_unit(unit):
     '''
-    resp_obj = {}
+    Return the S3 buckets of a profile, or the EC2 instances of a
+    profile/region, as a dict of label -> name.
 
-    awsconfig = aws_config.AwsConfig()
-    profiles = awsconfig.get_profiles()
-
-    # Populate s3 buckets.
-    for profile in profiles:
-        session = boto3.Session(profile_name=profile)
-        s3client = session.client('s3')
+    :type unit: tuple
+    :param unit: (service, profile, region, ec2service)
+    '''
+    service, profile, region, ec2service = unit
+    resources = {}
+    if service == 's3':
+        s3client = registry.get_client('s3', profile=profile)
 
         try:
             s3info = s3client.list_buckets()
         except botocore.exceptions.ClientError:
-            s3info['Buckets'] = []
+            s3info = {'Buckets': []}
 
         for bucket in s3info['Buckets']:
             bucket_text = "s3: (%s) %s" % (profile, bucket['Name'])
-            resp_obj[bucket_text] = bucket['Name']
+            resources[bucket_text] = bucket['Name']
+        return resources
 
-    # Populate ec2 instances.
-    for profile in profiles:
-        session = boto3.Session(profile_name=profile)
-        ec2client = session.client('ec2', region_name="us-east-1")
+    vms = ec2service.list_vms(profile_names=[profile], regions=[region])
+    for reservation in vms:
+        for instance in reservation['Instances']:
+            instance_text = "ec2: (%s) %s" % \
+                (profile, instance['InstanceId'])
+            resources[instance_text] = instance['InstanceId']
 
-        try:
-            ec2info = ec2client.describe_instances()
-        except botocore.exceptions.ClientError:
-            ec2info['Instances'] = []
+    return resources
 
-        for reservation in ec2info['Reservations']:
-            for instance in reservation['Instances']:
-                instance_text = "ec2: (%s) %s" % \
-                    (profile, instance['InstanceId'])
-                resp_obj[instance_text] = instance['InstanceId']
 
-    return jsonify(resp_obj)
+def iter_resources():
+    '''
+    Sweep the S3 buckets of all available profiles and the EC2 instances
+    of all profiles in all the configured regions, concurrently. Yield
+    (service, profile, region, resources) as each one completes.
+    '''
+    awsconfig = aws_config.AwsConfig()
+    profiles = awsconfig.get_profiles()
+    ec2service = AwsServiceEC2(profile_names=profiles)
+
+    units = [('s3', profile, None, ec2service) for profile in profiles]
+    for profile, region in fanout.get_units(ec2service.clients,
+                                            ec2service.regions):
+        units.append(('ec2', profile, region, ec2service))
+
+    for unit, resources, error in fanout.iter_completed(
+            load_resource_unit, units,
+            max_in_flight=ec2service.max_concurrency):
+        service, profile, region, _ = unit
+        if error is not None:
+            print("List %s resources Failed: Account: %s, Region: %s [%s]" % \
+                (service, profile, region, error))
+            resources = {}
+        yield (service, profile, region, resources)
+
+
+def load_resources():
+    '''
+    Return a list of S3 and EC2 Resources from all available profiles
+    '''
+    resp_obj = {}
+    for _, _, _, resources in iter_resources():
+        resp_obj.update(resources)
+
+    return resp_obj
+
+
+def load_secgroup_graph():
+    '''
+    Return the SecurityGroupGraph of all available profiles and regions.
+    '''
+    ec2service = AwsServiceEC2()
+    elbservice = AwsServiceELB()
+    return SecurityGroupGraph(
+        ec2service.list_security_groups(dict_type=True),
+        vms=ec2service.list_vms(),
+        elbs=elbservice.list_elbs(),
+        nw_interfaces=ec2service.list_network_interfaces())
+
+
+# The rundeck endpoints are served from memory. Each snapshot is reloaded
+# by a background thread every SNAPSHOT_INTERVAL seconds.
+SNAPSHOT_INTERVAL = 300
+
+snapshots = {
+    'iam_groups': snapshot.RefreshingSnapshot(
+        'iam_groups', load_iam_groups, interval=SNAPSHOT_INTERVAL),
+    'iam_policies': snapshot.RefreshingSnapshot(
+        'iam_policies', load_iam_policies, interval=SNAPSHOT_INTERVAL),
+    'resources': snapshot.RefreshingSnapshot(
+        'resources', load_resources, interval=SNAPSHOT_INTERVAL),
+    'secgroup_graph': snapshot.RefreshingSnapshot(
+        'secgroup_graph', load_secgroup_graph, interval=SNAPSHOT_INTERVAL),
+}
+
+
+# Bodies below this size are not worth compressing.
+MIN_COMPRESS_SIZE = 1024
+
+# Per snapshot: the version the keys/bodies were rendered for, the sorted
+# keys (for pagination) and the encoded full bodies.
+rendered = {}
+
+
+def get_rendered(name, state):
+    '''
+    Return the render cache of a snapshot version.
+    '''
+    cache = rendered.get(name, None)
+    if cache is None or cache['version'] != state.version:
+        cache = {'version': state.version,
+                 'keys': sorted(state.value.keys()),
+                 'bodies': {}}
+        rendered[name] = cache
+    return cache
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    '''
+    Return the key encoded in a cursor. Raises ValueError (or
+    binascii.Error) if it is not a valid cursor.
+    '''
+    # urlsafe_b64decode() silently drops the characters outside of the
+    # alphabet, check them first.
+    if re.match(r'[A-Za-z0-9_-]+={0,2}\Z', cursor) is None:
+        raise ValueError("Invalid cursor")
+    return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+
+
+def get_int_arg(name):
+    '''
+    Return a non negative int query argument, None if not set. Raises
+    ValueError if it is not a non negative int.
+    '''
+    value = request.args.get(name, None)
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise ValueError("Invalid %s" % name)
+    return int(value)
+
+
+def get_page(keys):
+    '''
+    Return (start, end) of the page of keys selected by the limit, offset
+    and cursor query arguments, or None to return everything. The cursor
+    is the X-Next-Cursor of the previous page, and takes precedence over
+    offset.
+    '''
+    limit = get_int_arg('limit')
+    offset = get_int_arg('offset')
+    cursor = request.args.get('cursor', None)
+    if limit is None and offset is None and cursor is None:
+        return None
+
+    if cursor is not None:
+        start = bisect.bisect_right(keys, decode_cursor(cursor))
+    else:
+        start = offset or 0
+    end = len(keys)
+    if limit is not None:
+        end = min(end, start + limit)
+    return (start, end)
+
+
+def get_encoding():
+    '''
+    Return the content encoding to use: gzip, deflate or identity.
+    '''
+    encoding = request.accept_encodings.best_match(['gzip', 'deflate',
+                                                    'identity'])
+    if encoding is None:
+        return 'identity'
+    return encoding
+
+
+def encode_body(body, encoding):
+    if len(body) < MIN_COMPRESS_SIZE or encoding == 'identity':
+        return body, 'identity'
+    if encoding == 'gzip':
+        return gzip.compress(body), 'gzip'
+    return zlib.compress(body), 'deflate'
+
+
+def snapshot_response(name):
+    '''
+    Return the response for a snapshot, with its age (seconds) in the
+    X-Snapshot-Age header and its load time in X-Snapshot-Time.
+
+    The ETag and Last-Modified follow the snapshot version, so polls
+    with If-None-Match/If-Modified-Since get a 304 until the content
+    changes. The body is gzip/deflate encoded if the client accepts it.
+    limit/offset/cursor query arguments return a page of the (sorted)
+    keys, with the cursor of the next page in X-Next-Cursor.
+    '''
+    state = snapshots[name].get()
+    if state.value is None:
+        resp = jsonify({'status': 'FAIL'})
+        resp.status_code = 503
+        return resp
+
+    cache = get_rendered(name, state)
+    try:
+        page = get_page(cache['keys'])
+    except (ValueError, TypeError, binascii.Error):
+        resp = jsonify({'status': 'FAIL',
+                        'error': 'Invalid cursor, limit or offset'})
+        resp.status_code = 400
+        return resp
+    encoding = get_encoding()
+
+    etag = "%s-%d-%d" % (name, state.version, int(state.modified * 1000))
+    if page is not None:
+        etag = "%s-%d-%d" % (etag, page[0], page[1])
+    etag = "%s-%s" % (etag, encoding)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        not_modified = since is not None and \
+            int(state.modified) <= since.timestamp()
+
+    if not_modified:
+        resp = Response(status=304)
+    elif page is None:
+        bodies = cache['bodies']
+        if encoding not in bodies:
+            bodies[encoding] = encode_body(
+                json.dumps(state.value, sort_keys=True).encode('utf-8'),
+                encoding)
+        body, content_encoding = bodies[encoding]
+        resp = Response(body, mimetype="application/json")
+    else:
+        keys = cache['keys'][page[0]:page[1]]
+        value = dict((key, state.value[key]) for key in keys)
+        body, content_encoding = encode_body(
+            json.dumps(value, sort_keys=True).encode('utf-8'), encoding)
+        resp = Response(body, mimetype="application/json")
+        if keys and page[1] < len(cache['keys']):
+            resp.headers['X-Next-Cursor'] = encode_cursor(keys[-1])
+
+    if not not_modified and content_encoding != 'identity':
+        resp.headers['Content-Encoding'] = content_encoding
+    resp.headers['Vary'] = 'Accept-Encoding'
+    resp.set_etag(etag)
+    resp.last_modified = datetime.datetime.fromtimestamp(
+        int(state.modified), datetime.timezone.utc)
+    resp.headers['X-Snapshot-Age'] = "%d" % snapshot.get_age(state)
+    resp.headers['X-Snapshot-Time'] = \
+        email.utils.formatdate(state.timestamp, usegmt=True)
+    return resp
+
+
+@app.route("/rundeck/iam/groups/")
+def rundeck_list_groups():
+    '''
+    Return the list of groups from all available profiles
+    '''
+    return snapshot_response('iam_groups')
+
+
+@app.route("/rundeck/iam/policies/")
+def rundeck_list_iam_policies():
+    '''
+    Return the list of profiles from all available profiles
+    '''
+    return snapshot_response('iam_policies')
+
+
+@app.route("/rundeck/resources/")
+def rundeck_list_resources():
+    '''
+    Return a list of S3 and EC2 Resources from all available profiles
+
+    With ?format=ndjson, sweep now and stream one JSON line per profile
+    (S3) and per profile/region (EC2) as soon as each one completes:
+    {"service": .., "profile": .., "region": .., "resources": {..}}
+    Concurrent streaming requests share one sweep.
+    '''
+    if request.args.get('format', None) == 'ndjson':
+        def generate():
+            for service, profile, region, resources in \
+                    flight.stream('resources', iter_resources):
+                yield json.dumps({'service': service,
+                                  'profile': profile,
+                                  'region': region,
+                                  'resources': resources},
+                                 sort_keys=True) + "\n"
+
+        return Response(stream_with_context(generate()),
+                        mimetype="application/x-ndjson")
+
+    return snapshot_response('resources')
+
+
+
+def load_profile_groups(profile):
+    '''
+    Return the group names of a profile.
+    '''
+    iamclient = registry.get_client('iam', profile=profile)
+
+    try:
+        groupinfo = iamclient.list_groups()
+    except botocore.exceptions.ClientError:
+        groupinfo = {'Groups': []}
+
+    groups = []
+    for group in groupinfo['Groups']:
+        groups.append(group['GroupName'])
 
+    return groups
 
 
 @app.route("/<profile>/iam/groups/")
@@ -146,25 +443,85 @@ def list_groups(profile):
         resp_obj['status'] = 'FAIL'
         return jsonify(resp_obj)
 
-    session = boto3.Session(profile_name=profile)
-    iamclient = session.client('iam')
+    resp_obj['groups'] = flight.do(('iam_groups', profile),
+                                   load_profile_groups, profile)
 
-    try:
-        groupinfo = iamclient.list_groups()
-    except botocore.exceptions.ClientError:
-        groupinfo['Groups'] = []
+    return jsonify(resp_obj)
 
-    groups = []
-    for group in groupinfo['Groups']:
-        groups.append(group['GroupName'])
 
-    resp_obj['groups'] = groups
 
-    return jsonify(resp_obj)
+def graph_response(query):
+    '''
+    Return the JSON response of query(graph) on the security group graph
+    snapshot. query returns the dict to add to the response, or None if
+    what it looked for does not exist.
+    '''
+    resp_obj = {}
+    resp_obj['status'] = 'OK'
+
+    state = snapshots['secgroup_graph'].get()
+    if state.value is None:
+        resp_obj['status'] = 'FAIL'
+        resp = jsonify(resp_obj)
+        resp.status_code = 503
+        return resp
+
+    result = query(state.value)
+    if result is None:
+        resp_obj['status'] = 'FAIL'
+        resp = jsonify(resp_obj)
+        resp.status_code = 404
+        return resp
+
+    resp_obj.update(result)
+    resp = jsonify(resp_obj)
+    resp.headers['X-Snapshot-Age'] = "%d" % snapshot.get_age(state)
+    return resp
+
+
+@app.route("/ec2/security_groups/unused/")
+def list_unused_security_groups():
+    '''
+    Return the security groups not used by any instance, ELB or
+    network interface.
+    '''
+    return graph_response(
+        lambda graph: {'groups': graph.get_unused_groups()})
+
+
+@app.route("/ec2/security_groups/<group_id>/consumers/")
+def list_security_group_consumers(group_id):
+    '''
+    Return the instances, ELBs and network interfaces using a group.
+    '''
+    def query(graph):
+        if group_id not in graph.groups:
+            return None
+        return {'consumers': graph.get_consumers(group_id)}
+
+    return graph_response(query)
+
+
+@app.route("/ec2/instances/<instance_id>/security_groups/")
+def list_instance_security_groups(instance_id):
+    '''
+    Return the security groups of an instance.
+    '''
+    def query(graph):
+        group_ids = graph.get_instance_groups(instance_id)
+        if group_ids is None:
+            return None
+        return {'groups': group_ids}
 
+    return graph_response(query)
 
 
 def main():
+    # Warm up the snapshots before the first request. In debug mode only
+    # the reloader child (WERKZEUG_RUN_MAIN) serves requests.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        for name in snapshots.keys():
+            snapshots[name].start()
     app.run(debug=True, host="0.0.0.0", port=5001)
 
 
@@ -13,6 +13,10 @@ setup(
 
     packages=find_packages(exclude=('tests*','scripts','server','cliclient')),
     install_requires=[],
+    extras_require={
+        # orcalib.inventory_table (orcacli ec2 --summary).
+        'table': ['numpy'],
+    },
     # Available classifiers: https://goo.gl/G1iJ2B
     classifiers=[
         'Environment :: Console',
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from orcalib.aws_clients import get_registry
+from orcalib.async_aws_service import AsyncAwsService, merge_results, \
+    check_not_iterator
+
+
+PROFILES = ['dev', 'prod']
+REGIONS = ['us-east-1', 'us-west-2']
+
+
+class FakeAws(object):
+    '''
+    The AWS side of the clients: records the describe calls as they
+    start, the first ones finishing last.
+    '''
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.started = []
+        self.lock = threading.Lock()
+
+    def describe(self, unit):
+        with self.lock:
+            self.started.append(unit)
+            position = len(self.started)
+        time.sleep(self.delay or 0.05 / position)
+        return {'Reservations': [{'Instances': [{'InstanceId': unit}]}]}
+
+
+class FakePaginator(object):
+    def __init__(self, aws, unit):
+        self.aws = aws
+        self.unit = unit
+
+    def paginate(self):
+        yield self.aws.describe(self.unit)
+
+
+class FakeClient(object):
+    def __init__(self, aws, profile, region):
+        self.aws = aws
+        self.unit = "%s:%s" % (profile, region)
+        self.profile = profile
+
+    def can_paginate(self, operation):
+        return True
+
+    def get_paginator(self, operation):
+        return FakePaginator(self.aws, self.unit)
+
+    def list_buckets(self):
+        return {'Buckets': [{'Name': 'shared'},
+                            {'Name': "%s-logs" % self.profile}]}
+
+
+class AsyncAwsServiceUt(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.home, ".aws"))
+        with open(os.path.join(self.home, ".aws/orcaenv.yaml"), "w") as fp:
+            fp.write("max_concurrency: 4\nregions: [%s]\n" %
+                     ", ".join(REGIONS))
+        with open(os.path.join(self.home, ".aws/credentials"), "w") as fp:
+            for profile in PROFILES:
+                fp.write("[%s]\n" % profile)
+        self.saved = (os.environ.get("HOME"), get_registry().get_client)
+        os.environ["HOME"] = self.home
+        self.aws = FakeAws()
+        get_registry().get_client = \
+            lambda service, profile=None, region=None: \
+            FakeClient(self.aws, profile, region)
+
+    def tearDown(self):
+        home, get_registry().get_client = self.saved
+        os.environ["HOME"] = home
+        shutil.rmtree(self.home)
+
+    def get_vm_ids(self, vmlist):
+        return [vm['Instances'][0]['InstanceId'] for vm in vmlist]
+
+    def test_split_merge(self):
+        print("Test: split calls are merged in unit order")
+        ec2 = AsyncAwsService('ec2')
+        try:
+            self.assertEqual(self.get_vm_ids(asyncio.run(ec2.list_vms())),
+                             ['dev:us-east-1', 'dev:us-west-2',
+                              'prod:us-east-1', 'prod:us-west-2'])
+            self.assertEqual(
+                self.get_vm_ids(asyncio.run(ec2.list_vms(
+                    profile_names=['prod'], regions=['us-west-2']))),
+                ['prod:us-west-2'])
+        finally:
+            ec2.close()
+
+        self.assertEqual(merge_results([None, [1], None, [2]]), [1, 2])
+        self.assertEqual(merge_results([{'a': 1}, None]), {'a': 1})
+        self.assertEqual(merge_results([None, None]), None)
+
+    def test_unsplit(self):
+        print("Test: calls merging across profiles run as one call")
+        s3 = AsyncAwsService('s3', profile_names=PROFILES)
+        try:
+            buckets = asyncio.run(s3.list_buckets())
+        finally:
+            s3.close()
+        self.assertEqual([(bucket['Name'], bucket['profile_name'])
+                          for bucket in buckets],
+                         [('shared', ['dev', 'prod']), ('dev-logs', ['dev']),
+                          ('prod-logs', ['prod'])])
+
+    def test_timeout(self):
+        print("Test: a timeout cancels the units not started")
+        self.aws.delay = 0.2
+        ec2 = AsyncAwsService('ec2', max_concurrency=1)
+        try:
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(ec2.list_vms(timeout=0.05))
+            time.sleep(0.3)
+            self.assertEqual(self.aws.started, ['dev:us-east-1'])
+        finally:
+            ec2.close()
+
+    def test_cancel(self):
+        print("Test: cancelling the caller cancels the units not started")
+        self.aws.delay = 0.2
+        ec2 = AsyncAwsService('ec2', max_concurrency=1)
+
+        async def cancel():
+            task = asyncio.ensure_future(ec2.list_vms())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await task
+
+        try:
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(cancel())
+            time.sleep(0.3)
+            self.assertEqual(self.aws.started, ['dev:us-east-1'])
+        finally:
+            ec2.close()
+
+    def test_iterators(self):
+        print("Test: iterator APIs are async generators")
+        ec2 = AsyncAwsService('ec2')
+
+        async def collect():
+            return [vm async for vm in ec2.iter_vms(regions=['us-east-1'])]
+
+        try:
+            self.assertEqual(self.get_vm_ids(asyncio.run(collect())),
+                             ['dev:us-east-1', 'prod:us-east-1'])
+        finally:
+            ec2.close()
+
+        # Returned iterators are refused, not iterated on the loop.
+        def walk_vms():
+            yield None
+        with self.assertRaises(TypeError):
+            check_not_iterator(walk_vms, [walk_vms()])
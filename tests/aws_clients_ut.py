@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import os
+import shutil
+import tempfile
+import unittest
+from orcalib.aws_clients import ClientRegistry, LazyClientMap, \
+    build_clients, get_registry
+
+
+class AwsClientsUt(unittest.TestCase):
+    def setUp(self):
+        self.created = []
+        self.saved = get_registry().get_client
+
+        def get_client(service, profile=None, region=None):
+            self.created.append((profile, service, region))
+            return (profile, service, region)
+        get_registry().get_client = get_client
+
+    def tearDown(self):
+        get_registry().get_client = self.saved
+
+    def test_lazy_client_map(self):
+        print("Test: values are built on first access and kept")
+        built = []
+
+        def factory(key):
+            built.append(key)
+            return key.upper()
+
+        clients = LazyClientMap(['dev', 'prod'], factory)
+        self.assertEqual((list(clients), len(clients)), (['dev', 'prod'], 2))
+        self.assertIn('prod', clients)
+        self.assertEqual(built, [])
+
+        self.assertEqual((clients['dev'], clients['dev']), ('DEV', 'DEV'))
+        self.assertEqual(built, ['dev'])
+        with self.assertRaises(KeyError):
+            clients['qa']
+        self.assertEqual(built, ['dev'])
+
+    def test_build_clients(self):
+        print("Test: only the clients used are created")
+        clients = build_clients('ec2', regions=['us-east-1', 'us-west-2'],
+                                profile_names=['dev', 'prod'])
+        self.assertEqual(sorted(clients['prod'].keys()),
+                         ['us-east-1', 'us-west-2'])
+        self.assertEqual(self.created, [])
+
+        self.assertEqual(clients['prod']['us-west-2'],
+                         ('prod', 'ec2', 'us-west-2'))
+        self.assertEqual(self.created, [('prod', 'ec2', 'us-west-2')])
+
+        # Global services map the profiles to the clients directly.
+        s3_clients = build_clients('s3', profile_names=['dev', 'prod'])
+        self.assertEqual(s3_clients['dev'], ('dev', 's3', None))
+        self.assertEqual(len(self.created), 2)
+
+
+class ClientRegistryUt(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.home, ".aws"))
+        with open(os.path.join(self.home, ".aws/credentials"), "w") as fp:
+            for profile in ['dev', 'prod']:
+                fp.write("[%s]\naws_access_key_id = AKIA%s\n"
+                         "aws_secret_access_key = secret\n" %
+                         (profile, profile.upper()))
+        self.saved = os.environ.get("HOME")
+        os.environ["HOME"] = self.home
+
+    def tearDown(self):
+        os.environ["HOME"] = self.saved
+        shutil.rmtree(self.home)
+
+    def test_reuse(self):
+        print("Test: sessions and clients are shared")
+        registry = ClientRegistry()
+        client = registry.get_client('ec2', profile='dev',
+                                     region='us-east-1')
+        self.assertIs(registry.get_client('ec2', profile='dev',
+                                          region='us-east-1'), client)
+        self.assertIsNot(registry.get_client('ec2', profile='dev',
+                                             region='us-west-2'), client)
+        self.assertIsNot(registry.get_client('ec2', profile='prod',
+                                             region='us-east-1'), client)
+
+        # One session per profile, for all the services.
+        session = registry.get_session(profile='dev')
+        registry.get_client('s3', profile='dev')
+        self.assertIs(registry.get_session(profile='dev'), session)
+
+        static = registry.get_client('s3', access_key_id='AKIAX',
+                                     secret_access_key='secret')
+        self.assertIs(registry.get_client('s3', access_key_id='AKIAX',
+                                          secret_access_key='secret'),
+                      static)
+
+    def test_invalidate(self):
+        print("Test: invalidated clients are created again")
+        registry = ClientRegistry()
+        dev = registry.get_client('ec2', profile='dev', region='us-east-1')
+        prod = registry.get_client('ec2', profile='prod', region='us-east-1')
+        session = registry.get_session(profile='dev')
+
+        registry.invalidate(service='ec2', region='us-west-2')
+        self.assertIs(registry.get_client('ec2', profile='dev',
+                                          region='us-east-1'), dev)
+
+        # Only the clients are dropped, the session is kept.
+        registry.invalidate(service='ec2', region='us-east-1')
+        dev = registry.get_client('ec2', profile='dev', region='us-east-1')
+        self.assertIsNot(
+            registry.get_client('ec2', profile='prod', region='us-east-1'),
+            prod)
+        self.assertIs(registry.get_session(profile='dev'), session)
+
+        # A profile alone drops its session, credentials are read again.
+        prod = registry.get_client('ec2', profile='prod', region='us-east-1')
+        registry.invalidate(profile='dev')
+        self.assertIsNot(registry.get_session(profile='dev'), session)
+        self.assertIsNot(registry.get_client('ec2', profile='dev',
+                                             region='us-east-1'), dev)
+        self.assertIs(registry.get_client('ec2', profile='prod',
+                                          region='us-east-1'), prod)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import botocore.exceptions
+from orcalib.aws_clients import get_registry
+from orcalib.ec2_service import AwsServiceEC2
+
+
+PROFILES = ['dev', 'prod']
+REGIONS = ['us-east-1', 'us-west-2']
+
+
+class FakePaginator(object):
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self):
+        if self.client.region == 'us-west-2' and \
+                self.client.profile == 'prod':
+            raise botocore.exceptions.ClientError(
+                {'Error': {'Code': 'UnauthorizedOperation'}},
+                'DescribeVolumes')
+        for page in range(3):
+            self.client.pages.append((self.client.profile,
+                                      self.client.region, page))
+            yield {'Volumes': [{'VolumeId': "vol-%s-%s-%d-%d" %
+                                (self.client.profile, self.client.region,
+                                 page, idx)} for idx in range(2)]}
+
+
+class FakeEC2Client(object):
+    def __init__(self, pages, profile, region, paginate=True):
+        self.pages = pages
+        self.profile = profile
+        self.region = region
+        self.paginate = paginate
+
+    def can_paginate(self, operation):
+        return self.paginate
+
+    def get_paginator(self, operation):
+        return FakePaginator(self)
+
+    def describe_volumes(self):
+        return {'Volumes': [{'VolumeId': "vol-%s" % self.region}]}
+
+
+class EC2ServiceUt(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.home, ".aws"))
+        with open(os.path.join(self.home, ".aws/orcaenv.yaml"), "w") as fp:
+            fp.write("max_concurrency: 4\nregions: [%s]\n" %
+                     ", ".join(REGIONS))
+        with open(os.path.join(self.home, ".aws/credentials"), "w") as fp:
+            for profile in PROFILES:
+                fp.write("[%s]\n" % profile)
+        self.saved = (os.environ.get("HOME"), get_registry().get_client)
+        os.environ["HOME"] = self.home
+
+        self.pages = []
+        self.paginate = True
+        get_registry().get_client = \
+            lambda service, profile=None, region=None: \
+            FakeEC2Client(self.pages, profile, region, self.paginate)
+
+    def tearDown(self):
+        home, get_registry().get_client = self.saved
+        os.environ["HOME"] = home
+        shutil.rmtree(self.home)
+
+    def test_iter_resources_pages(self):
+        print("Test: iter_* yields page by page, unit by unit")
+        service = AwsServiceEC2()
+        volumes = service.iter_volumes(profile_names=['dev'])
+
+        first = next(volumes)
+        self.assertEqual((first['VolumeId'], first['profile_name'],
+                          first['region']),
+                         ("vol-dev-us-east-1-0-0", 'dev', 'us-east-1'))
+        # Nothing is fetched ahead of the consumer.
+        self.assertEqual(self.pages, [('dev', 'us-east-1', 0)])
+
+        rest = [volume['VolumeId'] for volume in volumes]
+        self.assertEqual(len(rest), 11)
+        self.assertEqual(rest[:2], ["vol-dev-us-east-1-0-1",
+                                    "vol-dev-us-east-1-1-0"])
+        self.assertEqual(rest[-1], "vol-dev-us-west-2-2-1")
+
+    def test_iter_resources_errors(self):
+        print("Test: a failed unit does not stop the other units")
+        service = AwsServiceEC2()
+        units = [(volume['profile_name'], volume['region'])
+                 for volume in service.iter_volumes()]
+        self.assertEqual(sorted(set(units)),
+                         [('dev', 'us-east-1'), ('dev', 'us-west-2'),
+                          ('prod', 'us-east-1')])
+        self.assertEqual(len(units), 18)
+
+    def test_iter_resources_unpaginated(self):
+        print("Test: operations without a paginator are called once")
+        self.paginate = False
+        service = AwsServiceEC2(profile_names=['dev'])
+        self.assertEqual([volume['VolumeId']
+                          for volume in service.iter_volumes()],
+                         ["vol-us-east-1", "vol-us-west-2"])
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import threading
+import time
+import unittest
+import orcalib.fanout as fanout
+
+
+class FanoutUt(unittest.TestCase):
+    def test_get_units(self):
+        print("Test: profile x region units")
+        clients = {'dev': {}, 'prod': {}}
+        units = fanout.get_units(clients, ['us-east-1', 'us-west-2'])
+        self.assertEqual(units, [('dev', 'us-east-1'), ('dev', 'us-west-2'),
+                                 ('prod', 'us-east-1'), ('prod', 'us-west-2')])
+
+        units = fanout.get_units(clients, ['us-east-1', 'us-west-2'],
+                                 profile_names=['prod'],
+                                 regions=['us-west-2'])
+        self.assertEqual(units, [('prod', 'us-west-2')])
+
+        units = fanout.get_units(clients)
+        self.assertEqual(units, [('dev', None), ('prod', None)])
+
+    def test_run_fanout_order_and_errors(self):
+        print("Test: results keep unit order, errors are per unit")
+        units = [('dev', 'r1'), ('dev', 'r2'), ('prod', 'r1')]
+
+        def api(profile, region):
+            if region == 'r2':
+                raise ValueError("boom")
+            # Make the first unit finish last.
+            if profile == 'dev':
+                time.sleep(0.05)
+            return "%s:%s" % (profile, region)
+
+        results = fanout.run_fanout(api, units, max_workers=3)
+        self.assertEqual([(r.profile, r.region) for r in results], units)
+        self.assertEqual(results[0].result, "dev:r1")
+        self.assertTrue(isinstance(results[1].error, ValueError))
+        self.assertEqual(results[2].result, "prod:r1")
+
+        succeeded = fanout.collect(results, "Test")
+        self.assertEqual(succeeded, [('dev', 'r1', 'dev:r1'),
+                                     ('prod', 'r1', 'prod:r1')])
+
+    def test_iter_completed(self):
+        print("Test: stream results from the worker pool with retries")
+        attempts = {}
+
+        def api(item):
+            attempts[item] = attempts.get(item, 0) + 1
+            if item == 2 and attempts[item] == 1:
+                raise ValueError("throttled")
+            if item == 3:
+                raise ValueError("boom")
+            return item * 10
+
+        results = list(fanout.iter_completed(api, range(5),
+                                             max_in_flight=2,
+                                             retries=1, backoff=0.01))
+        self.assertEqual(sorted(item for item, _, _ in results),
+                         [0, 1, 2, 3, 4])
+        for item, result, error in results:
+            if item == 3:
+                self.assertTrue(isinstance(error, ValueError))
+            else:
+                self.assertEqual(result, item * 10)
+        self.assertEqual(attempts[2], 2)
+        self.assertEqual(attempts[3], 2)
+
+    def test_iter_completed_max_per_key(self):
+        print("Test: bound the items in flight per key")
+        lock = threading.Lock()
+        running = {}
+        peak = {}
+
+        def api(item):
+            profile = item[0]
+            with lock:
+                running[profile] = running.get(profile, 0) + 1
+                peak[profile] = max(peak.get(profile, 0), running[profile])
+            time.sleep(0.01)
+            with lock:
+                running[profile] -= 1
+            return item
+
+        items = [('dev', i) for i in range(10)] + \
+            [('prod', i) for i in range(10)]
+        results = list(fanout.iter_completed(api, items, max_in_flight=8,
+                                             key=lambda item: item[0],
+                                             max_per_key=2))
+        self.assertEqual(sorted(result for _, result, _ in results), items)
+        self.assertEqual(peak, {'dev': 2, 'prod': 2})
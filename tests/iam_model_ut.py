@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import unittest
+from orcalib.iam_model import IamAccountModel
+
+
+READONLY_ARN = "arn:aws:iam::aws:policy/ReadOnlyAccess"
+DEPLOY_ARN = "arn:aws:iam::123456789012:policy/Deploy"
+
+DETAILS = {
+    'UserDetailList': [
+        {'UserName': 'alice', 'UserId': 'AID1', 'GroupList': ['devs'],
+         'AttachedManagedPolicies': [
+             {'PolicyName': 'Deploy', 'PolicyArn': DEPLOY_ARN}],
+         'UserPolicyList': [
+             {'PolicyName': 'inline',
+              'PolicyDocument': '%7B%22Statement%22%3A%20%7B%22Action%22'
+                                '%3A%20%22s3%3AGetObject%22%7D%7D'}]},
+        {'UserName': 'bob', 'UserId': 'AID2', 'GroupList': []},
+    ],
+    'GroupDetailList': [
+        {'GroupName': 'devs', 'GroupId': 'GID1',
+         'AttachedManagedPolicies': [
+             {'PolicyName': 'ReadOnlyAccess', 'PolicyArn': READONLY_ARN}]},
+    ],
+    'RoleDetailList': [
+        {'RoleName': 'ci', 'AttachedManagedPolicies': [
+            {'PolicyName': 'Deploy', 'PolicyArn': DEPLOY_ARN}]},
+    ],
+    'Policies': [
+        {'Arn': READONLY_ARN, 'DefaultVersionId': 'v2',
+         'PolicyVersionList': [
+             {'VersionId': 'v1', 'IsDefaultVersion': False,
+              'Document': {'Statement': [{'Action': 'old'}]}},
+             {'VersionId': 'v2', 'IsDefaultVersion': True,
+              'Document': {'Statement': [{'Action': '*:Get*'}]}}]},
+        {'Arn': DEPLOY_ARN, 'DefaultVersionId': 'v1',
+         'PolicyVersionList': [
+             {'VersionId': 'v1', 'IsDefaultVersion': True,
+              'Document': {'Statement': {'Action': 'ec2:*'}}}]},
+    ],
+}
+
+
+class IamModelUt(unittest.TestCase):
+    def test_user_permissions(self):
+        print("Test: user permissions answered from the snapshot")
+        model = IamAccountModel(DETAILS, profile_name='dev')
+
+        policies = model.get_user_attached_policies(UserName='alice')
+        self.assertEqual([(policy['PolicyName'], policy['type'])
+                          for policy in policies],
+                         [('ReadOnlyAccess', 'group'), ('Deploy', 'user')])
+
+        self.assertEqual(model.get_user_permissions(UserName='alice'),
+                         [{'Action': '*:Get*'}, {'Action': 'ec2:*'}])
+        self.assertEqual(
+            model.get_user_permissions(UserName='alice',
+                                       include_inline=True)[-1],
+            {'Action': 's3:GetObject'})
+        self.assertEqual(model.get_user_permissions(UserName='bob'), [])
+        self.assertEqual(model.get_user_permissions(UserName='carol'), None)
+        self.assertEqual(model.get_role_permissions(RoleName='ci'),
+                         [{'Action': 'ec2:*'}])
+
+        users = dict((user['UserName'], user) for user in model.list_users())
+        self.assertEqual(users['alice']['Groups'],
+                         [{'GroupName': 'devs', 'GroupId': 'GID1'}])
+        self.assertEqual(users['bob']['profile_name'], 'dev')
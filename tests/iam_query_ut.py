@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import unittest
+from orcalib.iam_model import IamAccountModel
+from orcalib.iam_query import StatementIndex, compile_pattern
+
+
+S3_ARN = "arn:aws:iam::123456789012:policy/S3Admin"
+ADMIN_ARN = "arn:aws:iam::aws:policy/AdministratorAccess"
+
+
+def policy(arn, statements):
+    return {'Arn': arn, 'DefaultVersionId': 'v1',
+            'PolicyVersionList': [{'VersionId': 'v1',
+                                   'IsDefaultVersion': True,
+                                   'Document': {'Statement': statements}}]}
+
+
+DETAILS = {
+    'UserDetailList': [
+        {'UserName': 'alice', 'GroupList': ['storage'],
+         'AttachedManagedPolicies': []},
+        {'UserName': 'bob', 'GroupList': ['storage'],
+         'UserPolicyList': [
+             {'PolicyName': 'no-logs',
+              'PolicyDocument': {'Statement': [
+                  {'Effect': 'Deny', 'Action': 's3:Delete*',
+                   'Resource': 'arn:aws:s3:::logs/*'}]}}]},
+        {'UserName': 'carol', 'GroupList': [],
+         'AttachedManagedPolicies': [
+             {'PolicyName': 'AdministratorAccess',
+              'PolicyArn': ADMIN_ARN}]},
+    ],
+    'GroupDetailList': [
+        {'GroupName': 'storage', 'AttachedManagedPolicies': [
+            {'PolicyName': 'S3Admin', 'PolicyArn': S3_ARN}]},
+    ],
+    'RoleDetailList': [
+        {'RoleName': 'ci', 'RolePolicyList': [
+            {'PolicyName': 'deploy',
+             'PolicyDocument': {'Statement': {
+                 'Effect': 'Allow', 'NotAction': 'iam:*',
+                 'Resource': '*'}}}]},
+    ],
+    'Policies': [
+        policy(S3_ARN, [{'Effect': 'Allow', 'Action': ['s3:*Object'],
+                         'Resource': 'arn:aws:s3:::*'}]),
+        policy(ADMIN_ARN, [{'Effect': 'Allow', 'Action': '*',
+                            'Resource': '*'}]),
+    ],
+}
+
+
+class IamQueryUt(unittest.TestCase):
+    def test_compile_pattern(self):
+        print("Test: IAM wildcard patterns")
+        match = compile_pattern('s3:Get*', ignore_case=True)
+        self.assertTrue(match('S3:GetObject'))
+        self.assertFalse(match('s3:PutObject'))
+        match = compile_pattern('arn:aws:s3:::logs-?/*')
+        self.assertTrue(match('arn:aws:s3:::logs-1/a/b'))
+        self.assertFalse(match('arn:aws:s3:::logs-10/a'))
+        self.assertFalse(match('arn:aws:s3:::LOGS-1/a'))
+
+    def test_who_can(self):
+        print("Test: who can perform an action on a resource")
+        index = StatementIndex(IamAccountModel(DETAILS, profile_name='dev'))
+        self.assertEqual(sorted(index.principals[('policy', S3_ARN)]),
+                         [('user', 'alice'), ('user', 'bob')])
+
+        everyone = [('role', 'ci'), ('user', 'alice'), ('user', 'bob'),
+                    ('user', 'carol')]
+        self.assertEqual(index.who_can('s3:DeleteObject',
+                                       'arn:aws:s3:::data/key'), everyone)
+        # Explicit deny on the logs bucket.
+        self.assertEqual(index.who_can('S3:deleteobject',
+                                       'arn:aws:s3:::logs/key'),
+                         [('role', 'ci'), ('user', 'alice'),
+                          ('user', 'carol')])
+        # The deny does not cover every resource.
+        self.assertEqual(index.who_can('s3:DeleteObject'), everyone)
+        self.assertEqual(index.who_can('iam:CreateUser'), [('user', 'carol')])
+        self.assertEqual(index.who_can('s3:ListBucket',
+                                       'arn:aws:s3:::data'),
+                         [('role', 'ci'), ('user', 'carol')])
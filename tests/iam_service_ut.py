@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import unittest
+from orcalib.iam_service import AwsServiceIAM
+
+
+class FakePaginator(object):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self):
+        return iter(self.pages)
+
+
+class FakeIamClient(object):
+    def __init__(self, usernames, page_size=100):
+        self.usernames = usernames
+        self.page_size = page_size
+
+    def get_paginator(self, operation):
+        users = [{'UserName': name} for name in self.usernames]
+        pages = [{'Users': users[start:start + self.page_size]}
+                 for start in range(0, len(users), self.page_size)]
+        return FakePaginator(pages)
+
+
+class FakeDetailsClient(object):
+    def __init__(self):
+        self.calls = []
+
+    def get_paginator(self, operation):
+        self.calls.append(operation)
+        policy = {'Arn': "arn:aws:iam::aws:policy/ReadOnly",
+                  'DefaultVersionId': 'v1',
+                  'PolicyVersionList': [{
+                      'IsDefaultVersion': True,
+                      'Document': {'Statement': [{'Effect': 'Allow',
+                                                  'Action': 's3:Get*',
+                                                  'Resource': '*'}]}}]}
+        return FakePaginator([{
+            'UserDetailList': [{'UserName': 'alice', 'GroupList': ['ops']}],
+            'GroupDetailList': [{'GroupName': 'ops',
+                                 'AttachedManagedPolicies': [{
+                                     'PolicyName': 'ReadOnly',
+                                     'PolicyArn': policy['Arn']}]}],
+            'Policies': [policy]}])
+
+
+def get_service(clients):
+    service = AwsServiceIAM.__new__(AwsServiceIAM)
+    service.max_concurrency = None
+    service.cache = None
+    service.clients = clients
+    return service
+
+
+class IamServiceUt(unittest.TestCase):
+    def test_user_index_pages(self):
+        print("Test: the user index covers every page of users")
+        service = get_service({
+            'dev': FakeIamClient(["user%d" % i for i in range(250)]),
+            'prod': FakeIamClient(["user0", "user249"])})
+
+        self.assertEqual(len(service.list_users()), 252)
+        self.assertEqual(sorted(service.find_user_profiles("user249")),
+                         ['dev', 'prod'])
+        self.assertEqual(service.find_user_profiles("user150"), ['dev'])
+
+    def test_user_lookup_fallback(self):
+        print("Test: users missing from the index are looked up")
+        service = get_service({'dev': FakeIamClient(["alice"]),
+                               'prod': FakeIamClient(["alice"])})
+        service.get_user_permissions = \
+            lambda UserName=None, profile_name=None, offline=False: \
+            [profile_name]
+
+        self.assertEqual(sorted(service.iter_user_permissions("alice")),
+                         [('dev', ['dev']), ('prod', ['prod'])])
+        # Not in the (possibly stale) index: every profile is looked up.
+        self.assertEqual(sorted(service.iter_user_permissions("bob")),
+                         [('dev', ['dev']), ('prod', ['prod'])])
+
+    def test_offline_lookup(self):
+        print("Test: user permissions answered from the account model")
+        client = FakeDetailsClient()
+        service = get_service({'dev': client})
+
+        policies = service.get_user_attached_policies(
+            UserName="alice", profile_name="dev", offline=True)
+        self.assertEqual([(policy['PolicyName'], policy['type'])
+                          for policy in policies], [('ReadOnly', 'group')])
+        self.assertEqual(
+            service.get_user_permissions(UserName="alice",
+                                         profile_name="dev", offline=True),
+            [{'Effect': 'Allow', 'Action': 's3:Get*', 'Resource': '*'}])
+        self.assertIsNone(service.get_user_permissions(
+            UserName="bob", profile_name="dev", offline=True))
+        # Only the account authorization details were read.
+        self.assertEqual(set(client.calls),
+                         set(['get_account_authorization_details']))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import orcalib.fanout as fanout
+import orcalib.inventory_cache as inventory_cache
+from orcalib.aws_clients import LazyClientMap
+
+
+class FakeService(object):
+    def __init__(self, cache, clients=None):
+        self.cache = cache
+        self.clients = clients or {'dev': None, 'prod': None}
+        self.calls = 0
+        self.failed_units = []
+
+    @inventory_cache.cached('vms')
+    def list_vms(self, profile_names=None, regions=None):
+        self.calls += 1
+        results = [fanout.UnitResult('dev', None, 'i-%d' % self.calls, None)]
+        for profile in self.failed_units:
+            results.append(fanout.UnitResult(profile, None, None,
+                                             Exception("denied")))
+        return [{'InstanceId': result}
+                for _, _, result in fanout.collect(results, "List VMs")]
+
+
+class InventoryCacheUt(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "cache.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_set_ttl(self):
+        print("Test: cached values expire per resource type")
+        cache = inventory_cache.InventoryCache(
+            path=self.path, ttls={'default': 60, 'images': -1, 'tags': 0})
+        cache.set('vms', 'k', [1, 2])
+        self.assertEqual(cache.get('vms', 'k'), (True, [1, 2]))
+        self.assertEqual(cache.get('vms', 'other'), (False, None))
+
+        # Already expired, and not cached at all.
+        cache.set('images', 'k', [3])
+        self.assertEqual(cache.get('images', 'k'), (False, None))
+        cache.set('tags', 'k', [4])
+        self.assertEqual(cache.get('tags', 'k'), (False, None))
+
+        # Shared with another instance (process) on the same file.
+        other = inventory_cache.InventoryCache(path=self.path,
+                                               ttls={'default': 60})
+        self.assertEqual(other.get('vms', 'k'), (True, [1, 2]))
+
+        refresh = inventory_cache.InventoryCache(path=self.path, ttls={},
+                                                 refresh=True)
+        self.assertEqual(refresh.get('vms', 'k'), (False, None))
+
+        cache.invalidate('vms')
+        self.assertEqual(cache.get('vms', 'k'), (False, None))
+
+    def test_cached_decorator(self):
+        print("Test: list_* results served from the cache")
+        cache = inventory_cache.InventoryCache(path=self.path,
+                                               ttls={'default': 60})
+        service = FakeService(cache)
+        first = service.list_vms(profile_names=['dev'])
+        self.assertEqual(service.list_vms(profile_names=['dev']), first)
+        self.assertEqual(service.calls, 1)
+
+        service.list_vms(profile_names=['prod'])
+        self.assertEqual(service.calls, 2)
+
+        service.cache = None
+        service.list_vms(profile_names=['dev'])
+        self.assertEqual(service.calls, 3)
+
+    def test_cached_identity(self):
+        print("Test: services built from access keys do not share entries")
+        cache = inventory_cache.InventoryCache(path=self.path,
+                                               ttls={'default': 60})
+        first = FakeService(cache, LazyClientMap(
+            ['default'], lambda profile: None, identity=lambda: 'AKIA1'))
+        second = FakeService(cache, LazyClientMap(
+            ['default'], lambda profile: None, identity=lambda: 'AKIA2'))
+
+        first.list_vms()
+        second.list_vms()
+        first.list_vms()
+        self.assertEqual((first.calls, second.calls), (1, 1))
+
+    def test_cached_failures(self):
+        print("Test: results with failed units are not cached")
+        cache = inventory_cache.InventoryCache(path=self.path,
+                                               ttls={'default': 60})
+        service = FakeService(cache)
+        service.failed_units = ['prod']
+        self.assertEqual(service.list_vms(), [{'InstanceId': 'i-1'}])
+        self.assertEqual(service.list_vms(), [{'InstanceId': 'i-2'}])
+
+        service.failed_units = []
+        service.list_vms()
+        service.list_vms()
+        self.assertEqual(service.calls, 3)
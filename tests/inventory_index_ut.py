@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import unittest
+import orcalib.utils as orcautils
+from orcalib.inventory_index import InventoryIndex
+
+
+INSTANCES = [
+    {'InstanceId': 'i-1', 'State': {'Name': 'running'},
+     'Tags': {'Environment': 'prod'}, 'CoreCount': 4},
+    {'InstanceId': 'i-2', 'State': {'Name': 'stopped'},
+     'Tags': {'Environment': 'prod'}, 'CoreCount': 2},
+    {'InstanceId': 'i-3', 'State': {'Name': 'running'},
+     'Tags': {'Environment': 'dev'}, 'CoreCount': 8},
+    {'InstanceId': 'i-4', 'State': {'Name': 'running'},
+     'Tags': {}, 'SecurityGroupIds': ['sg-1', 'sg-2']},
+]
+
+
+class InventoryIndexUt(unittest.TestCase):
+    def test_find(self):
+        print("Test: indexed queries match filter_list")
+        index = InventoryIndex(INSTANCES, keys=['Tags.Environment',
+                                                'State.Name',
+                                                'SecurityGroupIds'])
+        queries = [
+            [{'Name': 'Tags.Environment', 'Values': ['prod']}],
+            [{'Name': 'Tags.Environment', 'Values': ['prod']},
+             {'Name': 'State.Name', 'Values': ['running']}],
+            [{'Name': 'SecurityGroupIds', 'Values': ['sg-2']},
+             {'Name': 'Tags.Environment', 'Values': ['dev']}],
+            # Not indexed (gt) and regex filters.
+            [{'Name': 'State.Name', 'Values': ['running']},
+             {'Name': 'CoreCount', 'Values': [3], 'check': 'gt'}],
+            [{'Name': 'InstanceId', 'Values': ['i-[12]'], 'regex': True},
+             {'Name': 'Tags.Environment', 'Values': ['dev']}],
+            # No filters.
+            [],
+        ]
+        for filters in queries:
+            for aggr_and in [False, True]:
+                self.assertEqual(
+                    index.filter(filters, aggr_and=aggr_and),
+                    orcautils.filter_list(INSTANCES, filters,
+                                          aggr_and=aggr_and))
+
+        self.assertEqual(index.find([{'Name': 'Tags.Environment',
+                                      'Values': ['prod']},
+                                     {'Name': 'State.Name',
+                                      'Values': ['running']}],
+                                    aggr_and=True), [0])
+        self.assertEqual(index.find(None), None)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import unittest
+import orcalib.normalize as normalize
+import orcalib.utils as orcautils
+from orcalib.inventory_table import InventoryTable
+
+
+RESERVATIONS = [
+    {'profile_name': 'dev', 'region': 'us-east-1',
+     'Instances': [
+         {'InstanceId': 'i-1', 'InstanceType': 't2.micro', 'VpcId': 'vpc-1',
+          'Placement': {'AvailabilityZone': 'us-east-1a'}, 'CoreCount': 1,
+          'Tags': {'Environment': 'dev'}},
+         {'InstanceId': 'i-2', 'InstanceType': 'm4.large', 'VpcId': 'vpc-1',
+          'Placement': {'AvailabilityZone': 'us-east-1b'}, 'CoreCount': 2,
+          'Tags': {'Environment': 'prod'}}]},
+    {'profile_name': 'prod', 'region': 'us-west-2',
+     'Instances': [
+         {'InstanceId': 'i-3', 'InstanceType': 't2.micro',
+          'Placement': {'AvailabilityZone': 'us-west-2a'}, 'CoreCount': 8,
+          'Tags': {'Environment': 'prod'},
+          'SecurityGroupIds': ['sg-1', 'sg-2']}]},
+]
+
+COLUMNS = ['InstanceId', 'InstanceType', 'VpcId', 'CoreCount',
+           'Tags.Environment', 'profile_name', 'SecurityGroupIds']
+
+
+class InventoryTableUt(unittest.TestCase):
+    def setUp(self):
+        self.records = normalize.instance_records(RESERVATIONS)
+        self.table = InventoryTable(self.records, COLUMNS)
+
+    def test_filters_match_filter_list(self):
+        print("Test: table filters match filter_list")
+        self.assertEqual(len(self.table), 3)
+        queries = [
+            [{'Name': 'Tags.Environment', 'Values': ['prod']}],
+            [{'Name': 'InstanceType', 'Values': ['t2.*'], 'regex': True},
+             {'Name': 'profile_name', 'Values': ['prod']}],
+            [{'Name': 'CoreCount', 'Values': [1], 'check': 'gt'},
+             {'Name': 'VpcId', 'Values': ['vpc-1']}],
+            [{'Name': 'CoreCount', 'Values': [2, 8]}],
+            [{'Name': 'SecurityGroupIds', 'Values': ['sg-2']},
+             {'Name': 'CoreCount', 'Values': [3], 'check': 'lt'}],
+        ]
+        for filters in queries:
+            for aggr_and in [False, True]:
+                expected = orcautils.filter_list(self.records, filters,
+                                                 aggr_and=aggr_and)
+                rows = self.table.select(filters, aggr_and=aggr_and)
+                self.assertEqual(self.table.get_values('InstanceId', rows),
+                                 [record['InstanceId']
+                                  for record in expected])
+
+        self.assertEqual(self.table.select(None), None)
+
+    def test_group_count(self):
+        print("Test: group by counts")
+        self.assertEqual(self.table.group_count('InstanceType'),
+                         {'t2.micro': 2, 'm4.large': 1})
+        # Rows without a VpcId are not counted.
+        self.assertEqual(self.table.group_count('VpcId'), {'vpc-1': 2})
+        self.assertEqual(
+            self.table.group_count(['profile_name', 'Tags.Environment']),
+            {('dev', 'dev'): 1, ('dev', 'prod'): 1, ('prod', 'prod'): 1})
+        self.assertEqual(
+            self.table.group_count('InstanceType',
+                                   filters=[{'Name': 'Tags.Environment',
+                                             'Values': ['prod']}]),
+            {'m4.large': 1, 't2.micro': 1})
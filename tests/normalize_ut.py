@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import copy
+import unittest
+import orcalib.normalize as normalize
+
+
+RESERVATION = {
+    'ReservationId': 'r-1',
+    'Instances': [
+        {'InstanceId': 'i-1',
+         'Tags': [{'Key': 'Environment', 'Value': 'prod'},
+                  {'Key': 'Name', 'Value': 'web1'}],
+         'SecurityGroups': [{'GroupId': 'sg-1', 'GroupName': 'web'}],
+         'NetworkInterfaces': [{'NetworkInterfaceId': 'eni-1',
+                                'Status': 'in-use'}]},
+        {'InstanceId': 'i-2'}
+    ]
+}
+
+SECURITY_GROUP = {
+    'GroupId': 'sg-1',
+    'GroupName': 'web',
+    'IpPermissions': [{'FromPort': 443,
+                       'IpRanges': [{'CidrIp': '0.0.0.0/0'}]},
+                      {'IpProtocol': '-1',
+                       'IpRanges': [{'CidrIp': '10.0.0.0/8'}]}],
+    'IpPermissionsEgress': [{'IpProtocol': '-1',
+                             'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}],
+}
+
+
+class NormalizeUt(unittest.TestCase):
+    def test_normalize_reservation(self):
+        print("Test: normalize a reservation")
+        reservation = copy.deepcopy(RESERVATION)
+        normalize.normalize_reservation(reservation)
+
+        instance = reservation['Instances'][0]
+        self.assertEqual(instance['Tags'],
+                         {'Environment': 'prod', 'Name': 'web1'})
+        self.assertEqual(instance['SecurityGroups'], {'sg-1': 'web'})
+        self.assertEqual(list(instance['NetworkInterfaces'].keys()),
+                         ['eni-1'])
+        self.assertFalse('Tags' in reservation['Instances'][1])
+
+        # Normalizing again is a no-op.
+        normalized = copy.deepcopy(reservation)
+        normalize.normalize('reservation', reservation)
+        self.assertEqual(reservation, normalized)
+
+    def test_normalize_security_group(self):
+        print("Test: normalize a security group")
+        group = normalize.normalize_security_group(
+            copy.deepcopy(SECURITY_GROUP))
+
+        self.assertEqual(sorted(group['IpPermissions'].keys(),
+                                key=str), ["-1", 443])
+        self.assertEqual(group['IpPermissions'][443]['IpRanges'],
+                         {'0.0.0.0/0': 1})
+        self.assertEqual(group['IpPermissionsEgress']["-1"]['IpRanges'],
+                         {'0.0.0.0/0': 1})
+        self.assertEqual(group['Tags'], {})
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import json
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "server"))
+import orcaserver
+
+
+PROFILES = ['dev', 'prod']
+REGIONS = ['us-east-1', 'us-west-2']
+
+
+class FakeAwsConfig(object):
+    def get_profiles(self):
+        return PROFILES
+
+
+class FakeS3Client(object):
+    def __init__(self, profile):
+        self.profile = profile
+
+    def list_buckets(self):
+        return {'Buckets': [{'Name': "%s-logs" % self.profile}]}
+
+
+class FakeEC2(object):
+    # us-west-2 answers only once us-east-1 has been streamed.
+    east_done = None
+    sweeps = 0
+
+    def __init__(self, profile_names=None):
+        FakeEC2.sweeps += 1
+        self.clients = dict((profile, dict((region, None)
+                                           for region in REGIONS))
+                            for profile in profile_names)
+        self.regions = REGIONS
+        self.max_concurrency = 8
+
+    def list_vms(self, profile_names=None, regions=None):
+        profile, region = profile_names[0], regions[0]
+        if region == 'us-west-2':
+            FakeEC2.east_done.wait(5)
+        return [{'Instances': [{'InstanceId': "i-%s-%s" %
+                                (profile, region)}]}]
+
+
+class OrcaServerUt(unittest.TestCase):
+    def setUp(self):
+        self.saved = (orcaserver.aws_config.AwsConfig,
+                      orcaserver.AwsServiceEC2,
+                      orcaserver.registry.get_client)
+        orcaserver.aws_config.AwsConfig = FakeAwsConfig
+        orcaserver.AwsServiceEC2 = FakeEC2
+        orcaserver.registry.get_client = \
+            lambda service, profile=None: FakeS3Client(profile)
+        FakeEC2.east_done = threading.Event()
+        FakeEC2.sweeps = 0
+        self.client = orcaserver.app.test_client()
+
+    def tearDown(self):
+        FakeEC2.east_done.set()
+        (orcaserver.aws_config.AwsConfig,
+         orcaserver.AwsServiceEC2,
+         orcaserver.registry.get_client) = self.saved
+
+    def test_load_resources(self):
+        print("Test: resources of every profile and region")
+        FakeEC2.east_done.set()
+        resources = orcaserver.load_resources()
+        self.assertEqual(sorted(resources.keys()), [
+            'ec2: (dev) i-dev-us-east-1', 'ec2: (dev) i-dev-us-west-2',
+            'ec2: (prod) i-prod-us-east-1', 'ec2: (prod) i-prod-us-west-2',
+            's3: (dev) dev-logs', 's3: (prod) prod-logs'])
+
+    def test_ndjson(self):
+        print("Test: stream the resources as NDJSON, per unit")
+        resp = self.client.get('/rundeck/resources/?format=ndjson',
+                               buffered=False)
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+
+        units = []
+        for line in resp.response:
+            record = json.loads(line)
+            self.assertEqual(sorted(record.keys()),
+                             ['profile', 'region', 'resources', 'service'])
+            units.append((record['service'], record['profile'],
+                          record['region']))
+            if len([unit for unit in units if unit[0] == 's3' or
+                    unit[2] == 'us-east-1']) == 4:
+                FakeEC2.east_done.set()
+        resp.close()
+
+        # Streamed as they complete: the slow region comes last.
+        self.assertEqual(sorted(units[:4]),
+                         [('ec2', 'dev', 'us-east-1'),
+                          ('ec2', 'prod', 'us-east-1'),
+                          ('s3', 'dev', None), ('s3', 'prod', None)])
+        self.assertEqual(sorted(units[4:]),
+                         [('ec2', 'dev', 'us-west-2'),
+                          ('ec2', 'prod', 'us-west-2')])
+
+    def test_ndjson_shared_sweep(self):
+        print("Test: concurrent NDJSON requests share one sweep")
+        first = self.client.get('/rundeck/resources/?format=ndjson',
+                                buffered=False)
+        lines = iter(first.response)
+        next(lines)
+        second = self.client.get('/rundeck/resources/?format=ndjson',
+                                 buffered=False)
+        FakeEC2.east_done.set()
+        self.assertEqual(len(list(second.response)), 6)
+        self.assertEqual(len(list(lines)), 5)
+        first.close()
+        second.close()
+        self.assertEqual(FakeEC2.sweeps, 1)
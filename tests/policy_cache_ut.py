@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import unittest
+from orcalib.policy_cache import PolicyDocumentCache, get_policy_account
+
+
+class FakeIamClient(object):
+    def __init__(self):
+        self.default_version = 'v1'
+        self.calls = []
+
+    def get_policy(self, PolicyArn=None):
+        self.calls.append(('get_policy', PolicyArn))
+        return {'Policy': {'DefaultVersionId': self.default_version}}
+
+    def get_policy_version(self, PolicyArn=None, VersionId=None):
+        self.calls.append(('get_policy_version', PolicyArn, VersionId))
+        return {'PolicyVersion': {
+            'Document': {'Statement': [{'Action': VersionId}]}}}
+
+
+class PolicyCacheUt(unittest.TestCase):
+    def test_get_document(self):
+        print("Test: policy documents fetched once per version")
+        client = FakeIamClient()
+        cache = PolicyDocumentCache(max_size=2, version_ttl=60)
+        arn = "arn:aws:iam::123456789012:policy/ReadOnly"
+        self.assertEqual(get_policy_account(arn), "123456789012")
+
+        for _ in range(3):
+            document = cache.get_document(client, arn)
+            self.assertEqual(document['Statement'], [{'Action': 'v1'}])
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual((cache.misses, cache.hits), (1, 2))
+
+        # The default version is looked up again once expired.
+        cache.version_ttl = -1
+        client.default_version = 'v2'
+        document = cache.get_document(client, arn)
+        self.assertEqual(document['Statement'], [{'Action': 'v2'}])
+        self.assertEqual(len(cache), 2)
+
+        # The least recently used document is evicted.
+        cache.get_document(client, arn, version_id='v3')
+        cache.get_document(client, arn, version_id='v1')
+        self.assertEqual(client.calls[-1],
+                         ('get_policy_version', arn, 'v1'))
+        self.assertEqual(len(cache), 2)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import orcalib.s3_inventory as s3_inventory
+
+
+SCHEMA = "Bucket, Key, VersionId, IsLatest, IsDeleteMarker, Size, " \
+    "LastModifiedDate"
+
+ROWS = [
+    '"src","a","v1","true","false","100","2018-01-02T03:04:05.000Z"',
+    '"src","a","v0","false","false","50","2017-01-02T03:04:05.000Z"',
+    '"src","b","v2","true","true","","2019-01-02T03:04:05.000Z"',
+    '"src","c","v3","true","false","20","2018-06-02T03:04:05.000Z"',
+]
+
+
+class S3InventoryUt(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        datadir = os.path.join(self.tmpdir, "src", "config", "data")
+        os.makedirs(datadir)
+        files = []
+        for idx, rows in enumerate([ROWS[:2], ROWS[2:]]):
+            key = "src/config/data/part%d.csv.gz" % idx
+            with gzip.open(os.path.join(self.tmpdir, key), 'wt') as fp:
+                fp.write("\n".join(rows) + "\n")
+            files.append({'key': key})
+
+        self.manifest = os.path.join(self.tmpdir, "manifest.json")
+        with open(self.manifest, 'w') as fp:
+            json.dump({'sourceBucket': 'src',
+                       'destinationBucket': 'arn:aws:s3:::dst',
+                       'fileFormat': 'CSV',
+                       'fileSchema': SCHEMA,
+                       'files': files}, fp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_inventory_stats(self):
+        print("Test: bucket statistics from a CSV inventory")
+        for processes in [1, 2]:
+            stats = s3_inventory.get_inventory_stats(
+                {'src': self.manifest}, processes=processes,
+                data_root=self.tmpdir)
+            # Old versions and delete markers are not counted.
+            self.assertEqual(stats['src']['object_count'], 2)
+            self.assertEqual(stats['src']['object_size'], 120)
+            self.assertEqual(stats['src']['LastModified'],
+                             datetime.datetime(2018, 6, 2, 3, 4, 5,
+                                               tzinfo=datetime.timezone.utc))
+
+        errors = {}
+        stats = s3_inventory.get_inventory_stats(
+            {'src': self.manifest, 'missing': "/nonexistent/manifest.json"},
+            processes=1, data_root=self.tmpdir, errors=errors)
+        self.assertEqual(list(stats.keys()), ['src'])
+        self.assertEqual(list(errors.keys()), ['missing'])
+
+    def test_init_worker(self):
+        print("Test: pool workers do not share the parent's clients")
+        try:
+            from orcalib.aws_clients import get_registry
+        except ImportError:
+            self.skipTest("boto3 not installed")
+
+        registry = get_registry()
+        registry._clients[('dev', 's3', None)] = object()
+        s3_inventory._init_worker()
+        self.assertEqual(registry._clients, {})
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from orcalib.aws_clients import get_registry
+from orcalib.s3_service import AwsServiceS3
+
+
+class FakePaginator(object):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, Bucket=None):
+        return iter(self.pages[Bucket])
+
+
+class FakeS3Client(object):
+    def __init__(self, buckets, page_size=2):
+        # Bucket name -> list of (key, size, day of month).
+        self.buckets = buckets
+        self.page_size = page_size
+
+    def list_buckets(self):
+        return {'Buckets': [{'Name': name,
+                             'CreationDate': datetime.datetime(2020, 1, 1)}
+                            for name in sorted(self.buckets)]}
+
+    def get_paginator(self, operation):
+        pages = {}
+        for name, objects in self.buckets.items():
+            contents = [{'Key': key, 'Size': size,
+                         'LastModified': datetime.datetime(2020, 1, day)}
+                        for key, size, day in objects]
+            pages[name] = [{'Contents': contents[start:start +
+                                                 self.page_size]}
+                           for start in range(0, len(contents),
+                                              self.page_size)]
+            if not pages[name]:
+                pages[name] = [{'KeyCount': 0}]
+        return FakePaginator(pages)
+
+
+class S3ServiceUt(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.home, ".aws"))
+        with open(os.path.join(self.home, ".aws/orcaenv.yaml"), "w") as fp:
+            fp.write("max_concurrency: 4\n")
+        self.saved = (os.environ.get("HOME"), get_registry().get_client)
+        os.environ["HOME"] = self.home
+
+        clients = {
+            'dev': FakeS3Client({
+                'logs': [("a", 1, 3), ("b", 2, 9), ("c", 4, 1),
+                         ("d", 8, 5), ("e", 16, 2)],
+                'empty': []}),
+            'prod': FakeS3Client({'logs': [], 'prod-data': []})}
+        get_registry().get_client = \
+            lambda service, profile=None, region=None: clients[profile]
+
+    def tearDown(self):
+        home, get_registry().get_client = self.saved
+        os.environ["HOME"] = home
+        shutil.rmtree(self.home)
+
+    def get_buckets(self):
+        return [{'Name': 'logs', 'profile_name': ['dev']},
+                {'Name': 'empty', 'profile_name': ['dev']}]
+
+    def test_populate_bucket_objects(self):
+        print("Test: object statistics are summed across pages")
+        service = AwsServiceS3(profile_names=['dev'])
+        buckets = self.get_buckets()
+        service.populate_bucket_objects(buckets)
+
+        logs, empty = buckets
+        self.assertEqual(logs['object_count'], 5)
+        self.assertEqual(logs['object_size'], 31)
+        self.assertEqual(logs['LastModified'], datetime.datetime(2020, 1, 9))
+        # The objects are only kept on request.
+        self.assertNotIn('objects', logs)
+        self.assertEqual((empty['objects'], empty['object_count'],
+                          empty['object_size']), (None, 0, 0))
+
+    def test_populate_bucket_objects_truncated(self):
+        print("Test: the objects kept are capped by max_objects")
+        service = AwsServiceS3(profile_names=['dev'])
+        buckets = self.get_buckets()
+        service.populate_bucket_objects(buckets, keep_objects=True,
+                                        max_objects=3)
+        logs = buckets[0]
+        self.assertEqual([obj['Key'] for obj in logs['objects']],
+                         ["a", "b", "c"])
+        self.assertTrue(logs['objects_truncated'])
+        self.assertEqual(logs['object_count'], 5)
+
+        buckets = self.get_buckets()
+        service.populate_bucket_objects(buckets, keep_objects=True)
+        self.assertEqual(len(buckets[0]['objects']), 5)
+        self.assertFalse(buckets[0]['objects_truncated'])
+
+    def test_list_buckets_fast(self):
+        print("Test: list_buckets_fast merges profiles as list_buckets")
+        service = AwsServiceS3(profile_names=['dev', 'prod'])
+        buckets = service.list_buckets()
+        self.assertEqual(buckets, service.list_buckets_fast())
+        # A bucket listed in both profiles shows up once.
+        self.assertEqual(dict((bucket['Name'], bucket['profile_name'])
+                              for bucket in buckets),
+                         {'empty': ['dev'], 'logs': ['dev', 'prod'],
+                          'prod-data': ['prod']})
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import copy
+import unittest
+from orcalib.secgroup_graph import SecurityGroupGraph
+from orcalib.snapshot import RefreshingSnapshot
+
+
+SECGROUPS = {
+    'sg-web': {'GroupId': 'sg-web', 'GroupName': 'web'},
+    'sg-db': {'GroupId': 'sg-db', 'GroupName': 'db'},
+    'sg-old': {'GroupId': 'sg-old', 'GroupName': 'old'},
+}
+VMS = [{'Instances': [
+    {'InstanceId': 'i-1', 'SecurityGroups': {'sg-web': 'web'}},
+    {'InstanceId': 'i-2', 'SecurityGroups': {'sg-web': 'web',
+                                             'sg-db': 'db'}}]}]
+ELBS = [{'LoadBalancerName': 'front', 'SecurityGroups': ['sg-web']}]
+NW_INTERFACES = [{'NetworkInterfaceId': 'eni-1',
+                  'Groups': [{'GroupId': 'sg-db', 'GroupName': 'db'}]}]
+
+
+class SecurityGroupGraphUt(unittest.TestCase):
+    def test_graph(self):
+        print("Test: security group consumers")
+        snapshot = copy.deepcopy(SECGROUPS)
+        graph = SecurityGroupGraph(SECGROUPS, vms=VMS, elbs=ELBS,
+                                   nw_interfaces=NW_INTERFACES)
+
+        self.assertEqual(graph.get_unused_groups(), ['sg-old'])
+        self.assertEqual(graph.get_consumers('sg-web'),
+                         {'vm_list': ['i-1', 'i-2'], 'elb_list': ['front'],
+                          'nwintf_list': []})
+        self.assertEqual(graph.get_consumers('sg-old')['vm_list'], [])
+        self.assertEqual(sorted(graph.get_instance_groups('i-2')),
+                         ['sg-db', 'sg-web'])
+        self.assertEqual(graph.get_instance_groups('i-9'), None)
+
+        view = graph.get_group_view(['sg-db', 'sg-old'])
+        self.assertEqual(view['sg-db']['vm_list'], ['i-2'])
+        self.assertEqual(view['sg-db']['nwintf_list'], ['eni-1'])
+        self.assertFalse('vm_list' in view['sg-old'])
+        self.assertEqual(SECGROUPS, snapshot)
+
+    def test_equal(self):
+        print("Test: graphs of the same resources are equal")
+        graph = SecurityGroupGraph(SECGROUPS, vms=VMS, elbs=ELBS)
+        self.assertEqual(graph, SecurityGroupGraph(copy.deepcopy(SECGROUPS),
+                                                   vms=copy.deepcopy(VMS),
+                                                   elbs=ELBS))
+        self.assertNotEqual(graph, SecurityGroupGraph(SECGROUPS, vms=VMS))
+
+        # An unchanged reload keeps the snapshot version.
+        elbs = [ELBS]
+        snapshot = RefreshingSnapshot(
+            'secgroup_graph',
+            lambda: SecurityGroupGraph(SECGROUPS, vms=VMS, elbs=elbs[0]))
+        snapshot.refresh()
+        snapshot.refresh()
+        self.assertEqual(snapshot.state.version, 1)
+        elbs[0] = []
+        snapshot.refresh()
+        self.assertEqual(snapshot.state.version, 2)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import threading
+import time
+import unittest
+from orcalib.singleflight import SingleFlight
+
+
+class SingleFlightUt(unittest.TestCase):
+    def test_do(self):
+        print("Test: concurrent calls share one computation")
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def sweep(profile):
+            calls.append(profile)
+            time.sleep(0.1)
+            return "groups:%s" % profile
+
+        def request():
+            results.append(flight.do(('groups', 'dev'), sweep, 'dev'))
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, ['dev'])
+        self.assertEqual(results, ["groups:dev"] * 5)
+        self.assertFalse(flight.in_flight(('groups', 'dev')))
+
+        # Once done, the next call computes again.
+        flight.do(('groups', 'dev'), sweep, 'dev')
+        self.assertEqual(len(calls), 2)
+
+    def test_do_error(self):
+        print("Test: errors are raised to every caller")
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        self.assertRaises(ValueError, flight.do, 'key', fail)
+
+    def test_stream(self):
+        print("Test: concurrent streams share one producer")
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def sweep():
+            calls.append(1)
+            yield 'us-east-1'
+            release.wait(5)
+            yield 'us-west-2'
+
+        first = flight.stream('resources', sweep)
+        self.assertEqual(next(first), 'us-east-1')
+        # A follower gets the items already produced, then the next ones.
+        second = flight.stream('resources', sweep)
+        self.assertEqual(next(second), 'us-east-1')
+        self.assertTrue(flight.in_flight('resources'))
+        release.set()
+        self.assertEqual(list(first), ['us-west-2'])
+        self.assertEqual(list(second), ['us-west-2'])
+        self.assertEqual(len(calls), 1)
+
+        deadline = time.time() + 5
+        while flight.in_flight('resources') and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(list(flight.stream('resources', sweep)),
+                         ['us-east-1', 'us-west-2'])
+        self.assertEqual(len(calls), 2)
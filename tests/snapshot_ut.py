@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import time
+import unittest
+from orcalib.snapshot import RefreshingSnapshot
+
+
+class SnapshotUt(unittest.TestCase):
+    def test_refresh(self):
+        print("Test: snapshot refreshed in the background")
+        calls = []
+
+        def loader():
+            calls.append(1)
+            if len(calls) == 2:
+                raise ValueError("throttled")
+            return min(len(calls), 3)
+
+        snapshot = RefreshingSnapshot('test', loader, interval=0.05)
+        try:
+            state = snapshot.get(timeout=5)
+            self.assertEqual(state.value, 1)
+            self.assertEqual(state.version, 1)
+            self.assertTrue(snapshot.age >= 0)
+
+            # The failed second load keeps the first value.
+            deadline = time.time() + 5
+            while snapshot.get().version < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            state = snapshot.get()
+            self.assertEqual(state.value, 3)
+            self.assertEqual(state.version, 2)
+
+            # Reloading the same value only updates the load time.
+            while snapshot.get().timestamp == state.timestamp and \
+                    time.time() < deadline:
+                time.sleep(0.01)
+            newstate = snapshot.get()
+            self.assertEqual(newstate.version, 2)
+            self.assertEqual(newstate.modified, state.modified)
+            self.assertTrue(newstate.timestamp > state.timestamp)
+        finally:
+            snapshot.stop()
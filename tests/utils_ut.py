@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import copy
+import unittest
+import orcalib.utils as orcautils
+
+
+BUCKETS = [
+    {'Name': 'web-logs', 'profile_name': ['dev'], 'object_count': 10,
+     'TagSet': {'Project': 'ICE', 'a.b': 'dotted'}, 'versioned': True},
+    {'Name': 'db-backup', 'profile_name': ['prod', 'dev'],
+     'object_count': 5000, 'TagSet': {'Project': 'Orca'}},
+    {'Name': 'scratch', 'profile_name': ['prod'], 'object_count': 0,
+     'Grants': [{'Permission': 'READ'}, {'Permission': 'WRITE'}]},
+]
+
+
+def names(buckets):
+    return [bucket['Name'] for bucket in buckets]
+
+
+class UtilsUt(unittest.TestCase):
+    def test_filter_list(self):
+        print("Test: filter_list semantics")
+        filters = [{'Name': 'Name', 'Values': ['scratch', 'web-logs']}]
+        self.assertEqual(names(orcautils.filter_list(BUCKETS, filters)),
+                         ['web-logs', 'scratch'])
+
+        # Lists match on any element, OR/AND aggregation.
+        filters = [{'Name': 'profile_name', 'Values': ['dev']},
+                   {'Name': 'object_count', 'Values': [100], 'check': 'gt'}]
+        self.assertEqual(names(orcautils.filter_list(BUCKETS, filters)),
+                         ['web-logs', 'db-backup'])
+        self.assertEqual(names(orcautils.filter_list(BUCKETS, filters,
+                                                     aggr_and=True)),
+                         ['db-backup'])
+
+        # Dotted keys, ':' for a literal '.', and regexes.
+        filters = [{'Name': 'TagSet.Project', 'Values': ['O.*'],
+                    'regex': 'true'}]
+        self.assertEqual(names(orcautils.filter_list(BUCKETS, filters)),
+                         ['db-backup'])
+        filters = [{'Name': 'TagSet.a:b', 'Values': ['dotted']}]
+        self.assertEqual(names(orcautils.filter_list(BUCKETS, filters)),
+                         ['web-logs'])
+
+        # A list of dicts matches a dict in the Values.
+        filters = [{'Name': 'Grants', 'Values': [{'Permission': 'WRITE'}]}]
+        self.assertEqual(names(orcautils.filter_list(BUCKETS, filters)),
+                         ['scratch'])
+
+        # Exact type checks, a bool is not an int.
+        filters = [{'Name': 'versioned', 'Values': [True, 1]}]
+        self.assertEqual(orcautils.filter_list(BUCKETS, filters), [])
+
+        # No filters match nothing, with AND or OR aggregation.
+        self.assertEqual(orcautils.filter_list(BUCKETS, []), [])
+        self.assertEqual(orcautils.filter_list(BUCKETS, [], aggr_and=True),
+                         [])
+        self.assertEqual(orcautils.filter_dict({'a': BUCKETS[0]}, [],
+                                               aggr_and=True), {})
+
+        self.assertEqual(orcautils.filter_list(BUCKETS, None), None)
+        self.assertEqual(orcautils.filter_list(
+            BUCKETS, [{'Name': 'Name', 'Values': 'scratch'}]), None)
+
+    def test_compile_filters(self):
+        print("Test: compiled filters are reusable")
+        predicates = orcautils.compile_filters(
+            [{'Name': 'object_count', 'Values': [1], 'check': 'lt'}])
+        matched = [bucket for bucket in BUCKETS
+                   if orcautils.match_filters(predicates, bucket)]
+        self.assertEqual(names(matched), ['scratch'])
+
+        get_project = orcautils.compile_key_path('TagSet.Project')
+        self.assertEqual([get_project(bucket) for bucket in BUCKETS[:2]],
+                         ['ICE', 'Orca'])
+
+    def test_filter_dict(self):
+        print("Test: filter_dict does not modify the resources")
+        resources = dict((bucket['Name'], bucket) for bucket in BUCKETS)
+        snapshot = copy.deepcopy(resources)
+        filters = [{'Name': 'profile_name', 'Values': ['prod']},
+                   {'Name': 'object_count', 'Values': [1], 'check': 'gt'}]
+
+        filtered = orcautils.filter_dict(resources, filters, aggr_and=True)
+        self.assertEqual(list(filtered.keys()), ['db-backup'])
+        self.assertTrue(filtered['db-backup'] is resources['db-backup'])
+        self.assertEqual(orcautils.filter_dict_ids(resources, filters),
+                         ['web-logs', 'db-backup', 'scratch'])
+        self.assertEqual(orcautils.filter_list_ids(BUCKETS, filters,
+                                                   aggr_and=True), [1])
+        self.assertEqual(resources, snapshot)